@@ -1,94 +1,413 @@
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import plotly.graph_objects as go
-from ta.momentum import RSIIndicator
-from ta.trend import EMAIndicator
-from ta.volume import VolumeWeightedAveragePrice
+from collections.abc import Mapping
+from numpy.lib.stride_tricks import sliding_window_view
 from config import RSI_PERIOD, RSI_OVERBOUGHT, RSI_OVERSOLD, PREMIUM_ZONE, DISCOUNT_ZONE, EQUILIBRIUM_LEVEL
 
+# Коды типов структур для компактного хранения в массивах
+STRUCTURE_TYPES = ('swing_high', 'swing_low', 'ob_buy', 'ob_sell', 'eqh', 'eql', 'bos_up', 'bos_down',
+                   'sc_up', 'sc_down', 'wick_up', 'wick_down', 'sfp_top', 'sfp_bottom', 'poi')
+TYPE_CODES = {name: code for code, name in enumerate(STRUCTURE_TYPES)}
+
+# Запись структуры: индекс свечи, цена уровня (для зон - середина), код типа и индекс свечи,
+# после закрытия которой структура может быть обнаружена (например, swing точке нужны свечи справа)
+STRUCTURE_DTYPE = np.dtype([('index', np.int64), ('price', np.float64), ('type', np.uint8), ('known', np.int64)])
+
+# Структуры-зоны, для которых наружу отдаются границы price_high/price_low
+ZONE_STRUCTURES = ('ob_buy', 'ob_sell', 'poi')
+
+def _strict_extrema(values, window, compare):
+    """
+    Находит индексы строгих локальных экстремумов
+
+    Args:
+        values (np.ndarray): Массив значений (high или low)
+        window (int): Количество соседних свечей с каждой стороны
+        compare (np.ufunc): np.greater для максимумов, np.less для минимумов
+
+    Returns:
+        np.ndarray: Индексы свечей, строго превосходящих всех соседей в окне
+    """
+    if len(values) < 2 * window + 1:
+        return np.empty(0, dtype=np.int64)
+
+    windows = sliding_window_view(values, 2 * window + 1)
+    center = windows[:, window]
+    # Крайнее значение среди соседей слева и справа от центра
+    reduce = np.maximum if compare is np.greater else np.minimum
+    neighbours = reduce(reduce.reduce(windows[:, :window], axis=1),
+                        reduce.reduce(windows[:, window + 1:], axis=1))
+
+    return np.flatnonzero(compare(center, neighbours)) + window
+
+def _order_block_indices(opens, closes, bullish, bearish, num_candles):
+    """
+    Находит индексы Order Blocks по массивам цен
+
+    Args:
+        opens (np.ndarray): Цены открытия
+        closes (np.ndarray): Цены закрытия
+        bullish (np.ndarray): Маска бычьих свечей
+        bearish (np.ndarray): Маска медвежьих свечей
+        num_candles (int): Количество свечей для анализа перед импульсным движением
+
+    Returns:
+        tuple: Для бычьих и медвежьих OB - пара из индексов OB и индексов
+            подтверждающих их импульсных свечей (np.ndarray, np.ndarray)
+    """
+    n = len(opens)
+    if n < num_candles + 2:
+        empty = np.empty(0, dtype=np.int64)
+        return (empty, empty), (empty, empty)
+
+    positions = np.arange(n)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        impulse_up = bullish & ((closes - opens) / opens > 0.01)
+        impulse_down = bearish & ((opens - closes) / opens > 0.01)
+
+    # i - последняя свеча перед импульсной свечой i+1
+    i = np.arange(num_candles, n - 1)
+    result = []
+    for impulse, opposite in ((impulse_up, bearish), (impulse_down, bullish)):
+        # Ближайшая противоположная свеча не позже i (или -1, если ее нет)
+        last_opposite = np.maximum.accumulate(np.where(opposite, positions, -1))
+        found = impulse[i + 1] & (last_opposite[i] > i - num_candles)
+        result.append((last_opposite[i[found]], i[found] + 1))
+
+    return result[0], result[1]
+
+def _structure_indices(structures, struct_type=None):
+    """
+    Собирает отсортированные индексы структур и индексы свечей их подтверждения
+
+    Args:
+        structures (list): Список структур с ключами 'index' и 'confirmed_index'
+        struct_type (str, optional): Тип структур для отбора
+
+    Returns:
+        tuple: Отсортированные индексы и индексы подтверждения в том же порядке (np.ndarray, np.ndarray)
+    """
+    selected = sorted((s['index'], s['confirmed_index']) for s in structures
+                      if struct_type is None or s['type'] == struct_type)
+    pairs = np.array(selected, dtype=np.int64).reshape(-1, 2)
+    return pairs[:, 0], pairs[:, 1]
+
+def _earliest_nearby(sorted_indices, known, targets, tol):
+    """
+    Находит для каждого целевого индекса структуры рядом с ним и самую раннюю свечу их подтверждения
+
+    Args:
+        sorted_indices (np.ndarray): Отсортированные индексы структур
+        known (np.ndarray): Индексы свечей подтверждения структур в том же порядке
+        targets (np.ndarray): Целевые индексы
+        tol (int): Допустимое расстояние в свечах
+
+    Returns:
+        tuple: Булева маска наличия структуры рядом и индекс самой ранней свечи
+            подтверждения (-1, если структур рядом нет)
+    """
+    # Структуры в окне [target - tol, target + tol]
+    lo = np.searchsorted(sorted_indices, targets - tol, side='left')
+    hi = np.searchsorted(sorted_indices, targets + tol, side='right')
+    earliest = np.array([known[a:b].min() if a < b else -1 for a, b in zip(lo.tolist(), hi.tolist())],
+                        dtype=np.int64)
+    return hi > lo, earliest
+
+def _confirm_setups(own_known, required, alternatives):
+    """
+    Объединяет условия подтверждения сетапов и находит свечу, на которой они выполнены
+
+    Args:
+        own_known (np.ndarray): Индексы свечей подтверждения самих структур сетапов
+        required (tuple): Результат _earliest_nearby для обязательного условия
+        alternatives (list): Результаты _earliest_nearby для условий, из которых
+            достаточно одного
+
+    Returns:
+        tuple: Булева маска подтвержденных сетапов и индексы свечей подтверждения
+    """
+    alt_found = np.any([found for found, _ in alternatives], axis=0)
+    alt_known = np.min([np.where(found, known, np.iinfo(np.int64).max) for found, known in alternatives], axis=0)
+    return required[0] & alt_found, np.maximum.reduce([own_known, required[1], alt_known])
+
+def _failed_breakouts(values, closes, swing_idx, swing_price, compare, lookahead):
+    """
+    Находит первые свечи, пробившие уровень swing точки с закрытием обратно за уровнем
+
+    Args:
+        values (np.ndarray): Максимумы (для вершин) или минимумы (для впадин)
+        closes (np.ndarray): Цены закрытия
+        swing_idx (np.ndarray): Индексы swing точек
+        swing_price (np.ndarray): Цены swing точек
+        compare (np.ufunc): np.greater для вершин, np.less для впадин
+        lookahead (int): Количество свечей после swing точки для поиска
+
+    Returns:
+        tuple: Индексы найденных свечей SFP и маска swing точек, для которых они найдены
+    """
+    # Дополняем ряды NaN, чтобы окна у конца данных имели одинаковую длину
+    pad = np.full(lookahead, np.nan)
+    offsets = swing_idx[:, None] + 1 + np.arange(lookahead)
+    window = np.concatenate((values, pad))[offsets]
+    window_close = np.concatenate((closes, pad))[offsets]
+
+    level = swing_price[:, None]
+    breach = compare(window, level) & compare(level, window_close)
+    found = breach.any(axis=1)
+    return offsets[found, breach[found].argmax(axis=1)], found
+
+class _StructureViews(Mapping):
+    """
+    Структуры в виде списков словарей, которые строятся из массивов при первом обращении
+
+    Списки, к которым не обращаются (например, при бэктесте), не создаются вовсе.
+    """
+    def __init__(self, struct_types, build):
+        """
+        Args:
+            struct_types (tuple): Ключи словаря структур
+            build (callable): Функция, строящая список словарей по ключу
+        """
+        self._struct_types = struct_types
+        self._build = build
+        self._lists = {}
+
+    def __getitem__(self, struct_type):
+        if struct_type not in self._lists:
+            if struct_type not in self._struct_types:
+                raise KeyError(struct_type)
+            self._lists[struct_type] = self._build(struct_type)
+        return self._lists[struct_type]
+
+    def __iter__(self):
+        return iter(self._struct_types)
+
+    def __len__(self):
+        return len(self._struct_types)
+
+    def __repr__(self):
+        return repr(dict(self))
+
 class TechnicalAnalysis:
-    def __init__(self, df):
+    def __init__(self, df, inplace=False):
         """
         Инициализирует объект для технического анализа
         
         Args:
             df (pd.DataFrame): DataFrame с OHLCV данными
+            inplace (bool): Добавлять индикаторы прямо в переданный DataFrame без копирования
         """
-        self.df = df.copy()
+        self.df = df
         # Добавляем технические индикаторы
-        self._add_indicators()
+        self._add_indicators(inplace)
     
-    def _add_indicators(self):
-        """Добавляет технические индикаторы в DataFrame"""
-        # RSI
-        rsi = RSIIndicator(close=self.df['close'], window=RSI_PERIOD)
-        self.df['rsi'] = rsi.rsi()
-        
-        # EMA
-        ema20 = EMAIndicator(close=self.df['close'], window=20)
-        ema50 = EMAIndicator(close=self.df['close'], window=50)
-        ema200 = EMAIndicator(close=self.df['close'], window=200)
-        
-        self.df['ema20'] = ema20.ema_indicator()
-        self.df['ema50'] = ema50.ema_indicator()
-        self.df['ema200'] = ema200.ema_indicator()
-        
-        # Добавляем процентное изменение
-        self.df['change_pct'] = self.df['close'].pct_change() * 100
+    def _add_indicators(self, inplace=False):
+        """
+        Добавляет технические индикаторы в DataFrame
         
-        # Добавляем свечные диапазоны
-        self.df['body_size'] = abs(self.df['close'] - self.df['open'])
-        self.df['upper_wick'] = self.df['high'] - self.df[['open', 'close']].max(axis=1)
-        self.df['lower_wick'] = self.df[['open', 'close']].min(axis=1) - self.df['low']
-        self.df['candle_range'] = self.df['high'] - self.df['low']
+        Индикаторы считаются по массивам NumPy и добавляются к DataFrame одной
+        операцией, а не отдельной вставкой каждого столбца.
         
-        # Индикаторы для определения тренда
-        self.df['trend'] = np.where(self.df['ema20'] > self.df['ema50'], 1, 
-                            np.where(self.df['ema20'] < self.df['ema50'], -1, 0))
+        Args:
+            inplace (bool): Добавлять столбцы в исходный DataFrame вместо нового
+        """
+        close = self.df['close']
+        o = self.df['open'].to_numpy()
+        h = self.df['high'].to_numpy()
+        l = self.df['low'].to_numpy()
+        c = close.to_numpy()
+
+        # RSI (сглаживание Уайлдера): средние роста и падения считаются за один проход ewm
+        diff = close.diff()
+        moves = pd.DataFrame({
+            'up': diff.where(diff > 0, 0.0),
+            'down': -diff.where(diff < 0, 0.0)
+        })
+        avg = moves.ewm(alpha=1 / RSI_PERIOD, min_periods=RSI_PERIOD, adjust=False).mean().to_numpy()
+        avg_up, avg_down = avg[:, 0], avg[:, 1]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rsi = np.where(avg_down == 0, 100, 100 - 100 / (1 + avg_up / avg_down))
+
+        # EMA
+        ema = {window: close.ewm(span=window, min_periods=window, adjust=False).mean().to_numpy()
+               for window in (20, 50, 200)}
+
+        # Индикаторам хватает точности float32; цены OHLC остаются float64
+        indicators = {
+            'rsi': rsi,
+            'ema20': ema[20],
+            'ema50': ema[50],
+            'ema200': ema[200],
+            # Процентное изменение
+            'change_pct': close.pct_change().to_numpy() * 100,
+            # Свечные диапазоны
+            'body_size': np.abs(c - o),
+            'upper_wick': h - np.maximum(o, c),
+            'lower_wick': np.minimum(o, c) - l,
+            'candle_range': h - l
+        }
+        indicators = {column: values.astype(np.float32) for column, values in indicators.items()}
+
+        # Индикаторы для определения тренда (NaN в начале ряда дает боковой тренд)
+        indicators['trend'] = np.sign(np.nan_to_num(ema[20] - ema[50])).astype(np.int8)
+
+        # Маски зон перекупленности/перепроданности RSI
+        indicators['rsi_ob'] = indicators['rsi'] > RSI_OVERBOUGHT
+        indicators['rsi_os'] = indicators['rsi'] < RSI_OVERSOLD
+
+        indicators = pd.DataFrame(indicators, index=self.df.index)
+        if inplace:
+            self.df[indicators.columns] = indicators
+        else:
+            self.df = pd.concat([self.df, indicators], axis=1)
 
 class SmartMoneyAnalysis:
-    def __init__(self, df):
+    def __init__(self, df, causal=False):
         """
         Инициализирует объект для анализа по концепции Smart Money
         
         Args:
             df (pd.DataFrame): DataFrame с OHLCV данными и техническими индикаторами
+            causal (bool): Считать пороги SC и Wicks по средним только уже закрытых свечей,
+                а не по всей истории (для бэктеста, где история известна заранее)
         """
-        self.df = df.copy()
-        # Создаем копию для идентификации структур
-        self.structures_df = self.df.copy()
-        
-        # Инициализируем структуры для анализа
-        self.structures = {
-            'swing_highs': [],
-            'swing_lows': [],
-            'ob_buy': [],  # Order Blocks (покупки)
-            'ob_sell': [],  # Order Blocks (продажи)
-            'eqh': [],  # Equal Highs
-            'eql': [],  # Equal Lows
-            'bos': [],  # Break of Structure
-            'bms': [],  # Break of Market Structure
-            'sc': [],  # Sponsored Candles
-            'wick': [],  # Wicks
-            'sfp': [],  # Swing Failure Pattern
-            'poi': []   # Points of Interest
-        }
+        # DataFrame только читается, поэтому копия не нужна
+        self.df = df
+        self._causal = causal
+
+        # Колонки как массивы NumPy: поэлементный доступ без накладных расходов .iloc
+        self._index = self.df.index
+        self._open = self.df['open'].to_numpy()
+        self._high = self.df['high'].to_numpy()
+        self._low = self.df['low'].to_numpy()
+        self._close = self.df['close'].to_numpy()
+        self._candle_range = self.df['candle_range'].to_numpy()
+        self._upper_wick = self.df['upper_wick'].to_numpy()
+        self._lower_wick = self.df['lower_wick'].to_numpy()
+        self._trend = self.df['trend'].to_numpy()
+        self._rsi = self.df['rsi'].to_numpy()
+        self._rsi_ob = self.df['rsi_ob'].to_numpy()
+        self._rsi_os = self.df['rsi_os'].to_numpy()
+        
+        # Структуры для анализа в виде массивов STRUCTURE_DTYPE для векторных проходов
+        struct_types = (
+            'swing_highs',
+            'swing_lows',
+            'ob_buy',  # Order Blocks (покупки)
+            'ob_sell',  # Order Blocks (продажи)
+            'eqh',  # Equal Highs
+            'eql',  # Equal Lows
+            'bos',  # Break of Structure
+            'bms',  # Break of Market Structure
+            'sc',  # Sponsored Candles
+            'wick',  # Wicks
+            'sfp',  # Swing Failure Pattern
+            'poi'   # Points of Interest
+        )
+        self._arrays = {struct_type: np.empty(0, dtype=STRUCTURE_DTYPE) for struct_type in struct_types}
+        # Типы структур, составляющих каждую POI
+        self._poi_structures = []
+        # Внешнее представление - списки словарей, создаются при первом обращении
+        self.structures = _StructureViews(struct_types, self._structure_list)
         
         # Находим структурные точки
         self._find_structures()
     
     def _find_structures(self):
         """Находит все структуры для Smart Money анализа"""
+        # Общие для детекторов величины считаются один раз: направление свечей
+        # и средние размеры свечи и фитилей (один проход по трем колонкам)
+        self._bullish = self._close > self._open
+        self._bearish = self._close < self._open
+        sizes = self.df[['candle_range', 'upper_wick', 'lower_wick']].to_numpy()
+        if self._causal:
+            # Нарастающие средние: для каждой свечи только по ней и предыдущим свечам
+            with np.errstate(divide='ignore', invalid='ignore'):
+                averages = np.nancumsum(sizes, axis=0) / np.cumsum(~np.isnan(sizes), axis=0)
+        else:
+            averages = np.broadcast_to(np.nanmean(sizes, axis=0), sizes.shape)
+        avg_range, avg_upper_wick, avg_lower_wick = averages.T
+
+        # Этап 1: структуры, которые строятся напрямую по свечам
         self._find_swing_points()
+        self._find_order_blocks()
+        self._find_sponsored_candles(avg_range)
+        self._find_wicks(avg_upper_wick, avg_lower_wick)
+
+        # Этап 2: структуры, зависящие от точек разворота
         self._find_equal_levels()
         self._find_bos_bms()
-        self._find_order_blocks()
-        self._find_sponsored_candles()
-        self._find_wicks()
         self._find_sfp()
+
+        # Этап 3: пересечения всех найденных структур
         self._find_poi()
     
+    def _ts(self, indices):
+        """
+        Преобразует индексы свечей во временные метки
+        
+        Args:
+            indices (int or np.ndarray): Индекс или массив индексов свечей
+            
+        Returns:
+            pd.Timestamp or pd.DatetimeIndex: Временные метки свечей
+        """
+        return self._index[indices]
+
+    def _store_structures(self, struct_type, indices, prices, types, known=None):
+        """
+        Сохраняет найденные структуры в массив
+        
+        Args:
+            struct_type (str): Ключ в словаре структур
+            indices (np.ndarray): Индексы свечей
+            prices (np.ndarray): Цены уровней
+            types (str or np.ndarray): Тип структуры или массив кодов типов
+            known (np.ndarray, optional): Индексы свечей, после которых структуры могут быть
+                обнаружены (по умолчанию - свечи самих структур)
+        """
+        records = np.empty(len(indices), dtype=STRUCTURE_DTYPE)
+        records['index'] = indices
+        records['price'] = prices
+        records['type'] = TYPE_CODES[types] if isinstance(types, str) else types
+        records['known'] = indices if known is None else known
+        self._arrays[struct_type] = records
+
+    def _structure_list(self, struct_type):
+        """
+        Строит внешнее представление структур в виде списка словарей
+        
+        Args:
+            struct_type (str): Ключ в словаре структур
+            
+        Returns:
+            list: Список структур
+        """
+        records = self._arrays[struct_type]
+        # Временные метки нужны только во внешнем представлении и берутся одной выборкой
+        names = [STRUCTURE_TYPES[code] for code in records['type'].tolist()]
+        timestamps = self._ts(records['index'])
+        if struct_type in ZONE_STRUCTURES:
+            structures = [{
+                'index': i,
+                'timestamp': timestamp,
+                'price_high': self._high[i],
+                'price_low': self._low[i],
+                'type': name
+            } for i, timestamp, name in zip(records['index'].tolist(), timestamps, names)]
+        else:
+            structures = [{
+                'index': i,
+                'timestamp': timestamp,
+                'price': price,
+                'type': name
+            } for i, timestamp, price, name in zip(records['index'].tolist(), timestamps, records['price'], names)]
+        
+        if struct_type == 'poi':
+            for structure, composition in zip(structures, self._poi_structures):
+                structure['structures'] = composition
+        return structures
+
     def _find_swing_points(self, window=5):
         """
         Находит точки разворота (swing highs и swing lows)
@@ -96,27 +415,15 @@ class SmartMoneyAnalysis:
         Args:
             window (int): Размер окна для определения точек разворота
         """
-        # Находим swing highs
-        for i in range(window, len(self.df) - window):
-            if all(self.df['high'].iloc[i] > self.df['high'].iloc[i-j] for j in range(1, window+1)) and \
-               all(self.df['high'].iloc[i] > self.df['high'].iloc[i+j] for j in range(1, window+1)):
-                self.structures['swing_highs'].append({
-                    'index': i,
-                    'timestamp': self.df.index[i],
-                    'price': self.df['high'].iloc[i],
-                    'type': 'swing_high'
-                })
-        
+        # Находим swing highs (точка известна, когда закрылись window свечей справа от нее)
+        swing_high_idx = _strict_extrema(self._high, window, np.greater)
+        self._store_structures('swing_highs', swing_high_idx, self._high[swing_high_idx], 'swing_high',
+                               swing_high_idx + window)
+
         # Находим swing lows
-        for i in range(window, len(self.df) - window):
-            if all(self.df['low'].iloc[i] < self.df['low'].iloc[i-j] for j in range(1, window+1)) and \
-               all(self.df['low'].iloc[i] < self.df['low'].iloc[i+j] for j in range(1, window+1)):
-                self.structures['swing_lows'].append({
-                    'index': i,
-                    'timestamp': self.df.index[i],
-                    'price': self.df['low'].iloc[i],
-                    'type': 'swing_low'
-                })
+        swing_low_idx = _strict_extrema(self._low, window, np.less)
+        self._store_structures('swing_lows', swing_low_idx, self._low[swing_low_idx], 'swing_low',
+                               swing_low_idx + window)
 
     def _find_equal_levels(self, tolerance=0.001):
         """
@@ -125,67 +432,47 @@ class SmartMoneyAnalysis:
         Args:
             tolerance (float): Допустимая погрешность для определения равных уровней
         """
-        # Находим Equal Highs (EQH)
-        for i in range(1, len(self.structures['swing_highs'])):
-            current = self.structures['swing_highs'][i]['price']
-            previous = self.structures['swing_highs'][i-1]['price']
-            
-            if abs(current - previous) / previous < tolerance:
-                self.structures['eqh'].append({
-                    'index': self.structures['swing_highs'][i]['index'],
-                    'timestamp': self.structures['swing_highs'][i]['timestamp'],
-                    'price': current,
-                    'type': 'eqh'
-                })
-        
-        # Находим Equal Lows (EQL)
-        for i in range(1, len(self.structures['swing_lows'])):
-            current = self.structures['swing_lows'][i]['price']
-            previous = self.structures['swing_lows'][i-1]['price']
-            
-            if abs(current - previous) / previous < tolerance:
-                self.structures['eql'].append({
-                    'index': self.structures['swing_lows'][i]['index'],
-                    'timestamp': self.structures['swing_lows'][i]['timestamp'],
-                    'price': current,
-                    'type': 'eql'
-                })
+        for struct_type, swing_type in (('eqh', 'swing_highs'), ('eql', 'swing_lows')):
+            swings = self._arrays[swing_type]
+            # Относительная разница цен соседних точек разворота
+            prices = swings['price']
+            rel = np.abs(np.diff(prices)) / prices[:-1]
+            equal = swings[1:][rel < tolerance]
+            self._store_structures(struct_type, equal['index'], equal['price'], struct_type, equal['known'])
 
     def _find_bos_bms(self):
         """Находит Break of Structure (BOS) и Break of Market Structure (BMS)"""
-        # Проходим по swing highs и ищем пробои структуры вниз
-        for i in range(1, len(self.structures['swing_highs'])):
-            current_high = self.structures['swing_highs'][i]['price']
-            previous_high = self.structures['swing_highs'][i-1]['price']
-            
-            if current_high < previous_high:
-                # Ищем подтверждение BMS
-                for j in range(self.structures['swing_highs'][i]['index'] + 1, len(self.df)):
-                    if self.df['high'].iloc[j] < self.structures['swing_highs'][i]['price']:
-                        self.structures['bos'].append({
-                            'index': j,
-                            'timestamp': self.df.index[j],
-                            'price': self.df['high'].iloc[j],
-                            'type': 'bos_down'
-                        })
-                        break
-        
-        # Проходим по swing lows и ищем пробои структуры вверх
-        for i in range(1, len(self.structures['swing_lows'])):
-            current_low = self.structures['swing_lows'][i]['price']
-            previous_low = self.structures['swing_lows'][i-1]['price']
-            
-            if current_low > previous_low:
-                # Ищем подтверждение BMS
-                for j in range(self.structures['swing_lows'][i]['index'] + 1, len(self.df)):
-                    if self.df['low'].iloc[j] > self.structures['swing_lows'][i]['price']:
-                        self.structures['bos'].append({
-                            'index': j,
-                            'timestamp': self.df.index[j],
-                            'price': self.df['low'].iloc[j],
-                            'type': 'bos_up'
-                        })
-                        break
+        bos_idx = []
+        bos_price = []
+        bos_types = []
+        bos_known = []
+
+        # Понижающиеся swing highs ищут пробой структуры вниз, повышающиеся swing lows - вверх
+        for values, swing_type, compare, bos_type in (
+                (self._high, 'swing_highs', np.less, 'bos_down'),
+                (self._low, 'swing_lows', np.greater, 'bos_up')):
+            swing_idx = self._arrays[swing_type]['index']
+            swing_price = self._arrays[swing_type]['price']
+            swing_known = self._arrays[swing_type]['known']
+            candidates = np.flatnonzero(compare(swing_price[1:], swing_price[:-1])) + 1
+
+            for k in candidates.tolist():
+                # Ищем подтверждение BMS: первую свечу после swing, пробившую его уровень
+                start = swing_idx[k] + 1
+                breaks = compare(values[start:], swing_price[k])
+                if not breaks.any():
+                    continue
+
+                j = int(start + breaks.argmax())
+                bos_idx.append(j)
+                bos_price.append(values[j])
+                bos_types.append(TYPE_CODES[bos_type])
+                # Пробой можно распознать не раньше, чем подтвердится сама swing точка
+                bos_known.append(max(j, int(swing_known[k])))
+
+        self._store_structures('bos', np.array(bos_idx, dtype=np.int64),
+                               np.array(bos_price, dtype=np.float64), np.array(bos_types, dtype=np.uint8),
+                               np.array(bos_known, dtype=np.int64))
 
     def _find_order_blocks(self, num_candles=5):
         """
@@ -194,299 +481,331 @@ class SmartMoneyAnalysis:
         Args:
             num_candles (int): Количество свечей для анализа перед импульсным движением
         """
-        # Проходим по DataFrame и ищем импульсные движения
-        for i in range(num_candles, len(self.df)-1):
-            # Находим бычьи OB (сильное движение вверх после)
-            if self.df['close'].iloc[i+1] > self.df['open'].iloc[i+1] and \
-               (self.df['close'].iloc[i+1] - self.df['open'].iloc[i+1]) / self.df['open'].iloc[i+1] > 0.01:
-                # Ищем свечу продавца перед импульсом
-                for j in range(i, i-num_candles, -1):
-                    if self.df['close'].iloc[j] < self.df['open'].iloc[j]:  # Медвежья свеча
-                        self.structures['ob_buy'].append({
-                            'index': j,
-                            'timestamp': self.df.index[j],
-                            'price_high': self.df['high'].iloc[j],
-                            'price_low': self.df['low'].iloc[j],
-                            'type': 'ob_buy'
-                        })
-                        break
-            
-            # Находим медвежьи OB (сильное движение вниз после)
-            if self.df['close'].iloc[i+1] < self.df['open'].iloc[i+1] and \
-               (self.df['open'].iloc[i+1] - self.df['close'].iloc[i+1]) / self.df['open'].iloc[i+1] > 0.01:
-                # Ищем свечу покупателя перед импульсом
-                for j in range(i, i-num_candles, -1):
-                    if self.df['close'].iloc[j] > self.df['open'].iloc[j]:  # Бычья свеча
-                        self.structures['ob_sell'].append({
-                            'index': j,
-                            'timestamp': self.df.index[j],
-                            'price_high': self.df['high'].iloc[j],
-                            'price_low': self.df['low'].iloc[j],
-                            'type': 'ob_sell'
-                        })
-                        break
-
-    def _find_sponsored_candles(self, threshold=1.5):
+        ob_buy, ob_sell = _order_block_indices(self._open, self._close, self._bullish, self._bearish, num_candles)
+
+        # Бычьи OB - медвежья свеча перед сильным движением вверх,
+        # медвежьи OB - бычья свеча перед сильным движением вниз (известны после импульсной свечи)
+        for struct_type, (indices, known) in (('ob_buy', ob_buy), ('ob_sell', ob_sell)):
+            self._store_structures(struct_type, indices,
+                                   (self._high[indices] + self._low[indices]) / 2, struct_type, known)
+
+        # Уровни поддержки/сопротивления: swing точки и середины OB
+        self._support_pool = np.concatenate((self._arrays['swing_lows']['price'], self._arrays['ob_buy']['price']))
+        self._resistance_pool = np.concatenate((self._arrays['swing_highs']['price'], self._arrays['ob_sell']['price']))
+
+    def _find_sponsored_candles(self, avg_range, threshold=1.5):
         """
         Находит Sponsored Candles (SC)
         
         Args:
+            avg_range (np.ndarray): Средний размер свечи для каждой свечи
             threshold (float): Пороговое значение для определения спонсированных свечей
         """
-        # Вычисляем средний размер свечи
-        avg_range = self.df['candle_range'].mean()
-        
-        for i in range(1, len(self.df)-1):
-            # Проверяем большой размер свечи
-            if self.df['candle_range'].iloc[i] > avg_range * threshold:
-                # Бычья спонсированная свеча
-                if self.df['close'].iloc[i] > self.df['open'].iloc[i] and \
-                   self.df['close'].iloc[i+1] > self.df['high'].iloc[i]:
-                    self.structures['sc'].append({
-                        'index': i,
-                        'timestamp': self.df.index[i],
-                        'price': self.df['high'].iloc[i],
-                        'type': 'sc_up'
-                    })
-                
-                # Медвежья спонсированная свеча
-                elif self.df['close'].iloc[i] < self.df['open'].iloc[i] and \
-                     self.df['close'].iloc[i+1] < self.df['low'].iloc[i]:
-                    self.structures['sc'].append({
-                        'index': i,
-                        'timestamp': self.df.index[i],
-                        'price': self.df['low'].iloc[i],
-                        'type': 'sc_down'
-                    })
+        # Свеча i сравнивается с закрытием следующей свечи, поэтому берем 1..n-2
+        h, l = self._high[1:-1], self._low[1:-1]
+        next_close = self._close[2:]
+        big = self._candle_range[1:-1] > avg_range[1:-1] * threshold
+
+        # Бычья спонсированная свеча
+        sc_up = big & self._bullish[1:-1] & (next_close > h)
+        # Медвежья спонсированная свеча
+        sc_down = big & self._bearish[1:-1] & (next_close < l)
+
+        found = np.flatnonzero(sc_up | sc_down)
+        is_up = sc_up[found]
+        self._store_structures('sc', found + 1, np.where(is_up, h[found], l[found]),
+                               np.where(is_up, TYPE_CODES['sc_up'], TYPE_CODES['sc_down']), found + 2)
 
-    def _find_wicks(self, threshold=1.5):
+    def _find_wicks(self, avg_upper_wick, avg_lower_wick, threshold=1.5):
         """
         Находит значимые фитили (Wicks)
         
         Args:
+            avg_upper_wick (np.ndarray): Средний размер верхнего фитиля для каждой свечи
+            avg_lower_wick (np.ndarray): Средний размер нижнего фитиля для каждой свечи
             threshold (float): Пороговое значение для определения значимых фитилей
         """
-        # Вычисляем средние размеры фитилей
-        avg_upper_wick = self.df['upper_wick'].mean()
-        avg_lower_wick = self.df['lower_wick'].mean()
-        
-        for i in range(len(self.df)):
-            # Длинный верхний фитиль
-            if self.df['upper_wick'].iloc[i] > avg_upper_wick * threshold:
-                self.structures['wick'].append({
-                    'index': i,
-                    'timestamp': self.df.index[i],
-                    'price': self.df['high'].iloc[i],
-                    'type': 'wick_up'
-                })
-            
-            # Длинный нижний фитиль
-            if self.df['lower_wick'].iloc[i] > avg_lower_wick * threshold:
-                self.structures['wick'].append({
-                    'index': i,
-                    'timestamp': self.df.index[i],
-                    'price': self.df['low'].iloc[i],
-                    'type': 'wick_down'
-                })
+        wick_up = self._upper_wick > avg_upper_wick * threshold
+        wick_down = self._lower_wick > avg_lower_wick * threshold
 
-    def _find_sfp(self):
-        """Находит Swing Failure Pattern (SFP)"""
-        # SFP на вершинах (пробой swing high с последующим возвратом)
-        for i in range(len(self.structures['swing_highs'])-1):
-            high_idx = self.structures['swing_highs'][i]['index']
-            high_price = self.structures['swing_highs'][i]['price']
-            
-            # Ищем пробой уровня с последующим возвратом
-            for j in range(high_idx+1, min(high_idx+10, len(self.df))):
-                if self.df['high'].iloc[j] > high_price and self.df['close'].iloc[j] < high_price:
-                    self.structures['sfp'].append({
-                        'index': j,
-                        'timestamp': self.df.index[j],
-                        'price': self.df['high'].iloc[j],
-                        'type': 'sfp_top'
-                    })
-                    break
+        # Сохраняем порядок по свечам: сначала верхний фитиль, затем нижний
+        up_idx = np.flatnonzero(wick_up)
+        down_idx = np.flatnonzero(wick_down)
+        order = np.argsort(np.concatenate((2 * up_idx, 2 * down_idx + 1)), kind='stable')
+        is_up = order < len(up_idx)
+        indices = np.concatenate((up_idx, down_idx))[order]
+
+        self._store_structures('wick', indices, np.where(is_up, self._high[indices], self._low[indices]),
+                               np.where(is_up, TYPE_CODES['wick_up'], TYPE_CODES['wick_down']))
+
+    def _find_sfp(self, lookahead=9):
+        """
+        Находит Swing Failure Pattern (SFP)
         
-        # SFP на впадинах (пробой swing low с последующим возвратом)
-        for i in range(len(self.structures['swing_lows'])-1):
-            low_idx = self.structures['swing_lows'][i]['index']
-            low_price = self.structures['swing_lows'][i]['price']
-            
-            # Ищем пробой уровня с последующим возвратом
-            for j in range(low_idx+1, min(low_idx+10, len(self.df))):
-                if self.df['low'].iloc[j] < low_price and self.df['close'].iloc[j] > low_price:
-                    self.structures['sfp'].append({
-                        'index': j,
-                        'timestamp': self.df.index[j],
-                        'price': self.df['low'].iloc[j],
-                        'type': 'sfp_bottom'
-                    })
-                    break
+        Args:
+            lookahead (int): Количество свечей после swing точки для поиска ложного пробоя
+        """
+        # SFP на вершинах (пробой swing high с последующим возвратом)
+        # и на впадинах (пробой swing low с последующим возвратом); последняя swing точка не учитывается,
+        # поэтому SFP известен не раньше, чем подтвердится следующая swing точка того же типа
+        swing_highs = self._arrays['swing_highs']
+        swing_lows = self._arrays['swing_lows']
+        top_idx, top_found = _failed_breakouts(self._high, self._close, swing_highs['index'][:-1],
+                                               swing_highs['price'][:-1], np.greater, lookahead)
+        bottom_idx, bottom_found = _failed_breakouts(self._low, self._close, swing_lows['index'][:-1],
+                                                     swing_lows['price'][:-1], np.less, lookahead)
+        top_known = np.maximum(top_idx, swing_highs['known'][1:][top_found])
+        bottom_known = np.maximum(bottom_idx, swing_lows['known'][1:][bottom_found])
+
+        self._store_structures(
+            'sfp',
+            np.concatenate((top_idx, bottom_idx)),
+            np.concatenate((self._high[top_idx], self._low[bottom_idx])),
+            np.repeat(np.array([TYPE_CODES['sfp_top'], TYPE_CODES['sfp_bottom']], dtype=np.uint8),
+                      [len(top_idx), len(bottom_idx)]),
+            np.concatenate((top_known, bottom_known)))
 
     def _find_poi(self):
         """Находит Points of Interest (POI) - зоны, где пересекаются несколько структур"""
-        # Все индексы с структурами
-        all_structures = []
-        for struct_type in self.structures:
-            if struct_type != 'poi':  # Исключаем сами POI
-                for structure in self.structures[struct_type]:
-                    if 'index' in structure:
-                        all_structures.append({
-                            'index': structure['index'],
-                            'type': structure['type']
-                        })
-        
-        # Индексы со скоплением структур
-        poi_indices = {}
-        for structure in all_structures:
-            idx = structure['index']
-            if idx in poi_indices:
-                poi_indices[idx].append(structure['type'])
-            else:
-                poi_indices[idx] = [structure['type']]
-        
-        # Точки с несколькими структурами считаем POI
-        for idx, types in poi_indices.items():
-            if len(types) >= 2:  # Минимум две структуры
-                self.structures['poi'].append({
-                    'index': idx,
-                    'timestamp': self.df.index[idx],
-                    'price_high': self.df['high'].iloc[idx],
-                    'price_low': self.df['low'].iloc[idx],
-                    'structures': types,
-                    'type': 'poi'
-                })
+        records = np.concatenate([self._arrays[struct_type] for struct_type in self._arrays
+                                  if struct_type != 'poi'])  # Исключаем сами POI
+        if len(records) == 0:
+            return
+
+        # Группируем структуры по индексу свечи, сохраняя исходный порядок внутри группы
+        order = np.argsort(records['index'], kind='stable')
+        grouped = records[order]
+        starts = np.flatnonzero(np.r_[True, grouped['index'][1:] != grouped['index'][:-1]])
+        ends = np.r_[starts[1:], len(grouped)]
+        # POI известна, когда известны все составляющие ее структуры
+        known = np.maximum.reduceat(grouped['known'], starts)
+
+        # Точки с несколькими структурами считаем POI (минимум две структуры),
+        # в порядке первого появления индекса
+        poi = (ends - starts) >= 2
+        starts, ends, known = starts[poi], ends[poi], known[poi]
+        by_appearance = np.argsort(order[starts], kind='stable')
+        starts, ends, known = starts[by_appearance], ends[by_appearance], known[by_appearance]
+
+        indices = grouped['index'][starts]
+        self._store_structures('poi', indices, (self._high[indices] + self._low[indices]) / 2, 'poi', known)
+        codes = grouped['type'].tolist()
+        self._poi_structures = [[STRUCTURE_TYPES[code] for code in codes[start:end]]
+                                for start, end in zip(starts.tolist(), ends.tolist())]
     
+    def _sorted_indices(self, struct_type, type_name=None):
+        """
+        Возвращает отсортированные индексы структур и индексы свечей их подтверждения
+        
+        Args:
+            struct_type (str): Ключ в словаре структур
+            type_name (str, optional): Тип структур для отбора
+            
+        Returns:
+            tuple: Отсортированные индексы и индексы подтверждения в том же порядке (np.ndarray, np.ndarray)
+        """
+        records = self._arrays[struct_type]
+        if type_name is not None:
+            records = records[records['type'] == TYPE_CODES[type_name]]
+        records = np.sort(records, order=('index', 'known'))
+        return records['index'], records['known']
+
     def find_optimal_trade_entry(self):
         """
         Находит Optimal Trade Entry (OTE) зоны на основе анализа структур
         
         Returns:
-            list: Список оптимальных зон для входа в сделку
+            list: Список оптимальных зон для входа в сделку ('confirmed_index' - свеча,
+                после закрытия которой зона может быть обнаружена)
         """
         ote_zones = []
+        key_structures = set(['ob_buy', 'ob_sell', 'eqh', 'eql', 'sfp_top', 'sfp_bottom', 'wick_up', 'wick_down'])
+
+        # Индексы swing точек отсортированы, предыдущая точка находится бинарным поиском
+        swing_lows = self._arrays['swing_lows']
+        swing_highs = self._arrays['swing_highs']
         
-        # Анализируем POI
-        for poi in self.structures['poi']:
+        # Анализируем POI (зона известна, когда подтверждены POI и swing точка для уровней Фибоначчи)
+        for poi, poi_known in zip(self.structures['poi'], self._arrays['poi']['known'].tolist()):
             # Если в POI содержатся ключевые структуры
-            key_structures = set(['ob_buy', 'ob_sell', 'eqh', 'eql', 'sfp_top', 'sfp_bottom', 'wick_up', 'wick_down'])
-            
             if any(s in key_structures for s in poi['structures']):
                 # Анализируем текущий тренд
                 current_idx = poi['index']
-                current_trend = self.df['trend'].iloc[current_idx]
+                current_trend = self._trend[current_idx]
                 
                 # Находим Fibonacci уровни
                 if current_trend > 0:  # Восходящий тренд
                     # Ищем предыдущий swing low
-                    prev_swing_lows = [sl for sl in self.structures['swing_lows'] if sl['index'] < current_idx]
+                    pos = np.searchsorted(swing_lows['index'], current_idx) - 1
                     
-                    if prev_swing_lows:
-                        last_swing_low = prev_swing_lows[-1]
-                        swing_range = poi['price_high'] - last_swing_low['price']
+                    if pos >= 0:
+                        swing_range = poi['price_high'] - swing_lows['price'][pos]
                         
                         # Зона 0.5-0.618 (Premium)
                         premium_zone = {
+                            'index': current_idx,
                             'timestamp': poi['timestamp'],
                             'price_low': poi['price_high'] - swing_range * PREMIUM_ZONE,
                             'price_high': poi['price_high'] - swing_range * EQUILIBRIUM_LEVEL,
-                            'type': 'ote_buy_premium'
+                            'type': 'ote_buy_premium',
+                            'confirmed_index': max(poi_known, int(swing_lows['known'][pos]))
                         }
                         
                         ote_zones.append(premium_zone)
                 
                 else:  # Нисходящий тренд
                     # Ищем предыдущий swing high
-                    prev_swing_highs = [sh for sh in self.structures['swing_highs'] if sh['index'] < current_idx]
+                    pos = np.searchsorted(swing_highs['index'], current_idx) - 1
                     
-                    if prev_swing_highs:
-                        last_swing_high = prev_swing_highs[-1]
-                        swing_range = last_swing_high['price'] - poi['price_low']
+                    if pos >= 0:
+                        swing_range = swing_highs['price'][pos] - poi['price_low']
                         
                         # Зона 0.5-0.618 (Discount)
                         discount_zone = {
+                            'index': current_idx,
                             'timestamp': poi['timestamp'],
                             'price_low': poi['price_low'] + swing_range * EQUILIBRIUM_LEVEL,
                             'price_high': poi['price_low'] + swing_range * DISCOUNT_ZONE,
-                            'type': 'ote_sell_discount'
+                            'type': 'ote_sell_discount',
+                            'confirmed_index': max(poi_known, int(swing_highs['known'][pos]))
                         }
                         
                         ote_zones.append(discount_zone)
         
         return ote_zones
     
-    def find_trade_setups(self):
+    def find_trade_setups(self, ote_zones=None):
         """
         Находит потенциальные торговые сетапы на основе анализа структур
         
+        Args:
+            ote_zones (list, optional): Уже найденные OTE зоны, чтобы не искать их повторно
+        
         Returns:
-            list: Список потенциальных торговых сетапов
+            list: Список потенциальных торговых сетапов ('confirmed_index' - свеча,
+                после закрытия которой сетап может быть обнаружен)
         """
         setups = []
         
         # Находим OTE зоны
-        ote_zones = self.find_optimal_trade_entry()
+        if ote_zones is None:
+            ote_zones = self.find_optimal_trade_entry()
         
         # Находим BOS/BMS
-        for bos in self.structures['bos']:
+        bos_list = self.structures['bos']
+        bos_idx = self._arrays['bos']['index']
+        bos_known = self._arrays['bos']['known']
+
+        # Для каждого BOS векторно проверяем наличие OTE зоны рядом (±5 свечей)
+        # и дополнительных структур OB, SC или WICK (±3 свечи); сетап подтвержден на свече,
+        # к которой известны сам BOS и найденные рядом структуры
+        confirmed_buy, known_buy = _confirm_setups(
+            bos_known,
+            _earliest_nearby(*_structure_indices(ote_zones, 'ote_buy_premium'), bos_idx, 5),
+            [_earliest_nearby(*self._sorted_indices('ob_buy'), bos_idx, 3),
+             _earliest_nearby(*self._sorted_indices('sc', 'sc_up'), bos_idx, 3),
+             _earliest_nearby(*self._sorted_indices('wick', 'wick_down'), bos_idx, 3)])
+        confirmed_sell, known_sell = _confirm_setups(
+            bos_known,
+            _earliest_nearby(*_structure_indices(ote_zones, 'ote_sell_discount'), bos_idx, 5),
+            [_earliest_nearby(*self._sorted_indices('ob_sell'), bos_idx, 3),
+             _earliest_nearby(*self._sorted_indices('sc', 'sc_down'), bos_idx, 3),
+             _earliest_nearby(*self._sorted_indices('wick', 'wick_up'), bos_idx, 3)])
+
+        for bos, is_buy, is_sell, buy_known, sell_known in zip(bos_list, confirmed_buy.tolist(), confirmed_sell.tolist(),
+                                                               known_buy.tolist(), known_sell.tolist()):
             # Для покупки (BOS вверх)
-            if bos['type'] == 'bos_up':
-                # Проверяем наличие OTE зон рядом
-                for ote in ote_zones:
-                    if 'ote_buy' in ote['type'] and bos['index'] - 5 <= ote['timestamp'] <= bos['index'] + 5:
-                        # Проверяем наличие OB, SC или WICK рядом
-                        has_ob = any(ob['index'] - 3 <= bos['index'] <= ob['index'] + 3 for ob in self.structures['ob_buy'])
-                        has_sc = any(sc['index'] - 3 <= bos['index'] <= sc['index'] + 3 for sc in self.structures['sc'] if sc['type'] == 'sc_up')
-                        has_wick = any(w['index'] - 3 <= bos['index'] <= w['index'] + 3 for w in self.structures['wick'] if w['type'] == 'wick_down')
-                        
-                        if has_ob or has_sc or has_wick:
-                            setups.append({
-                                'timestamp': bos['timestamp'],
-                                'price': bos['price'],
-                                'type': 'buy_setup',
-                                'desc': 'BOS вверх с подтверждением OTE и дополнительными структурами'
-                            })
+            if bos['type'] == 'bos_up' and is_buy:
+                setups.append({
+                    'index': bos['index'],
+                    'timestamp': bos['timestamp'],
+                    'price': bos['price'],
+                    'type': 'buy_setup',
+                    'desc': 'BOS вверх с подтверждением OTE и дополнительными структурами',
+                    'confirmed_index': buy_known
+                })
             
             # Для продажи (BOS вниз)
-            elif bos['type'] == 'bos_down':
-                # Проверяем наличие OTE зон рядом
-                for ote in ote_zones:
-                    if 'ote_sell' in ote['type'] and bos['index'] - 5 <= ote['timestamp'] <= bos['index'] + 5:
-                        # Проверяем наличие OB, SC или WICK рядом
-                        has_ob = any(ob['index'] - 3 <= bos['index'] <= ob['index'] + 3 for ob in self.structures['ob_sell'])
-                        has_sc = any(sc['index'] - 3 <= bos['index'] <= sc['index'] + 3 for sc in self.structures['sc'] if sc['type'] == 'sc_down')
-                        has_wick = any(w['index'] - 3 <= bos['index'] <= w['index'] + 3 for w in self.structures['wick'] if w['type'] == 'wick_up')
-                        
-                        if has_ob or has_sc or has_wick:
-                            setups.append({
-                                'timestamp': bos['timestamp'],
-                                'price': bos['price'],
-                                'type': 'sell_setup',
-                                'desc': 'BOS вниз с подтверждением OTE и дополнительными структурами'
-                            })
+            elif bos['type'] == 'bos_down' and is_sell:
+                setups.append({
+                    'index': bos['index'],
+                    'timestamp': bos['timestamp'],
+                    'price': bos['price'],
+                    'type': 'sell_setup',
+                    'desc': 'BOS вниз с подтверждением OTE и дополнительными структурами',
+                    'confirmed_index': sell_known
+                })
         
         # Находим SFP сетапы
-        for sfp in self.structures['sfp']:
+        for sfp, sfp_known in zip(self.structures['sfp'], self._arrays['sfp']['known'].tolist()):
             # SFP на вершине (для продажи)
             if sfp['type'] == 'sfp_top':
                 setups.append({
+                    'index': sfp['index'],
                     'timestamp': sfp['timestamp'],
                     'price': sfp['price'],
                     'type': 'sell_setup',
-                    'desc': 'SFP на вершине - ложный пробой максимума'
+                    'desc': 'SFP на вершине - ложный пробой максимума',
+                    'confirmed_index': sfp_known
                 })
             
             # SFP на дне (для покупки)
             elif sfp['type'] == 'sfp_bottom':
                 setups.append({
+                    'index': sfp['index'],
                     'timestamp': sfp['timestamp'],
                     'price': sfp['price'],
                     'type': 'buy_setup',
-                    'desc': 'SFP на дне - ложный пробой минимума'
+                    'desc': 'SFP на дне - ложный пробой минимума',
+                    'confirmed_index': sfp_known
                 })
         
         return setups
     
+    def analyze_all(self):
+        """
+        Находит OTE зоны, торговые сетапы и текущий контекст рынка за один вызов
+        
+        OTE зоны ищутся один раз и используются и для подтверждения сетапов,
+        и в результате.
+        
+        Returns:
+            dict: Сетапы ('setups'), контекст рынка ('context') и OTE зоны ('ote_zones')
+        """
+        ote_zones = self.find_optimal_trade_entry()
+        return {
+            'setups': self.find_trade_setups(ote_zones),
+            'context': self.get_current_market_context(),
+            'ote_zones': ote_zones
+        }
+    
+    def setups_stream(self):
+        """
+        Перебирает торговые сетапы в порядке свечей, на которых они подтверждаются
+        
+        Структуры находятся один раз по всей истории, но сетап выдается только на свече
+        'confirmed_index', когда известны все нужные для него свечи, поэтому генератор
+        подходит для последовательного прохода по свечам в бэктесте без заглядывания в будущее.
+        
+        Yields:
+            tuple: Индекс свечи подтверждения и сетап
+        """
+        for setup in sorted(self.find_trade_setups(), key=lambda setup: (setup['confirmed_index'], setup['index'])):
+            yield setup['confirmed_index'], setup
+    
+    def count_recent_structures(self, struct_type, num_candles=10):
+        """
+        Считает структуры заданного типа среди последних свечей
+        
+        Args:
+            struct_type (str): Ключ в словаре структур
+            num_candles (int): Количество последних свечей
+            
+        Returns:
+            int: Количество структур
+        """
+        return int((self._arrays[struct_type]['index'] >= len(self.df) - num_candles).sum())
+    
     def get_current_market_context(self):
         """
         Получает текущий контекст рынка на основе анализа структур
@@ -496,62 +815,35 @@ class SmartMoneyAnalysis:
         """
         # Берем последнюю свечу
         last_idx = len(self.df) - 1
-        last_timestamp = self.df.index[-1]
-        last_close = self.df['close'].iloc[-1]
+        last_timestamp = self._ts(last_idx)
+        last_close = self._close[-1]
+        last_rsi = self._rsi[-1]
         
         # Определяем текущий тренд
-        current_trend = self.df['trend'].iloc[-1]
+        current_trend = self._trend[-1]
         trend_desc = "Восходящий" if current_trend > 0 else "Нисходящий" if current_trend < 0 else "Боковой"
         
         # Определяем ближайшие структуры
         nearby_structures = []
         
-        # Проходим по всем структурам и ищем ближайшие
-        for struct_type, structures in self.structures.items():
+        # Проходим по всем структурам и ищем ближайшие (для зон цена - середина зоны)
+        for struct_type, records in self._arrays.items():
             if struct_type not in ['swing_highs', 'swing_lows']:  # Исключаем базовые структуры
-                for struct in structures:
-                    if 'index' in struct and last_idx - 10 <= struct['index'] <= last_idx:
-                        nearby_structures.append({
-                            'type': struct['type'],
-                            'timestamp': struct['timestamp'],
-                            'price': struct['price'] if 'price' in struct else (struct['price_high'] + struct['price_low']) / 2 if 'price_high' in struct and 'price_low' in struct else None
-                        })
+                recent = records[(records['index'] >= last_idx - 10) & (records['index'] <= last_idx)]
+                for timestamp, price, code in zip(self._ts(recent['index']), recent['price'], recent['type'].tolist()):
+                    nearby_structures.append({
+                        'type': STRUCTURE_TYPES[code],
+                        'timestamp': timestamp,
+                        'price': price
+                    })
         
         # Находим ближайшие уровни поддержки и сопротивления
-        support_levels = []
-        resistance_levels = []
-        
-        # Swing lows как поддержка
-        for sl in self.structures['swing_lows']:
-            if sl['price'] < last_close:
-                support_levels.append(sl['price'])
-        
-        # Swing highs как сопротивление
-        for sh in self.structures['swing_highs']:
-            if sh['price'] > last_close:
-                resistance_levels.append(sh['price'])
-        
-        # Order blocks как поддержка/сопротивление
-        for ob in self.structures['ob_buy']:
-            level = (ob['price_high'] + ob['price_low']) / 2
-            if level < last_close:
-                support_levels.append(level)
-        
-        for ob in self.structures['ob_sell']:
-            level = (ob['price_high'] + ob['price_low']) / 2
-            if level > last_close:
-                resistance_levels.append(level)
+        support_levels = self._support_pool[self._support_pool < last_close]
+        resistance_levels = self._resistance_pool[self._resistance_pool > last_close]
         
         # Находим ближайшие
-        if support_levels:
-            nearest_support = max(support_levels)
-        else:
-            nearest_support = None
-        
-        if resistance_levels:
-            nearest_resistance = min(resistance_levels)
-        else:
-            nearest_resistance = None
+        nearest_support = support_levels.max() if support_levels.size else None
+        nearest_resistance = resistance_levels.min() if resistance_levels.size else None
         
         # Формируем контекст
         context = {
@@ -561,9 +853,9 @@ class SmartMoneyAnalysis:
             'nearby_structures': nearby_structures,
             'nearest_support': nearest_support,
             'nearest_resistance': nearest_resistance,
-            'rsi': self.df['rsi'].iloc[-1],
-            'is_overbought': self.df['rsi'].iloc[-1] > RSI_OVERBOUGHT,
-            'is_oversold': self.df['rsi'].iloc[-1] < RSI_OVERSOLD
+            'rsi': last_rsi,
+            'is_overbought': bool(self._rsi_ob[-1]),
+            'is_oversold': bool(self._rsi_os[-1])
         }
         
         return context
\ No newline at end of file
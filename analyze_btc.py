@@ -5,7 +5,13 @@
 
 import os
 import sys
+import numpy as np
 import pandas as pd
+import matplotlib
+matplotlib.use('Agg')  # График только сохраняется в файл
+import matplotlib.pyplot as plt
+import matplotlib.dates as mdates
+from matplotlib.collections import LineCollection
 from datetime import datetime
 
 # Добавляем родительскую директорию в sys.path
@@ -15,6 +21,27 @@ from exchange import ExchangeClient
 from analysis import TechnicalAnalysis, SmartMoneyAnalysis
 from config import COLORS
 
+# Фигура графика создается один раз и переиспользуется при повторных вызовах analyze_btc
+_FIG = None
+_AX = None
+
+def _get_chart_axes():
+    """
+    Возвращает переиспользуемую фигуру и очищенные оси для графика
+    
+    Returns:
+        tuple: Фигура и оси matplotlib
+    """
+    global _FIG, _AX
+    if _FIG is None:
+        _FIG, _AX = plt.subplots(figsize=(16, 9))
+    else:
+        # Сбрасываем отступы, выставленные tight_layout на прошлом графике
+        _FIG.subplots_adjust(**{param: matplotlib.rcParams[f'figure.subplot.{param}']
+                                for param in ('left', 'right', 'bottom', 'top')})
+        _AX.clear()
+    return _FIG, _AX
+
 def format_price(price):
     """Форматирует цену для вывода с разделителями разрядов"""
     return f"{price:,.2f}" if price >= 1 else f"{price:.8f}"
@@ -32,7 +59,7 @@ def analyze_btc():
         return None
     
     # Получаем текущую цену
-    current_price = df['close'].iloc[-1]
+    current_price = df['close'].iat[-1]
     ticker = exchange.get_ticker("BTC/USDT")
     daily_change = ticker.get('percentage', 0) if ticker else 0
     
@@ -42,14 +69,11 @@ def analyze_btc():
     # Smart Money анализ
     smc = SmartMoneyAnalysis(ta.df)
     
-    # Находим торговые сетапы
-    trade_setups = smc.find_trade_setups()
-    
-    # Получаем текущий контекст рынка
-    market_context = smc.get_current_market_context()
-    
-    # Находим оптимальные зоны для входа
-    ote_zones = smc.find_optimal_trade_entry()
+    # Торговые сетапы, текущий контекст рынка и оптимальные зоны для входа
+    smc_out = smc.analyze_all()
+    trade_setups = smc_out['setups']
+    market_context = smc_out['context']
+    ote_zones = smc_out['ote_zones']
     
     # Выводим результаты анализа
     print("=" * 50)
@@ -61,7 +85,8 @@ def analyze_btc():
     
     # Технические индикаторы
     print("\nТехнические индикаторы:")
-    print(f"RSI (14): {ta.df['rsi'].iloc[-1]:.2f} - {'Перепродан' if ta.df['rsi'].iloc[-1] < 30 else 'Перекуплен' if ta.df['rsi'].iloc[-1] > 70 else 'Нейтральный'}")
+    rsi = ta.df['rsi'].iat[-1]
+    print(f"RSI (14): {rsi:.2f} - {'Перепродан' if rsi < 30 else 'Перекуплен' if rsi > 70 else 'Нейтральный'}")
     
     # Отображаем тренд
     trend = market_context['trend']
@@ -98,11 +123,10 @@ def analyze_btc():
     
     for struct_type, struct_name in struct_types.items():
         if struct_type in smc.structures:
-            recent_structures = [s for s in smc.structures[struct_type] 
-                                if s['index'] >= len(df) - 10]
-            if recent_structures:
-                recent_struct_count += len(recent_structures)
-                print(f"- {struct_name}: {len(recent_structures)} найдено")
+            count = smc.count_recent_structures(struct_type, 10)
+            if count:
+                recent_struct_count += count
+                print(f"- {struct_name}: {count} найдено")
     
     if recent_struct_count == 0:
         print("Значимых структур не найдено в последних 10 свечах")
@@ -119,7 +143,7 @@ def analyze_btc():
     print("\nОптимальные зоны для входа:")
     if ote_zones:
         for i, zone in enumerate(ote_zones, 1):
-            zone_type = "BUY" if "buy" in zone['type'].lower() else "SELL"
+            zone_type = "BUY" if zone['type'] == 'ote_buy_premium' else "SELL"
             print(f"{i}. {zone_type}: ${format_price(zone['price_low'])} - ${format_price(zone['price_high'])}")
     else:
         print("Оптимальные зоны для входа не найдены")
@@ -130,14 +154,14 @@ def analyze_btc():
     
     if trade_setups:
         # Если есть сетапы для покупки
-        buy_setups = [s for s in trade_setups if "buy" in s['type'].lower()]
+        buy_setups = [s for s in trade_setups if s['type'] == 'buy_setup']
         if buy_setups and trend == "Восходящий":
             print("ПОКУПКА РЕКОМЕНДУЕТСЯ")
             for setup in buy_setups[:1]:  # Берем первый сетап для покупки
                 print(f"Причина: {setup['desc']}")
         
         # Если есть сетапы для продажи
-        sell_setups = [s for s in trade_setups if "sell" in s['type'].lower()]
+        sell_setups = [s for s in trade_setups if s['type'] == 'sell_setup']
         if sell_setups and trend == "Нисходящий":
             print("ПРОДАЖА РЕКОМЕНДУЕТСЯ")
             for setup in sell_setups[:1]:  # Берем первый сетап для продажи
@@ -154,40 +178,38 @@ def analyze_btc():
     
     print("=" * 50)
     
-    # Создаем график
-    import matplotlib.pyplot as plt
-    import matplotlib.dates as mdates
-    
-    fig, ax = plt.subplots(figsize=(16, 9))
-    
-    # Рисуем свечи
-    for i in range(len(df.iloc[-30:])):  # Только последние 30 свечей для ясности
-        idx = len(df) - 30 + i
-        if idx < 0:
-            continue
-            
-        open_price = df['open'].iloc[idx]
-        close_price = df['close'].iloc[idx]
-        high_price = df['high'].iloc[idx]
-        low_price = df['low'].iloc[idx]
-        date = df.index[idx]
-        
-        color = 'green' if close_price >= open_price else 'red'
-        
-        # Тело свечи
-        ax.plot([date, date], [open_price, close_price], color=color, linewidth=4)
-        
-        # Верхний и нижний фитили
-        ax.plot([date, date], [close_price, high_price], color=color, linewidth=1)
-        ax.plot([date, date], [open_price, low_price], color=color, linewidth=1)
+    # Создаем график (фигура переиспользуется между вызовами)
+    fig, ax = _get_chart_axes()
+    
+    # Рисуем свечи одной коллекцией отрезков (только последние 30 свечей для ясности)
+    recent = ta.df.iloc[-30:]
+    x = mdates.date2num(recent.index.to_pydatetime())
+    opens = recent['open'].to_numpy()
+    closes = recent['close'].to_numpy()
+    highs = recent['high'].to_numpy()
+    lows = recent['low'].to_numpy()
+    colors = np.where(closes >= opens, 'green', 'red')
+    
+    # Тело свечи
+    bodies = np.stack([np.column_stack([x, opens]), np.column_stack([x, closes])], axis=1)
+    ax.add_collection(LineCollection(bodies, colors=colors, linewidths=4))
+    
+    # Верхний и нижний фитили
+    wicks = np.concatenate([
+        np.stack([np.column_stack([x, closes]), np.column_stack([x, highs])], axis=1),
+        np.stack([np.column_stack([x, opens]), np.column_stack([x, lows])], axis=1)
+    ])
+    ax.add_collection(LineCollection(wicks, colors=np.concatenate([colors, colors]), linewidths=1))
+    ax.xaxis_date()
+    ax.autoscale_view()
     
     # Рисуем EMA
-    ax.plot(df.index[-30:], df['ema20'].iloc[-30:], color='blue', linewidth=1, label='EMA 20')
-    ax.plot(df.index[-30:], df['ema50'].iloc[-30:], color='orange', linewidth=1, label='EMA 50')
+    ax.plot(x, recent['ema20'].to_numpy(), color='blue', linewidth=1, label='EMA 20')
+    ax.plot(x, recent['ema50'].to_numpy(), color='orange', linewidth=1, label='EMA 50')
     
     # Добавляем зоны OTE если они есть
     for zone in ote_zones:
-        color = 'green' if 'buy' in zone['type'].lower() else 'red'
+        color = 'green' if zone['type'] == 'ote_buy_premium' else 'red'
         ax.axhspan(zone['price_low'], zone['price_high'], alpha=0.2, color=color, 
                   label=f"OTE Zone ({zone['type']})")
     
@@ -200,14 +222,14 @@ def analyze_btc():
     # Форматирование дат на оси X
     ax.xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m-%d'))
     ax.xaxis.set_major_locator(mdates.DayLocator(interval=2))
-    plt.xticks(rotation=45)
+    ax.tick_params(axis='x', labelrotation=45)
     
-    plt.legend()
-    plt.tight_layout()
+    ax.legend()
+    fig.tight_layout()
     
     # Сохраняем график
     chart_path = "btc_analysis.png"
-    plt.savefig(chart_path)
+    fig.savefig(chart_path)
     
     print(f"\nГрафик сохранен как {chart_path}")
     
@@ -13,35 +13,36 @@ from dotenv import load_dotenv
 # Загружаем переменные окружения
 load_dotenv()
 
-# Настройка логирования
+# Настройка логирования: запись в файл включается переменной окружения CA_LOGFILE (путь к файлу журнала)
+log_handlers = [logging.StreamHandler()]
+if os.getenv('CA_LOGFILE'):
+    log_handlers.append(logging.FileHandler(os.getenv('CA_LOGFILE')))
+
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("crypto_assistant.log"),
-        logging.StreamHandler()
-    ]
+    handlers=log_handlers
 )
 logger = logging.getLogger("CryptoAssistant")
 
+# Основные модули импортируются при старте процесса, а не при первом вызове
+from core import CryptoAssistant
+from cli import parse_args, process_command
+
 def main():
     """
     Основная функция для запуска приложения из командной строки
     """
-    from core import CryptoAssistant
-    from cli import parse_args, process_command
-    
     # Создаем папку для сохранения графиков
     os.makedirs('charts', exist_ok=True)
     
     # Парсим аргументы командной строки
     args = parse_args()
     
-    # Создаем объект CryptoAssistant
-    assistant = CryptoAssistant()
-    
-    # Обрабатываем команду
-    process_command(args, assistant)
+    # Создаем объект CryptoAssistant, соединения с биржей закрываются при выходе
+    with CryptoAssistant() as assistant:
+        # Обрабатываем команду
+        process_command(args, assistant)
 
 if __name__ == '__main__':
     try:
@@ -49,4 +50,4 @@ if __name__ == '__main__':
     except KeyboardInterrupt:
         logger.info("Приложение завершено пользователем")
     except Exception as e:
-        logger.error(f"Произошла ошибка: {e}", exc_info=True)
\ No newline at end of file
+        logger.error("Произошла ошибка: %s", e, exc_info=True)
\ No newline at end of file
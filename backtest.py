@@ -1,11 +1,108 @@
 import logging
+import ccxt
+import numpy as np
+import pandas as pd
 import matplotlib.pyplot as plt
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
 from analysis import TechnicalAnalysis, SmartMoneyAnalysis
+from cache import cached_ohlcv
 
 logger = logging.getLogger("CryptoAssistant.Backtest")
 
+# Формат записи сделки в массиве результатов бэктестинга: время свечи, на которой подтвержден сетап,
+# и задержка подтверждения в свечах относительно свечи самого сетапа
+TRADE_DTYPE = np.dtype([
+    ('timestamp', 'datetime64[ns]'),
+    ('type', 'U16'),
+    ('entry_price', 'f8'),
+    ('exit_price', 'f8'),
+    ('exit_reason', 'U16'),
+    ('pnl', 'f8'),
+    ('pnl_pct', 'f8'),
+    ('equity', 'f8'),
+    ('signal_delay', 'i8')
+])
+
+def _fetch_all_ohlcv(exchange_client, symbol, timeframe, since_ms, end_ms, limit=1000, max_workers=4):
+    """
+    Получает OHLCV данные за период, разбивая его на окна по limit свечей
+    
+    Args:
+        exchange_client: Объект ExchangeClient для получения данных
+        symbol (str): Торговая пара
+        timeframe (str): Таймфрейм
+        since_ms (int): Время начала в миллисекундах
+        end_ms (int): Время окончания в миллисекундах
+        limit (int): Количество свечей в одном запросе
+        max_workers (int): Количество одновременных запросов
+        
+    Returns:
+        pd.DataFrame: DataFrame с OHLCV данными или None, если данные не получены
+    """
+    # Границы окон известны заранее, поэтому окна запрашиваются параллельно,
+    # а уже закрытые окна берутся из кэша на диске
+    window_ms = ccxt.Exchange.parse_timeframe(timeframe) * 1000 * limit
+    windows = [(start, min(start + window_ms, end_ms)) for start in range(since_ms, end_ms, window_ms)]
+    
+    def fetch(window):
+        start, end = window
+        return cached_ohlcv(exchange_client, symbol, timeframe, limit=limit, since=start, end=end)
+    
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        chunks = list(executor.map(fetch, windows))
+    
+    failed = sum(1 for chunk in chunks if chunk is None)
+    if failed:
+        logger.warning("Не удалось получить %s из %s окон данных для %s", failed, len(windows), symbol)
+    
+    chunks = [chunk for chunk in chunks if chunk is not None and len(chunk) > 0]
+    if not chunks:
+        return None
+    
+    df = pd.concat(chunks)
+    return df[~df.index.duplicated(keep='first')].sort_index()
+
+def _simulate_exit(highs, lows, closes, i, direction, stop_loss, take_profit, horizon=20):
+    """
+    Симулирует выход из сделки, открытой после свечи i
+    
+    Args:
+        highs (np.ndarray): Максимумы свечей
+        lows (np.ndarray): Минимумы свечей
+        closes (np.ndarray): Цены закрытия
+        i (int): Индекс свечи сетапа
+        direction (int): 1 для покупки, -1 для продажи
+        stop_loss (float): Уровень стоп-лосса
+        take_profit (float): Уровень тейк-профита
+        horizon (int): Максимальная длительность сделки в свечах
+        
+    Returns:
+        tuple: Цена выхода, причина выхода ('stop_loss', 'take_profit' или 'timeout') и индекс свечи выхода
+    """
+    end = min(i + horizon, len(closes))
+    window_high = highs[i+1:end]
+    window_low = lows[i+1:end]
+    
+    # Для покупки стоп проверяется по минимумам, тейк по максимумам, для продажи наоборот;
+    # знак direction переворачивает сравнения, поэтому проверки общие для обоих направлений
+    adverse, favorable = (window_low, window_high) if direction == 1 else (window_high, window_low)
+    stop_hit = direction * (stop_loss - adverse) >= 0
+    take_hit = direction * (favorable - take_profit) >= 0
+    
+    # Первая свеча, на которой сработал один из уровней (стоп-лосс проверяется первым)
+    hit = stop_hit | take_hit
+    if hit.any():
+        k = hit.argmax()
+        if stop_hit[k]:
+            return stop_loss, 'stop_loss', i + 1 + k
+        return take_profit, 'take_profit', i + 1 + k
+    
+    # Если не было выхода из сделки, закрываем по последней цене
+    exit_idx = min(i + horizon, len(closes) - 1)
+    return closes[exit_idx], 'timeout', exit_idx
+
 def backtest_strategy(exchange_client, symbol, timeframe, start_date=None, end_date=None):
     """
     Выполняет бэктестинг стратегии
@@ -18,9 +115,10 @@ def backtest_strategy(exchange_client, symbol, timeframe, start_date=None, end_d
         end_date (str): Конечная дата (формат: 'YYYY-MM-DD')
         
     Returns:
-        dict: Результаты бэктестинга
+        dict: Результаты бэктестинга, сделки в 'trades' - структурированный массив TRADE_DTYPE,
+            'avg_signal_delay' - средняя задержка подтверждения сетапов в свечах
     """
-    logger.info(f"Запуск бэктестинга для {symbol} на {timeframe}")
+    logger.info("Запуск бэктестинга для %s на %s", symbol, timeframe)
     
     # Получаем данные
     if start_date:
@@ -33,140 +131,91 @@ def backtest_strategy(exchange_client, symbol, timeframe, start_date=None, end_d
         else:
             end_timestamp = int(datetime.strptime(end_date, '%Y-%m-%d').timestamp() * 1000)
         
-        # Получаем данные с учетом дат
-        df = exchange_client.get_ohlcv(symbol, timeframe, limit=1000, since=start_timestamp, end=end_timestamp)
+        # Получаем данные за весь период окнами по 1000 свечей
+        df = _fetch_all_ohlcv(exchange_client, symbol, timeframe, start_timestamp, end_timestamp)
     else:
         # Если даты не указаны, берем последние 500 свечей
         df = exchange_client.get_ohlcv(symbol, timeframe, limit=500)
     
     if df is None or len(df) == 0:
-        logger.error(f"Не удалось получить данные для {symbol}")
+        logger.error("Не удалось получить данные для %s", symbol)
         return None
     
-    # Технический анализ
+    # Технический и Smart Money анализ выполняются один раз по всей истории; пороги структур
+    # считаются только по прошлым свечам, а у каждого сетапа есть свеча, с которой он известен
     ta = TechnicalAnalysis(df)
+    smc = SmartMoneyAnalysis(ta.df, causal=True)
     
-    # Smart Money анализ
-    smc = SmartMoneyAnalysis(ta.df)
+    # Непрерывные float64 массивы цен для симуляции сделок (без копий DataFrame по свечам)
+    opens, highs, lows, closes = (np.ascontiguousarray(df[column].to_numpy(), dtype=np.float64)
+                                  for column in ('open', 'high', 'low', 'close'))
     
-    # Результаты торговли
-    trades = []
+    # Диапазон последних 20 свечей для стоп-лосса и тейк-профита
+    atr_arr = df['high'].rolling(20).max().to_numpy() - df['low'].rolling(20).min().to_numpy()
+    
+    # Результаты торговли: каждая сделка занимает хотя бы одну свечу, поэтому сделок не больше, чем свечей
+    trades = np.empty(len(df), dtype=TRADE_DTYPE)
+    total_trades = 0
     equity = 1000  # Начальный капитал
-    win_count = 0
-    loss_count = 0
     
-    # Проходим по всем свечам
-    for i in range(50, len(df)-1):  # Начинаем с 50-й свечи для расчета индикаторов
-        # Создаем подмножество данных до текущей свечи
-        subset_df = df.iloc[:i+1].copy()
+    # Индекс свечи, на которой закрывается текущая открытая сделка
+    position_until = -1
+    
+    # Проходим по сетапам в порядке свечей подтверждения: i - свеча, после закрытия которой
+    # сетап известен, вход выполняется только после нее
+    timestamps = df.index.to_numpy(dtype='datetime64[ns]')
+    for i, setup in smc.setups_stream():
+        # Начинаем с 50-й свечи для расчета индикаторов, для последней свечи нет свечи входа
+        if i < 50 or i >= len(df) - 1:
+            continue
+        
+        # Пока сделка открыта, новые сетапы пропускаем
+        if i < position_until:
+            continue
+        
+        # Моделируем торговлю: вход по открытию следующей свечи
+        entry_price = opens[i+1]
         
-        # Технический анализ на подмножестве
-        subset_ta = TechnicalAnalysis(subset_df)
+        # Определяем направление
+        direction = 1 if setup['type'] == 'buy_setup' else -1
         
-        # Smart Money анализ на подмножестве
-        subset_smc = SmartMoneyAnalysis(subset_ta.df)
+        # Определяем стоп-лосс и тейк-профит
+        atr = atr_arr[i]
+        stop_loss = entry_price - direction * atr * 0.5
+        take_profit = entry_price + direction * atr * 1.5
         
-        # Находим торговые сетапы
-        trade_setups = subset_smc.find_trade_setups()
+        # Симулируем исполнение
+        exit_price, exit_reason, position_until = _simulate_exit(highs, lows, closes, i, direction,
+                                                                 stop_loss, take_profit)
         
-        # Если найдены сетапы
-        if trade_setups:
-            for setup in trade_setups:
-                # Проверяем, что сетап на последней свече подмножества
-                if setup['timestamp'] == subset_df.index[-1]:
-                    # Получаем данные для следующей свечи
-                    next_candle = df.iloc[i+1]
-                    
-                    # Моделируем торговлю
-                    entry_price = next_candle['open']
-                    
-                    # Определяем направление
-                    direction = 1 if setup['type'] == 'buy_setup' else -1
-                    
-                    # Определяем стоп-лосс и тейк-профит
-                    atr = subset_df['high'].iloc[-20:].max() - subset_df['low'].iloc[-20:].min()
-                    stop_loss = entry_price - direction * atr * 0.5
-                    take_profit = entry_price + direction * atr * 1.5
-                    
-                    # Симулируем исполнение
-                    exit_price = None
-                    exit_reason = None
-                    
-                    # Проверяем следующие свечи
-                    for j in range(i+1, min(i+20, len(df))):
-                        future_candle = df.iloc[j]
-                        
-                        # Для покупки
-                        if direction == 1:
-                            # Сработал стоп-лосс
-                            if future_candle['low'] <= stop_loss:
-                                exit_price = stop_loss
-                                exit_reason = 'stop_loss'
-                                break
-                            
-                            # Сработал тейк-профит
-                            if future_candle['high'] >= take_profit:
-                                exit_price = take_profit
-                                exit_reason = 'take_profit'
-                                break
-                        
-                        # Для продажи
-                        else:
-                            # Сработал стоп-лосс
-                            if future_candle['high'] >= stop_loss:
-                                exit_price = stop_loss
-                                exit_reason = 'stop_loss'
-                                break
-                            
-                            # Сработал тейк-профит
-                            if future_candle['low'] <= take_profit:
-                                exit_price = take_profit
-                                exit_reason = 'take_profit'
-                                break
-                    
-                    # Если не было выхода из сделки, закрываем по последней цене
-                    if exit_price is None:
-                        exit_price = df.iloc[min(i+20, len(df)-1)]['close']
-                        exit_reason = 'timeout'
-                    
-                    # Расчет прибыли/убытка
-                    pnl = (exit_price - entry_price) * direction
-                    pnl_pct = pnl / entry_price * 100
-                    
-                    # Обновляем капитал
-                    equity += equity * pnl_pct / 100
-                    
-                    # Обновляем статистику
-                    if pnl > 0:
-                        win_count += 1
-                    else:
-                        loss_count += 1
-                    
-                    # Записываем сделку
-                    trades.append({
-                        'timestamp': setup['timestamp'],
-                        'type': setup['type'],
-                        'entry_price': entry_price,
-                        'exit_price': exit_price,
-                        'exit_reason': exit_reason,
-                        'pnl': pnl,
-                        'pnl_pct': pnl_pct,
-                        'equity': equity
-                    })
+        # Расчет прибыли/убытка
+        pnl = (exit_price - entry_price) * direction
+        pnl_pct = pnl / entry_price * 100
+        
+        # Обновляем капитал
+        equity += equity * pnl_pct / 100
+        
+        # Записываем сделку
+        trades[total_trades] = (timestamps[i], setup['type'], entry_price, exit_price,
+                                exit_reason, pnl, pnl_pct, equity, i - setup['index'])
+        total_trades += 1
     
-    # Подводим итоги бэктестинга
-    total_trades = len(trades)
+    # Подводим итоги бэктестинга по полям массива сделок
+    trades = trades[:total_trades]
+    pnl_pct = trades['pnl_pct']
+    equity_curve = trades['equity']
+    
+    win_count = int((trades['pnl'] > 0).sum())
+    loss_count = total_trades - win_count
     win_rate = win_count / total_trades * 100 if total_trades > 0 else 0
-    avg_profit = sum(trade['pnl_pct'] for trade in trades) / total_trades if total_trades > 0 else 0
+    avg_profit = float(pnl_pct.mean()) if total_trades > 0 else 0
+    avg_signal_delay = float(trades['signal_delay'].mean()) if total_trades > 0 else 0
     
-    # Расчет просадки
-    max_equity = 1000
+    # Расчет просадки от максимума капитала (начиная с начального капитала)
     max_drawdown = 0
-    
-    for trade in trades:
-        max_equity = max(max_equity, trade['equity'])
-        drawdown = (max_equity - trade['equity']) / max_equity * 100
-        max_drawdown = max(max_drawdown, drawdown)
+    if total_trades > 0:
+        peak = np.maximum(np.maximum.accumulate(equity_curve), 1000)
+        max_drawdown = float(((peak - equity_curve) / peak).max() * 100)
     
     # Результаты бэктестинга
     backtest_result = {
@@ -179,6 +228,7 @@ def backtest_strategy(exchange_client, symbol, timeframe, start_date=None, end_d
         'loss_count': loss_count,
         'win_rate': win_rate,
         'avg_profit': avg_profit,
+        'avg_signal_delay': avg_signal_delay,
         'final_equity': equity,
         'roi': (equity - 1000) / 1000 * 100,
         'max_drawdown': max_drawdown,
@@ -187,18 +237,19 @@ def backtest_strategy(exchange_client, symbol, timeframe, start_date=None, end_d
     
     return backtest_result
 
-def plot_backtest_results(backtest_result, save_path=None):
+def plot_backtest_results(backtest_result, save_path=None, show=False):
     """
     Визуализирует результаты бэктестинга
     
     Args:
         backtest_result (dict): Результаты бэктестинга
         save_path (str): Путь для сохранения графика
+        show (bool): Показать график (в интерактивном режиме)
         
     Returns:
         bool: True если график построен, иначе False
     """
-    if not backtest_result or not backtest_result['trades']:
+    if not backtest_result or len(backtest_result['trades']) == 0:
         logger.error("Нет данных для построения графика")
         return False
     
@@ -206,10 +257,13 @@ def plot_backtest_results(backtest_result, save_path=None):
         # Создаем график
         fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(16, 12), gridspec_kw={'height_ratios': [3, 1]})
         
-        # Подготавливаем данные для графика
+        # Подготавливаем массивы данных для графика
         trades = backtest_result['trades']
-        dates = [trade['timestamp'] for trade in trades]
-        equity = [trade['equity'] for trade in trades]
+        dates = trades['timestamp']
+        equity = trades['equity']
+        pnl = trades['pnl_pct']
+        is_buy = trades['type'] == 'buy_setup'
+        colors = np.where(pnl > 0, 'green', 'red')
         
         # График капитала
         ax1.plot(dates, equity, 'b-', linewidth=2)
@@ -217,15 +271,12 @@ def plot_backtest_results(backtest_result, save_path=None):
         ax1.set_ylabel('Капитал')
         ax1.grid(True, alpha=0.3)
         
-        # График сделок
-        for trade in trades:
-            color = 'green' if trade['pnl'] > 0 else 'red'
-            marker = '^' if trade['type'] == 'buy_setup' else 'v'
-            ax1.scatter(trade['timestamp'], trade['equity'], color=color, marker=marker, s=100)
+        # График сделок: по одному вызову scatter на каждый тип маркера
+        for mask, marker in ((is_buy, '^'), (~is_buy, 'v')):
+            if mask.any():
+                ax1.scatter(dates[mask], equity[mask], c=colors[mask], marker=marker, s=100)
         
         # График прибыли/убытка
-        pnl = [trade['pnl_pct'] for trade in trades]
-        colors = ['green' if p > 0 else 'red' for p in pnl]
         ax2.bar(dates, pnl, color=colors)
         ax2.set_ylabel('Прибыль/убыток (%)')
         ax2.set_xlabel('Время')
@@ -241,18 +292,20 @@ def plot_backtest_results(backtest_result, save_path=None):
         ax1.text(0.02, 0.95, stats_text, transform=ax1.transAxes, fontsize=10,
                 verticalalignment='top', bbox=dict(boxstyle='round', facecolor='white', alpha=0.5))
         
-        plt.tight_layout()
+        fig.tight_layout()
         
         # Сохраняем график если нужно
         if save_path:
-            plt.savefig(save_path)
-            logger.info(f"График результатов бэктестинга сохранен в {save_path}")
+            fig.savefig(save_path)
+            logger.info("График результатов бэктестинга сохранен в %s", save_path)
         
-        # Показываем график
-        plt.show()
+        # Показываем график только в интерактивном режиме и освобождаем фигуру
+        if show:
+            plt.show()
+        plt.close(fig)
         
         return True
         
     except Exception as e:
-        logger.error(f"Ошибка при построении графика результатов бэктестинга: {e}")
+        logger.error("Ошибка при построении графика результатов бэктестинга: %s", e)
         return False
\ No newline at end of file
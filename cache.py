@@ -0,0 +1,121 @@
+import os
+import hashlib
+import pickle
+import logging
+import time
+import ccxt
+import pandas as pd
+
+from config import CACHE_DIR, MARKETS_CACHE_TTL
+
+logger = logging.getLogger("CryptoAssistant.Cache")
+
+def _cache_path(exchange_client, symbol, timeframe, params):
+    """
+    Формирует путь к файлу кэша для запроса OHLCV данных
+
+    Args:
+        exchange_client: Объект ExchangeClient
+        symbol (str): Торговая пара
+        timeframe (str): Таймфрейм
+        params (dict): Параметры запроса (limit, since, end)
+
+    Returns:
+        str: Путь к файлу кэша
+    """
+    exchange_id = getattr(exchange_client, 'exchange_id', 'exchange')
+    key = hashlib.md5(repr(sorted(params.items())).encode()).hexdigest()
+    filename = f"{exchange_id}_{symbol.replace('/', '_')}_{timeframe}_{key}.pkl"
+    return os.path.join(CACHE_DIR, filename)
+
+def _is_closed_window(timeframe, end):
+    """
+    Проверяет, что окно данных полностью лежит в прошлом и не содержит незакрытой свечи
+
+    Args:
+        timeframe (str): Таймфрейм
+        end (int): Время окончания окна в миллисекундах
+
+    Returns:
+        bool: True если данные окна больше не изменятся
+    """
+    if end is None:
+        return False
+    timeframe_ms = ccxt.Exchange.parse_timeframe(timeframe) * 1000
+    return end + timeframe_ms <= time.time() * 1000
+
+def cached_ohlcv(exchange_client, symbol, timeframe, **params):
+    """
+    Получает OHLCV данные через ExchangeClient.get_ohlcv с кэшированием на диске
+
+    Кэшируются только запросы с явным окном (since и end), которое уже закрыто:
+    запросы последних свечей всегда идут на биржу.
+
+    Args:
+        exchange_client: Объект ExchangeClient для получения данных
+        symbol (str): Торговая пара
+        timeframe (str): Таймфрейм
+        **params: Параметры get_ohlcv (limit, since, end)
+
+    Returns:
+        pd.DataFrame: DataFrame с OHLCV данными или None, если данные не получены
+    """
+    if params.get('since') is None or not _is_closed_window(timeframe, params.get('end')):
+        return exchange_client.get_ohlcv(symbol, timeframe, **params)
+
+    path = _cache_path(exchange_client, symbol, timeframe, params)
+    if os.path.exists(path):
+        try:
+            return pd.read_pickle(path)
+        except Exception as e:
+            logger.warning("Не удалось прочитать кэш %s: %s", path, e)
+
+    df = exchange_client.get_ohlcv(symbol, timeframe, **params)
+
+    # Пустые и неудачные ответы не кэшируем, чтобы повторить запрос в следующий раз
+    if df is not None and len(df) > 0:
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            df.to_pickle(path)
+        except Exception as e:
+            logger.warning("Не удалось сохранить кэш %s: %s", path, e)
+
+    return df
+
+def cached_markets(exchange_client, ttl=MARKETS_CACHE_TTL):
+    """
+    Загружает список рынков биржи с кэшированием на диске
+
+    Рынки, прочитанные из кэша или загруженные с биржи, передаются во все объекты
+    ccxt из пула клиента, чтобы последующие запросы не загружали их с биржи повторно.
+
+    Args:
+        exchange_client: Объект ExchangeClient
+        ttl (int): Время жизни кэша в секундах
+
+    Returns:
+        dict: Рынки биржи в формате ccxt (символ -> описание рынка)
+    """
+    exchange_id = getattr(exchange_client, 'exchange_id', 'exchange')
+    path = os.path.join(CACHE_DIR, f"markets_{exchange_id}.pkl")
+
+    if os.path.exists(path) and time.time() - os.path.getmtime(path) < ttl:
+        try:
+            with open(path, 'rb') as f:
+                markets = pickle.load(f)
+            exchange_client.set_markets(markets)
+            return markets
+        except Exception as e:
+            logger.warning("Не удалось прочитать кэш %s: %s", path, e)
+
+    markets = exchange_client.exchange.load_markets()
+    exchange_client.set_markets(markets)
+
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(path, 'wb') as f:
+            pickle.dump(markets, f)
+    except Exception as e:
+        logger.warning("Не удалось сохранить кэш %s: %s", path, e)
+
+    return markets
@@ -3,6 +3,7 @@ import logging
 from config import (
     DEFAULT_EXCHANGE, DEFAULT_TIMEFRAME, DEFAULT_LIMIT, DEFAULT_SYMBOL
 )
+from visualization import plot_analysis
 
 logger = logging.getLogger("CryptoAssistant.CLI")
 
@@ -29,7 +30,8 @@ def parse_args():
     monitor_parser = subparsers.add_parser('monitor', help='Непрерывный анализ рынка')
     monitor_parser.add_argument('-s', '--symbols', nargs='+', default=[DEFAULT_SYMBOL], help=f'Торговые пары (по умолчанию: {DEFAULT_SYMBOL})')
     monitor_parser.add_argument('-t', '--timeframes', nargs='+', default=[DEFAULT_TIMEFRAME], help=f'Таймфреймы (по умолчанию: {DEFAULT_TIMEFRAME})')
-    monitor_parser.add_argument('-i', '--interval', type=int, default=5, help='Интервал между анализами в минутах (по умолчанию: 5)')
+    monitor_parser.add_argument('-i', '--interval', type=int, default=5, help='Минимальный интервал между анализами в минутах, анализ выполняется по закрытию свечи (по умолчанию: 5)')
+    monitor_parser.add_argument('--stream', action='store_true', help='Получать свечи по websocket вместо опроса биржи')
     
     # Команда для бэктестинга
     backtest_parser = subparsers.add_parser('backtest', help='Бэктестинг стратегии')
@@ -50,33 +52,31 @@ def handle_analyze_command(args, crypto_assistant):
         args: Аргументы командной строки
         crypto_assistant: Объект CryptoAssistant
     """
-    from visualization import plot_chart
-    
     # Анализируем рынок
     result = crypto_assistant.analyze_market(args.symbol, args.timeframe, args.limit)
     
     if result:
         print(f"\nАнализ рынка для {args.symbol} на таймфрейме {args.timeframe} завершен.")
-        print(f"Текущая цена: {result['last_price']}")
-        print(f"Контекст рынка: {result['market_context']}")
+        print(f"Текущая цена: {result.last_price}")
+        print(f"Контекст рынка: {result.market_context}")
         
-        if result['trade_setups']:
+        if result.trade_setups:
             print("\nНайденные торговые сетапы:")
-            for i, setup in enumerate(result['trade_setups'], 1):
+            for i, setup in enumerate(result.trade_setups, 1):
                 print(f"{i}. {setup['type']}: {setup['desc']}")
         else:
             print("\nТорговые сетапы не найдены.")
         
-        if result['ote_zones']:
+        if result.ote_zones:
             print("\nОптимальные зоны для входа:")
-            for i, zone in enumerate(result['ote_zones'], 1):
+            for i, zone in enumerate(result.ote_zones, 1):
                 print(f"{i}. {zone['type']}: {zone['price_low']} - {zone['price_high']}")
         else:
             print("\nОптимальные зоны для входа не найдены.")
         
         # Строим график если нужно
         if args.plot:
-            plot_chart(crypto_assistant, args.output)
+            plot_analysis(crypto_assistant.get_latest(args.symbol, args.timeframe, args.limit), args.output, show=True)
     else:
         print(f"Не удалось выполнить анализ для {args.symbol}")
 
@@ -89,7 +89,7 @@ def handle_monitor_command(args, crypto_assistant):
         crypto_assistant: Объект CryptoAssistant
     """
     # Запускаем непрерывный анализ
-    crypto_assistant.run_continuous_analysis(args.symbols, args.timeframes, args.interval)
+    crypto_assistant.run_continuous_analysis(args.symbols, args.timeframes, args.interval, args.stream)
 
 def handle_backtest_command(args, crypto_assistant):
     """
@@ -109,15 +109,23 @@ def handle_backtest_command(args, crypto_assistant):
         print(f"Всего сделок: {result['total_trades']}")
         print(f"Win Rate: {result['win_rate']:.2f}%")
         print(f"Средняя прибыль: {result['avg_profit']:.2f}%")
+        print(f"Средняя задержка подтверждения сетапа: {result['avg_signal_delay']:.1f} свечей")
         print(f"ROI: {result['roi']:.2f}%")
         print(f"Макс. просадка: {result['max_drawdown']:.2f}%")
         
         # Строим график если нужно
         if args.plot:
-            plot_backtest_results(result, args.output)
+            plot_backtest_results(result, args.output, show=True)
     else:
         print(f"Не удалось выполнить бэктестинг для {args.symbol}")
 
+# Обработчики команд по имени команды
+COMMANDS = {
+    'analyze': handle_analyze_command,
+    'monitor': handle_monitor_command,
+    'backtest': handle_backtest_command
+}
+
 def process_command(args, crypto_assistant):
     """
     Обрабатывает команду из командной строки
@@ -126,11 +134,8 @@ def process_command(args, crypto_assistant):
         args: Аргументы командной строки
         crypto_assistant: Объект CryptoAssistant
     """
-    if args.command == 'analyze':
-        handle_analyze_command(args, crypto_assistant)
-    elif args.command == 'monitor':
-        handle_monitor_command(args, crypto_assistant)
-    elif args.command == 'backtest':
-        handle_backtest_command(args, crypto_assistant)
+    handler = COMMANDS.get(args.command)
+    if handler is not None:
+        handler(args, crypto_assistant)
     else:
         print("Команда не указана. Используйте --help для получения справки.")
\ No newline at end of file
@@ -23,6 +23,9 @@ DEFAULT_EXCHANGE = 'binance'  # binance, bybit, mexc
 DEFAULT_TIMEFRAME = '4h'  # 1m, 5m, 15m, 30m, 1h, 4h, 1d
 DEFAULT_LIMIT = 500  # Количество свечей для анализа
 DEFAULT_SYMBOL = 'BTC/USDT'
+EXCHANGE_POOL_SIZE = int(os.getenv('EXCHANGE_POOL_SIZE', 1))  # Количество объектов биржи для распределения запросов
+MONITOR_CLOSE_DELAY = 5  # Задержка анализа после закрытия свечи в секундах
+ANALYSIS_CACHE_SIZE = 32  # Количество последних анализов пар, хранимых в памяти
 
 # Настройки для технического анализа
 RSI_PERIOD = 14
@@ -46,4 +49,10 @@ COLORS = {
     'WICK': 'cyan',
     'SFP': 'yellow',
     'POI': 'darkgreen'
-}
\ No newline at end of file
+}
+MAX_CHART_CANDLES = 1000  # Максимум свечей на интерактивном графике, при большем числе свечи объединяются
+MAX_CHART_ZONES = 50  # Максимум зон одного типа на графике, более старые зоны рисуются одной общей полосой
+
+# Директория для кэша данных биржи (исторические OHLCV данные, списки рынков)
+CACHE_DIR = os.getenv('CACHE_DIR', 'cache')
+MARKETS_CACHE_TTL = 6 * 60 * 60  # Время жизни кэша списка рынков в секундах
@@ -1,17 +1,54 @@
 import logging
-import os
 import time
+import pathlib
+import itertools
+import collections
+import threading
+import dataclasses
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+import pandas as pd
 
-from exchange import ExchangeClient
+from exchange import ExchangeClient, next_candle_open
 from analysis import TechnicalAnalysis, SmartMoneyAnalysis
+from notification import send_telegram_notifications
+from visualization import plot_analysis
 from config import (
     DEFAULT_EXCHANGE, DEFAULT_TIMEFRAME, DEFAULT_LIMIT, 
-    DEFAULT_SYMBOL
+    DEFAULT_SYMBOL, MONITOR_CLOSE_DELAY, ANALYSIS_CACHE_SIZE
 )
 
 logger = logging.getLogger("CryptoAssistant.Core")
 
+# Поддерживаемые таймфреймы в порядке возрастания и множество для быстрой проверки
+TIMEFRAMES = ('1m', '5m', '15m', '30m', '1h', '4h', '1d', '1w', '1M')
+VALID_TIMEFRAMES = frozenset(TIMEFRAMES)
+
+def _validate_timeframes(timeframes):
+    """
+    Проверяет таймфреймы до обращения к бирже, для неподдерживаемых выбрасывает ValueError
+    
+    Args:
+        timeframes (list): Список таймфреймов
+    """
+    for timeframe in timeframes:
+        if timeframe not in VALID_TIMEFRAMES:
+            raise ValueError(f"Неподдерживаемый таймфрейм: {timeframe}")
+
+@dataclasses.dataclass(slots=True, frozen=True)
+class AnalysisResult:
+    """
+    Результат анализа рынка для торговой пары на таймфрейме
+    """
+    symbol: str
+    timeframe: str
+    timestamp: str
+    last_price: float
+    market_context: dict
+    trade_setups: list
+    ote_zones: list
+    structures: dict
+
 class CryptoAssistant:
     def __init__(self, exchange_id=DEFAULT_EXCHANGE):
         """
@@ -23,8 +60,27 @@ class CryptoAssistant:
         self.exchange_client = ExchangeClient(exchange_id)
         self.last_analysis = None
         
-        # Создаем папку для сохранения графиков
-        os.makedirs('charts', exist_ok=True)
+        # Последние анализы пар (symbol, timeframe, limit) в порядке использования,
+        # не больше ANALYSIS_CACHE_SIZE: давно не использованные пары вытесняются
+        self._analyzers = collections.OrderedDict()
+        self._analyzers_lock = threading.Lock()
+        
+        # Папка для сохранения графиков и префиксы имен файлов графиков по парам
+        self._charts_dir = pathlib.Path('charts')
+        self._charts_dir.mkdir(exist_ok=True)
+        self._chart_prefixes = {}
+    
+    def close(self):
+        """
+        Закрывает соединения с биржей
+        """
+        self.exchange_client.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
     
     def analyze_market(self, symbol=DEFAULT_SYMBOL, timeframe=DEFAULT_TIMEFRAME, limit=DEFAULT_LIMIT):
         """
@@ -36,114 +92,261 @@ class CryptoAssistant:
             limit (int): Количество свечей для анализа
             
         Returns:
-            dict: Результаты анализа
+            AnalysisResult: Результаты анализа
+        """
+        _validate_timeframes([timeframe])
+        
+        analysis = self._run_analysis(symbol, timeframe, limit)
+        if analysis is None:
+            return None
+        
+        # Сохраняем результат для последующего доступа
+        self.last_analysis = analysis
+        
+        return analysis['result']
+    
+    def _run_analysis(self, symbol, timeframe, limit=DEFAULT_LIMIT):
+        """
+        Получает данные и выполняет анализ, не изменяя last_analysis
+        
+        Args:
+            symbol (str): Торговая пара
+            timeframe (str): Таймфрейм
+            limit (int): Количество свечей для анализа
+            
+        Returns:
+            dict: Данные, объекты анализа и результат (как в last_analysis) или None
         """
-        logger.info(f"Анализируем {symbol} на таймфрейме {timeframe}")
+        logger.info("Анализируем %s на таймфрейме %s", symbol, timeframe)
         
         # Получаем данные
         df = self.exchange_client.get_ohlcv(symbol, timeframe, limit)
         
         if df is None or len(df) == 0:
-            logger.error(f"Не удалось получить данные для {symbol}")
+            logger.error("Не удалось получить данные для %s", symbol)
             return None
         
+        # Если свечи не изменились с прошлого анализа пары, объекты анализа переиспользуются
+        key = (symbol, timeframe, limit)
+        previous = self._analyzers.get(key)
+        if previous is not None and previous['df'].equals(df):
+            result = dataclasses.replace(previous['result'], timestamp=datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+            analysis = dict(previous, result=result)
+            self._store_analysis(key, analysis)
+            return analysis
+        
         # Технический анализ
         ta = TechnicalAnalysis(df)
         
         # Smart Money анализ
         smc = SmartMoneyAnalysis(ta.df)
         
-        # Находим торговые сетапы
-        trade_setups = smc.find_trade_setups()
-        
-        # Получаем текущий контекст рынка
-        market_context = smc.get_current_market_context()
-        
-        # Находим оптимальные зоны для входа
-        ote_zones = smc.find_optimal_trade_entry()
+        # Торговые сетапы, текущий контекст рынка и оптимальные зоны для входа
+        smc_out = smc.analyze_all()
+        trade_setups = smc_out['setups']
+        market_context = smc_out['context']
+        ote_zones = smc_out['ote_zones']
         
         # Формируем результат анализа
-        analysis_result = {
-            'symbol': symbol,
-            'timeframe': timeframe,
-            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            'last_price': df['close'].iloc[-1],
-            'market_context': market_context,
-            'trade_setups': trade_setups,
-            'ote_zones': ote_zones,
-            'structures': smc.structures
-        }
+        analysis_result = AnalysisResult(
+            symbol=symbol,
+            timeframe=timeframe,
+            timestamp=datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            last_price=df['close'].iat[-1],
+            market_context=market_context,
+            trade_setups=trade_setups,
+            ote_zones=ote_zones,
+            structures=smc.structures
+        )
         
-        # Сохраняем результат для последующего доступа
-        self.last_analysis = {
+        analysis = {
             'df': df,
             'ta': ta,
             'smc': smc,
             'result': analysis_result
         }
+        self._store_analysis(key, analysis)
         
-        return analysis_result
+        return analysis
     
-    def run_continuous_analysis(self, symbols, timeframes, interval_minutes=5):
+    def _store_analysis(self, key, analysis):
         """
-        Запускает непрерывный анализ рынка с заданным интервалом
+        Сохраняет анализ пары, вытесняя давно не использованные пары
+        
+        Args:
+            key (tuple): Ключ (symbol, timeframe, limit)
+            analysis (dict): Данные, объекты анализа и результат
+        """
+        with self._analyzers_lock:
+            self._analyzers[key] = analysis
+            self._analyzers.move_to_end(key)
+            while len(self._analyzers) > ANALYSIS_CACHE_SIZE:
+                self._analyzers.popitem(last=False)
+    
+    def get_latest(self, symbol, timeframe, limit=DEFAULT_LIMIT):
+        """
+        Возвращает последний анализ пары
+        
+        Args:
+            symbol (str): Торговая пара
+            timeframe (str): Таймфрейм
+            limit (int): Количество свечей, с которым выполнялся анализ
+            
+        Returns:
+            dict: Данные, объекты анализа и результат (как в last_analysis) или None
+        """
+        return self._analyzers.get((symbol, timeframe, limit))
+    
+    def run_continuous_analysis(self, symbols, timeframes, interval_minutes=5, stream=False):
+        """
+        Запускает непрерывный анализ рынка
+        
+        Каждая пара анализируется сразу после закрытия свечи своего таймфрейма,
+        но не чаще, чем раз в interval_minutes. В режиме stream закрытие свечей
+        приходит по websocket, и интервал не используется.
         
         Args:
             symbols (list): Список торговых пар
             timeframes (list): Список таймфреймов
-            interval_minutes (int): Интервал между анализами в минутах
+            interval_minutes (int): Минимальный интервал между анализами пары в минутах
+            stream (bool): Получать свечи по websocket (ccxt.pro) вместо опроса REST API
         """
-        logger.info(f"Запуск непрерывного анализа. Интервал: {interval_minutes} минут")
+        _validate_timeframes(timeframes)
+        logger.info("Запуск непрерывного анализа. Интервал: %s минут", interval_minutes)
+        
+        # Пары анализируются параллельно: время цикла определяется сетевыми запросами к бирже
+        pairs = list(itertools.product(symbols, timeframes))
+        
+        # Время следующего анализа каждой пары, при запуске анализируются все пары
+        next_run = dict.fromkeys(pairs, 0)
+        
+        # Префиксы имен графиков вычисляются один раз для всех пар
+        self._chart_prefixes = {(symbol, timeframe): f"{symbol.replace('/', '')}_tf{timeframe}"
+                                for symbol, timeframe in pairs}
         
         try:
-            while True:
-                logger.info("Начинаем новый цикл анализа...")
-                
-                for symbol in symbols:
-                    for timeframe in timeframes:
-                        # Анализируем рынок
-                        analysis = self.analyze_market(symbol, timeframe)
-                        
-                        if not analysis:
-                            continue
-                        
-                        # Получаем сетапы
-                        setups = analysis['trade_setups']
-                        
-                        # Если есть сетапы, отправляем уведомление и сохраняем график
-                        if setups:
-                            logger.info(f"Найдены торговые сетапы для {symbol} на {timeframe}")
-                            
-                            # Импортируем модули динамически для избежания циклических импортов
-                            from notification import send_telegram_notification
-                            from visualization import plot_chart
-                            
-                            # Формируем сообщение
-                            message = f"*Торговый сигнал!*\n\n"
-                            message += f"*Монета:* {symbol}\n"
-                            message += f"*Таймфрейм:* {timeframe}\n"
-                            message += f"*Текущая цена:* {analysis['last_price']:.8f}\n\n"
-                            
-                            message += "*Найденные сетапы:*\n"
-                            for i, setup in enumerate(setups, 1):
-                                message += f"{i}. {setup['type']}: {setup['desc']}\n"
-                            
-                            # Отправляем уведомление
-                            send_telegram_notification(message)
-                            
-                            # Сохраняем график
-                            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                            chart_path = f"charts/{symbol.replace('/', '')}_tf{timeframe}_{timestamp}.html"
-                            plot_chart(self, chart_path)
+            with ThreadPoolExecutor(max_workers=min(8, len(pairs)) or 1) as executor:
+                if stream:
+                    # Начальный анализ всех пар, затем анализ пары при закрытии ее свечи
+                    try:
+                        self._analyze_pairs(executor, pairs)
+                        for pair in self.exchange_client.stream_closed_candles(pairs, DEFAULT_LIMIT):
+                            self._analyze_pairs(executor, [pair])
+                    except Exception as e:
+                        logger.warning("Websocket поток недоступен (%s), переходим на опрос REST API", e)
                 
-                logger.info(f"Ожидаем {interval_minutes} минут до следующего анализа...")
-                time.sleep(interval_minutes * 60)
+                while True:
+                    now = time.time()
+                    due_pairs = [pair for pair in pairs if next_run[pair] <= now]
+                    
+                    self._analyze_pairs(executor, due_pairs)
+                    
+                    # Следующий анализ пары - на первом закрытии свечи после минимального интервала
+                    for pair in due_pairs:
+                        next_run[pair] = self._next_close(*pair, now + interval_minutes * 60) + MONITOR_CLOSE_DELAY
+                    
+                    wait_seconds = max(0, min(next_run.values()) - time.time())
+                    logger.info("Ожидаем %.0f секунд до закрытия следующей свечи...", wait_seconds)
+                    time.sleep(wait_seconds)
                 
         except KeyboardInterrupt:
             logger.info("Анализ прерван пользователем")
         except Exception as e:
-            logger.error(f"Ошибка при выполнении непрерывного анализа: {e}")
+            logger.error("Ошибка при выполнении непрерывного анализа: %s", e)
+    
+    def _next_close(self, symbol, timeframe, earliest):
+        """
+        Находит первое закрытие свечи пары не раньше заданного времени
+        
+        Закрытия отсчитываются от последней полученной свечи, поэтому недельные свечи
+        закрываются в понедельник, а месячные - в начале календарного месяца.
+        
+        Args:
+            symbol (str): Торговая пара
+            timeframe (str): Таймфрейм
+            earliest (float): Время в секундах, раньше которого анализ не нужен
             
+        Returns:
+            float: Время закрытия свечи в секундах (earliest, если данных пары нет)
+        """
+        analysis = self.get_latest(symbol, timeframe)
+        if analysis is None:
+            return earliest
+        
+        close = next_candle_open(analysis['df'].index[-1], timeframe)
+        earliest_time = pd.Timestamp(earliest, unit='s')
+        while close < earliest_time:
+            close = next_candle_open(close, timeframe)
+        return (close - pd.Timestamp(0)).total_seconds()
+    
+    def _analyze_pairs(self, executor, pairs):
+        """
+        Выполняет один цикл анализа пар, отправляет уведомления и сохраняет графики
+        
+        Args:
+            executor (ThreadPoolExecutor): Пул потоков для анализа пар
+            pairs (list): Список пар (symbol, timeframe)
+        """
+        logger.info("Начинаем новый цикл анализа...")
+        
+        # Отметка времени для имен графиков общая для всего цикла
+        cycle_timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        
+        futures = [executor.submit(self._run_analysis, symbol, timeframe)
+                   for symbol, timeframe in pairs]
+        
+        # Уведомления цикла отправляются одним пакетом, графики строятся в пуле потоков
+        alerts = []
+        chart_futures = []
+        
+        # Результаты обрабатываются последовательно в порядке пар
+        for (symbol, timeframe), future in zip(pairs, futures):
+            # Ошибка анализа одной пары не прерывает цикл по остальным
+            try:
+                analysis = future.result()
+            except Exception as e:
+                logger.error("Ошибка при анализе %s на %s: %s", symbol, timeframe, e)
+                continue
+            
+            if not analysis:
+                continue
+            
+            self.last_analysis = analysis
+            
+            # Получаем сетапы
+            setups = analysis['result'].trade_setups
+            
+            # Если есть сетапы, готовим уведомление и сохраняем график
+            if setups:
+                logger.info("Найдены торговые сетапы для %s на %s", symbol, timeframe)
+                
+                # Формируем сообщение
+                parts = [
+                    "*Торговый сигнал!*\n\n",
+                    f"*Монета:* {symbol}\n",
+                    f"*Таймфрейм:* {timeframe}\n",
+                    f"*Текущая цена:* {analysis['result'].last_price:.8f}\n\n",
+                    "*Найденные сетапы:*\n"
+                ]
+                parts.extend(f"{i}. {setup['type']}: {setup['desc']}\n"
+                             for i, setup in enumerate(setups, 1))
+                alerts.append("".join(parts))
+                
+                # Сохраняем график
+                chart_path = self._charts_dir / f"{self._chart_prefixes[symbol, timeframe]}_{cycle_timestamp}.html"
+                chart_futures.append(executor.submit(plot_analysis, analysis, chart_path))
+        
+        # Отправляем уведомления
+        if alerts:
+            send_telegram_notifications(alerts)
+        
+        # Дожидаемся сохранения графиков до следующего цикла
+        for chart_future in chart_futures:
+            try:
+                chart_future.result()
+            except Exception as e:
+                logger.error("Ошибка при сохранении графика: %s", e)
+    
     def get_available_symbols(self):
         """
         Получает список доступных торговых пар с биржи
@@ -158,6 +361,6 @@ class CryptoAssistant:
         Получает список доступных таймфреймов
         
         Returns:
-            list: Список доступных таймфреймов
+            tuple: Список доступных таймфреймов
         """
-        return ['1m', '5m', '15m', '30m', '1h', '4h', '1d', '1w', '1M']
\ No newline at end of file
+        return TIMEFRAMES
\ No newline at end of file
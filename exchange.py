@@ -1,30 +1,163 @@
 import ccxt
+import logging
+import random
+import copy
+import functools
 import pandas as pd
 import numpy as np
-from datetime import datetime
 import time
-import pytz
+import queue
+import asyncio
+import threading
+import requests
+from requests.adapters import HTTPAdapter
 from config import (
     BINANCE_API_KEY, BINANCE_API_SECRET,
     BYBIT_API_KEY, BYBIT_API_SECRET,
-    MEXC_API_KEY, MEXC_API_SECRET
+    MEXC_API_KEY, MEXC_API_SECRET,
+    EXCHANGE_POOL_SIZE
 )
+from cache import cached_markets
+
+logger = logging.getLogger("CryptoAssistant.Exchange")
+
+def next_candle_open(open_time, timeframe):
+    """
+    Возвращает время открытия свечи, следующей за свечой с указанным временем открытия
+    
+    Месячные свечи идут по календарным месяцам (ccxt.parse_timeframe считает месяц
+    за 30 дней). Остальные таймфреймы имеют фиксированную длительность, в том числе
+    недельный: его свечи открываются в понедельник, а не по неделям от начала эпохи.
+    
+    Args:
+        open_time (pd.Timestamp): Время открытия свечи
+        timeframe (str): Таймфрейм
+        
+    Returns:
+        pd.Timestamp: Время открытия следующей свечи (время закрытия текущей)
+    """
+    if timeframe.endswith('M'):
+        return open_time + pd.DateOffset(months=int(timeframe[:-1]))
+    if timeframe.endswith('y'):
+        return open_time + pd.DateOffset(years=int(timeframe[:-1]))
+    return open_time + pd.Timedelta(seconds=ccxt.Exchange.parse_timeframe(timeframe))
+
+def _exchange_request(action, default=None, tries=3, backoff=1.0):
+    """
+    Декоратор для запросов к бирже с обработкой ошибок по типу исключения
+    
+    Сетевые ошибки и превышение лимита запросов (ccxt.NetworkError) повторяются
+    с экспоненциальной задержкой. Остальные ошибки (неверный символ, ошибка
+    авторизации и т.д.) не повторяются. Если запрос не удался, возвращается default.
+    
+    Args:
+        action (str): Описание запроса для журнала
+        default: Значение, возвращаемое при ошибке
+        tries (int): Количество попыток при сетевых ошибках
+        backoff (float): Начальная задержка между попытками в секундах
+        
+    Returns:
+        function: Декоратор
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            for attempt in range(tries):
+                try:
+                    return func(*args, **kwargs)
+                except ccxt.NetworkError as e:
+                    if attempt == tries - 1:
+                        logger.warning("Ошибка сети при получении %s после %s попыток: %s", action, tries, e)
+                        return copy.copy(default)
+                    delay = backoff * 2 ** attempt * (1 + random.random())
+                    logger.debug("Ошибка сети при получении %s, повтор через %.1f с: %s", action, delay, e)
+                    time.sleep(delay)
+                except Exception as e:
+                    logger.error("Ошибка при получении %s: %s", action, e)
+                    return copy.copy(default)
+        return wrapper
+    return decorator
 
 class ExchangeClient:
-    def __init__(self, exchange_id='binance'):
+    def __init__(self, exchange_id='binance', pool_size=EXCHANGE_POOL_SIZE):
         """
         Инициализирует клиент для работы с биржей
         
         Args:
             exchange_id (str): ID биржи (binance, bybit, mexc)
+            pool_size (int): Количество объектов биржи, между которыми распределяются запросы по символам
         """
         self.exchange_id = exchange_id.lower()
         self.exchange = self._init_exchange()
+        
+        # У каждого объекта биржи свой ограничитель частоты запросов
+        self._pool = [self.exchange] + [self._init_exchange() for _ in range(max(pool_size, 1) - 1)]
+        
+        # Одна HTTP сессия с пулом keep-alive соединений на все объекты биржи
+        self._session = requests.Session()
+        self._session.trust_env = self.exchange.requests_trust_env
+        adapter = HTTPAdapter(pool_connections=8, pool_maxsize=32)
+        self._session.mount('https://', adapter)
+        self._session.mount('http://', adapter)
+        for exchange in self._pool:
+            exchange.session = self._session
+        
+        # Кэш последних свечей: (symbol, timeframe, limit) -> (время открытия следующей свечи в мс, DataFrame)
+        self._ohlcv_cache = {}
+        self._ohlcv_lock = threading.Lock()
+        
+        # Рынки загружаются один раз (из кэша на диске или с биржи) на все объекты пула
+        self._markets_lock = threading.Lock()
+    
+    def close(self):
+        """
+        Закрывает HTTP сессию объектов биржи из пула
+        """
+        for exchange in self._pool:
+            exchange.close()
+        self._session.close()
+    
+    def __enter__(self):
+        return self
     
-    def _init_exchange(self):
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    
+    def _exchange_for(self, symbol):
+        """
+        Возвращает объект биржи из пула для торговой пары
+        
+        Args:
+            symbol (str): Торговая пара
+            
+        Returns:
+            ccxt.Exchange: Объект для работы с биржей
+        """
+        exchange = self._pool[hash(symbol) % len(self._pool)]
+        # Без рынков ccxt загружает их с биржи отдельно для каждого объекта пула
+        if exchange.markets is None:
+            with self._markets_lock:
+                if exchange.markets is None:
+                    cached_markets(self)
+        return exchange
+    
+    def set_markets(self, markets):
+        """
+        Передает рынки всем объектам биржи из пула, чтобы они не загружали их с биржи
+        
+        Args:
+            markets (dict): Рынки биржи в формате ccxt
+        """
+        for exchange in self._pool:
+            exchange.set_markets(markets)
+    
+    def _init_exchange(self, module=ccxt):
         """
         Инициализирует соединение с биржей
         
+        Args:
+            module: Модуль с классами бирж (ccxt для REST, ccxt.pro для websocket)
+            
         Returns:
             ccxt.Exchange: Объект для работы с биржей
         """
@@ -37,7 +170,7 @@ class ExchangeClient:
                 'enableRateLimit': True,
                 'options': {'defaultType': 'future'}  # Используем фьючерсы по умолчанию
             }
-            exchange = ccxt.binance(exchange_config)
+            exchange = module.binance(exchange_config)
         
         elif self.exchange_id == 'bybit':
             exchange_config = {
@@ -45,7 +178,7 @@ class ExchangeClient:
                 'secret': BYBIT_API_SECRET,
                 'enableRateLimit': True,
             }
-            exchange = ccxt.bybit(exchange_config)
+            exchange = module.bybit(exchange_config)
         
         elif self.exchange_id == 'mexc':
             exchange_config = {
@@ -53,14 +186,14 @@ class ExchangeClient:
                 'secret': MEXC_API_SECRET,
                 'enableRateLimit': True,
             }
-            exchange = ccxt.mexc(exchange_config)
+            exchange = module.mexc(exchange_config)
         
         else:
             raise ValueError(f"Неподдерживаемая биржа: {self.exchange_id}")
         
         return exchange
     
-    def get_ohlcv(self, symbol, timeframe='4h', limit=500):
+    def get_ohlcv(self, symbol, timeframe='4h', limit=500, since=None, end=None, force_refresh=False):
         """
         Получает OHLCV данные с биржи
         
@@ -68,27 +201,214 @@ class ExchangeClient:
             symbol (str): Торговая пара (например, 'BTC/USDT')
             timeframe (str): Таймфрейм ('1m', '5m', '15m', '30m', '1h', '4h', '1d')
             limit (int): Количество свечей
+            since (int): Время начала в миллисекундах (по умолчанию - последние свечи)
+            end (int): Время окончания в миллисекундах, свечи с этого момента отбрасываются
+            force_refresh (bool): Загрузить все окно заново, не используя сохраненные свечи
             
         Returns:
             pd.DataFrame: DataFrame с OHLCV данными
         """
-        try:
-            # Получаем данные
-            ohlcv = self.exchange.fetch_ohlcv(symbol, timeframe, limit=limit)
+        # Исторические окна здесь не кэшируются, для них есть cache.cached_ohlcv
+        if since is not None or end is not None:
+            return self._fetch_ohlcv(symbol, timeframe, limit, since, end)
+        
+        # Пока не началась свеча после последней полученной, повторные запросы возвращают сохраненные данные
+        timeframe_ms = self.exchange.parse_timeframe(timeframe) * 1000
+        now_ms = int(time.time() * 1000)
+        key = (symbol, timeframe, limit)
+        with self._ohlcv_lock:
+            cached = None if force_refresh else self._ohlcv_cache.get(key)
+        if cached is not None and now_ms < cached[0]:
+            return cached[1].copy()
+        
+        df = None
+        if cached is not None:
+            df = self._update_ohlcv(cached[1], symbol, timeframe, limit, timeframe_ms, now_ms)
+        if df is None:
+            df = self._fetch_ohlcv(symbol, timeframe, limit)
+        if df is None:
+            return None
+        
+        with self._ohlcv_lock:
+            self._ohlcv_cache[key] = self._cache_entry(df, timeframe)
+        
+        # Возвращаем копию, чтобы изменения у вызывающего кода не попали в кэш
+        return df.copy()
+    
+    def _update_ohlcv(self, stored, symbol, timeframe, limit, timeframe_ms, now_ms):
+        """
+        Догружает к сохраненным свечам только новые, начиная с последней сохраненной
+        
+        Args:
+            stored (pd.DataFrame): Ранее полученные свечи
+            symbol (str): Торговая пара
+            timeframe (str): Таймфрейм
+            limit (int): Количество свечей в окне
+            timeframe_ms (int): Длительность свечи в миллисекундах
+            now_ms (int): Текущее время в миллисекундах
             
-            # Преобразуем в DataFrame
-            df = pd.DataFrame(ohlcv, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
+        Returns:
+            pd.DataFrame: Обновленное окно из limit свечей или None, если нужна полная загрузка
+        """
+        if len(stored) == 0:
+            return None
+        
+        # Последняя сохраненная свеча могла быть незакрытой, поэтому запрашиваем начиная с нее
+        last_ms = (stored.index[-1] - pd.Timestamp(0)) // pd.Timedelta('1ms')
+        if (now_ms - last_ms) // timeframe_ms >= limit:
+            return None
+        
+        new = self._fetch_ohlcv(symbol, timeframe, limit, since=last_ms)
+        if new is None or len(new) == 0:
+            return None
+        
+        return self._merge_candles(stored, new, limit)
+    
+    @staticmethod
+    def _cache_entry(df, timeframe):
+        """
+        Строит запись кэша свечей: данные действительны до открытия следующей свечи
+        
+        Args:
+            df (pd.DataFrame): Окно свечей
+            timeframe (str): Таймфрейм
             
-            # Конвертируем timestamp в datetime
-            df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
-            df.set_index('timestamp', inplace=True)
+        Returns:
+            tuple: (время открытия следующей свечи в миллисекундах, DataFrame)
+        """
+        if len(df) == 0:
+            return 0, df
+        next_open = next_candle_open(df.index[-1], timeframe)
+        return (next_open - pd.Timestamp(0)) // pd.Timedelta('1ms'), df
+    
+    @staticmethod
+    def _merge_candles(stored, new, limit):
+        """
+        Объединяет сохраненные свечи с новыми
+        
+        Args:
+            stored (pd.DataFrame): Ранее полученные свечи
+            new (pd.DataFrame): Новые свечи, начиная с последней сохраненной или позже
+            limit (int): Количество свечей в окне
+            
+        Returns:
+            pd.DataFrame: Последние limit свечей
+        """
+        # Новые значения заменяют сохраненные для совпадающих свечей
+        df = pd.concat([stored[stored.index < new.index[0]], new])
+        return df.iloc[-limit:]
+    
+    @staticmethod
+    def _candles_to_df(ohlcv):
+        """
+        Преобразует список свечей ccxt в DataFrame
+        
+        Args:
+            ohlcv (list): Свечи в формате [timestamp, open, high, low, close, volume]
+            
+        Returns:
+            pd.DataFrame: DataFrame с OHLCV данными
+        """
+        # Один float64 массив, без определения типов по столбцам
+        arr = np.asarray(ohlcv, dtype=np.float64).reshape(-1, 6)
+        index = pd.DatetimeIndex(pd.to_datetime(arr[:, 0].astype(np.int64), unit='ms'), name='timestamp')
+        
+        return pd.DataFrame(arr[:, 1:], columns=['open', 'high', 'low', 'close', 'volume'], index=index)
+    
+    @_exchange_request('OHLCV данных')
+    def _fetch_ohlcv(self, symbol, timeframe, limit, since=None, end=None):
+        """
+        Запрашивает OHLCV данные с биржи без кэширования
+        
+        Args:
+            symbol (str): Торговая пара
+            timeframe (str): Таймфрейм
+            limit (int): Количество свечей
+            since (int): Время начала в миллисекундах
+            end (int): Время окончания в миллисекундах
+            
+        Returns:
+            pd.DataFrame: DataFrame с OHLCV данными или None при ошибке
+        """
+        # Получаем данные
+        ohlcv = self._exchange_for(symbol).fetch_ohlcv(symbol, timeframe, since=since, limit=limit)
+        if end is not None:
+            ohlcv = [candle for candle in ohlcv if candle[0] < end]
+        
+        # Преобразуем в DataFrame
+        return self._candles_to_df(ohlcv)
+    
+    def stream_closed_candles(self, pairs, limit=500):
+        """
+        Подписывается на свечи пар через websocket (ccxt.pro)
+        
+        Получение данных идет в отдельном потоке: каждое обновление записывается
+        в кэш последних свечей, поэтому get_ohlcv для этих пар не обращается к REST API.
+        
+        Args:
+            pairs (list): Список пар (symbol, timeframe)
+            limit (int): Количество свечей в окне
             
-            return df
+        Yields:
+            tuple: Пара (symbol, timeframe), у которой закрылась свеча
+        """
+        events = queue.Queue()
+        thread = threading.Thread(target=lambda: asyncio.run(self._watch_ohlcv(pairs, limit, events)),
+                                  daemon=True)
+        thread.start()
+        
+        while True:
+            event = events.get()
+            if isinstance(event, Exception):
+                raise event
+            yield event
+    
+    async def _watch_ohlcv(self, pairs, limit, events):
+        """
+        Получает обновления свечей по websocket и поддерживает окна свечей в кэше
         
+        Args:
+            pairs (list): Список пар (symbol, timeframe)
+            limit (int): Количество свечей в окне
+            events (queue.Queue): Очередь для пар с закрытой свечой и ошибок
+        """
+        exchange = None
+        
+        async def watch(symbol, timeframe):
+            key = (symbol, timeframe, limit)
+            
+            # Начальное окно загружается через REST
+            if key not in self._ohlcv_cache:
+                await asyncio.to_thread(self.get_ohlcv, symbol, timeframe, limit)
+            
+            while True:
+                candles = await exchange.watch_ohlcv(symbol, timeframe)
+                if not candles:
+                    continue
+                new = self._candles_to_df(candles)
+                
+                with self._ohlcv_lock:
+                    cached = self._ohlcv_cache.get(key)
+                    stored = cached[1] if cached is not None else new.iloc[:0]
+                    df = self._merge_candles(stored, new, limit)
+                    self._ohlcv_cache[key] = self._cache_entry(df, timeframe)
+                
+                # Появилась новая свеча: предыдущая закрыта
+                if len(stored) > 0 and new.index[-1] > stored.index[-1]:
+                    events.put((symbol, timeframe))
+        
+        try:
+            import ccxt.pro
+            
+            exchange = self._init_exchange(ccxt.pro)
+            await asyncio.gather(*(watch(symbol, timeframe) for symbol, timeframe in pairs))
         except Exception as e:
-            print(f"Ошибка при получении OHLCV данных: {e}")
-            return None
+            events.put(e)
+        finally:
+            if exchange is not None:
+                await exchange.close()
     
+    @_exchange_request('ticker')
     def get_ticker(self, symbol):
         """
         Получает текущую информацию о торговой паре
@@ -99,13 +419,10 @@ class ExchangeClient:
         Returns:
             dict: Информация о торговой паре
         """
-        try:
-            ticker = self.exchange.fetch_ticker(symbol)
-            return ticker
-        except Exception as e:
-            print(f"Ошибка при получении ticker: {e}")
-            return None
+        ticker = self._exchange_for(symbol).fetch_ticker(symbol)
+        return ticker
     
+    @_exchange_request('ордербука')
     def get_order_book(self, symbol, limit=100):
         """
         Получает ордербук для торговой пары
@@ -117,13 +434,10 @@ class ExchangeClient:
         Returns:
             dict: Ордербук с покупками и продажами
         """
-        try:
-            order_book = self.exchange.fetch_order_book(symbol, limit)
-            return order_book
-        except Exception as e:
-            print(f"Ошибка при получении ордербука: {e}")
-            return None
-            
+        order_book = self._exchange_for(symbol).fetch_order_book(symbol, limit)
+        return order_book
+    
+    @_exchange_request('списка символов', default=[])
     def get_available_symbols(self):
         """
         Получает список доступных торговых пар
@@ -131,14 +445,11 @@ class ExchangeClient:
         Returns:
             list: Список доступных торговых пар
         """
-        try:
-            markets = self.exchange.load_markets()
-            symbols = list(markets.keys())
-            return symbols
-        except Exception as e:
-            print(f"Ошибка при получении списка символов: {e}")
-            return []
-
+        markets = cached_markets(self)
+        symbols = list(markets.keys())
+        return symbols
+    
+    @_exchange_request('ставки финансирования')
     def get_funding_rate(self, symbol):
         """
         Получает текущую ставку финансирования для фьючерсов
@@ -149,12 +460,9 @@ class ExchangeClient:
         Returns:
             float: Ставка финансирования
         """
-        try:
-            if hasattr(self.exchange, 'fetch_funding_rate'):
-                funding_rate = self.exchange.fetch_funding_rate(symbol)
-                return funding_rate
-            else:
-                return None
-        except Exception as e:
-            print(f"Ошибка при получении ставки финансирования: {e}")
-            return None
\ No newline at end of file
+        exchange = self._exchange_for(symbol)
+        if hasattr(exchange, 'fetch_funding_rate'):
+            funding_rate = exchange.fetch_funding_rate(symbol)
+            return funding_rate
+        else:
+            return None
@@ -1,27 +1,37 @@
 import argparse
-import pandas as pd
+import numpy as np
 import matplotlib.pyplot as plt
+from matplotlib.collections import LineCollection
 import plotly.graph_objects as go
-from datetime import datetime, timedelta
+from datetime import datetime
 import time
 import logging
 import os
+import collections
+from concurrent.futures import ThreadPoolExecutor
 
 from exchange import ExchangeClient
 from analysis import TechnicalAnalysis, SmartMoneyAnalysis
+from backtest import backtest_strategy, plot_backtest_results
+from notification import send_telegram_notification, send_telegram_notifications
+from visualization import (
+    CHART_LAYOUT, UP_DOWN_RGBA, downsample_ohlc, recent_zones,
+    _marker_trace, _summary_shapes, _add_summary_band, _add_spans, _add_levels, _plot_markers
+)
 from config import (
     DEFAULT_EXCHANGE, DEFAULT_TIMEFRAME, DEFAULT_LIMIT, 
-    DEFAULT_SYMBOL, COLORS, TELEGRAM_BOT_TOKEN, TELEGRAM_CHAT_ID
+    DEFAULT_SYMBOL, COLORS, ANALYSIS_CACHE_SIZE
 )
 
-# Настройка логирования
+# Настройка логирования: запись в файл включается переменной окружения CA_LOGFILE (путь к файлу журнала)
+log_handlers = [logging.StreamHandler()]
+if os.getenv('CA_LOGFILE'):
+    log_handlers.append(logging.FileHandler(os.getenv('CA_LOGFILE')))
+
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("crypto_assistant.log"),
-        logging.StreamHandler()
-    ]
+    handlers=log_handlers
 )
 logger = logging.getLogger("CryptoAssistant")
 
@@ -36,6 +46,9 @@ class CryptoAssistant:
         self.exchange_client = ExchangeClient(exchange_id)
         self.last_analysis = None
         
+        # Последние анализы пар (symbol, timeframe, limit), не больше ANALYSIS_CACHE_SIZE
+        self._analyses = collections.OrderedDict()
+        
         # Создаем папку для сохранения графиков
         os.makedirs('charts', exist_ok=True)
     
@@ -51,15 +64,25 @@ class CryptoAssistant:
         Returns:
             dict: Результаты анализа
         """
-        logger.info(f"Анализируем {symbol} на таймфрейме {timeframe}")
+        logger.info("Анализируем %s на таймфрейме %s", symbol, timeframe)
         
         # Получаем данные
         df = self.exchange_client.get_ohlcv(symbol, timeframe, limit)
         
         if df is None or len(df) == 0:
-            logger.error(f"Не удалось получить данные для {symbol}")
+            logger.error("Не удалось получить данные для %s", symbol)
             return None
         
+        # Если свечи не изменились с прошлого анализа пары (включая незакрытую свечу),
+        # повторно используется прошлый анализ
+        key = (symbol, timeframe, limit)
+        previous = self._analyses.get(key)
+        if previous is not None and previous['df'].equals(df):
+            self._analyses.move_to_end(key)
+            previous['result']['timestamp'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            self.last_analysis = previous
+            return previous['result']
+        
         # Технический анализ
         ta = TechnicalAnalysis(df)
         
@@ -80,7 +103,7 @@ class CryptoAssistant:
             'symbol': symbol,
             'timeframe': timeframe,
             'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            'last_price': df['close'].iloc[-1],
+            'last_price': df['close'].iat[-1],
             'market_context': market_context,
             'trade_setups': trade_setups,
             'ote_zones': ote_zones,
@@ -94,16 +117,21 @@ class CryptoAssistant:
             'smc': smc,
             'result': analysis_result
         }
+        self._analyses[key] = self.last_analysis
+        self._analyses.move_to_end(key)
+        if len(self._analyses) > ANALYSIS_CACHE_SIZE:
+            self._analyses.popitem(last=False)
         
         return analysis_result
     
-    def plot_chart(self, save_path=None, plot_type='plotly'):
+    def plot_chart(self, save_path=None, plot_type='plotly', show=False):
         """
         Строит график с результатами анализа
         
         Args:
             save_path (str): Путь для сохранения графика
             plot_type (str): Тип графика ('plotly' или 'matplotlib')
+            show (bool): Показать график (в интерактивном режиме)
             
         Returns:
             bool: True если график построен, иначе False
@@ -116,13 +144,14 @@ class CryptoAssistant:
         smc = self.last_analysis['smc']
         symbol = self.last_analysis['result']['symbol']
         timeframe = self.last_analysis['result']['timeframe']
+        ote_zones = self.last_analysis['result']['ote_zones']
         
         if plot_type == 'plotly':
-            return self._plot_plotly(df, smc, symbol, timeframe, save_path)
+            return self._plot_plotly(df, smc, symbol, timeframe, save_path, ote_zones, show)
         else:
-            return self._plot_matplotlib(df, smc, symbol, timeframe, save_path)
+            return self._plot_matplotlib(df, smc, symbol, timeframe, save_path, ote_zones, show)
     
-    def _plot_plotly(self, df, smc, symbol, timeframe, save_path=None):
+    def _plot_plotly(self, df, smc, symbol, timeframe, save_path=None, ote_zones=None, show=False):
         """
         Строит интерактивный график с использованием Plotly
         
@@ -132,208 +161,153 @@ class CryptoAssistant:
             symbol (str): Торговая пара
             timeframe (str): Таймфрейм
             save_path (str): Путь для сохранения графика
+            show (bool): Показать график (в интерактивном режиме)
+            ote_zones (list, optional): OTE зоны из результата анализа, чтобы не искать их повторно
             
         Returns:
             bool: True если график построен, иначе False
         """
+        if ote_zones is None:
+            ote_zones = smc.find_optimal_trade_entry()
+        
         try:
-            # Создаем график свечей
+            # Создаем график свечей (при большом числе свечей соседние свечи объединяются)
+            candles = downsample_ohlc(df)
+            # Plotly получает массивы NumPy, общий для всех трасс массив времени берется один раз
+            x = candles.index.to_numpy()
             fig = go.Figure(data=[go.Candlestick(
-                x=df.index,
-                open=df['open'],
-                high=df['high'],
-                low=df['low'],
-                close=df['close'],
+                x=x,
+                open=candles['open'].to_numpy(),
+                high=candles['high'].to_numpy(),
+                low=candles['low'].to_numpy(),
+                close=candles['close'].to_numpy(),
                 name='Цена'
             )])
             
             # Добавляем EMA
             fig.add_trace(go.Scatter(
-                x=df.index,
-                y=df['ema20'],
+                x=x,
+                y=candles['ema20'].to_numpy(),
                 line=dict(color='blue', width=1),
                 name='EMA 20'
             ))
             
             fig.add_trace(go.Scatter(
-                x=df.index,
-                y=df['ema50'],
+                x=x,
+                y=candles['ema50'].to_numpy(),
                 line=dict(color='orange', width=1),
                 name='EMA 50'
             ))
             
             fig.add_trace(go.Scatter(
-                x=df.index,
-                y=df['ema200'],
+                x=x,
+                y=candles['ema200'].to_numpy(),
                 line=dict(color='purple', width=1.5),
                 name='EMA 200'
             ))
             
-            # Добавляем структуры
-            
-            # Order Blocks
-            for ob in smc.structures['ob_buy']:
-                fig.add_shape(
+            # Добавляем структуры: фигуры собираются в список и передаются в layout одним вызовом,
+            # маркеры структур одного типа рисуются одной трассой
+            last_timestamp = df.index[-1]
+            shapes = []
+            
+            # Order Blocks (прямоугольники зон рисуются под свечами и не перекрывают их)
+            # Рисуются последние MAX_CHART_ZONES зон каждого типа, более старые - одной общей полосой
+            for struct_type, color, name in (('ob_buy', COLORS['OB_BUY'], 'OB Buy'),
+                                             ('ob_sell', COLORS['OB_SELL'], 'OB Sell')):
+                zones, summary = recent_zones(smc.structures[struct_type])
+                shapes.extend(_summary_shapes(summary, color, name))
+                shapes.extend(dict(
                     type="rect",
                     x0=ob['timestamp'],
                     y0=ob['price_low'],
-                    x1=df.index[-1],
+                    x1=last_timestamp,
                     y1=ob['price_high'],
-                    line=dict(color=COLORS['OB_BUY'], width=1),
-                    fillcolor=COLORS['OB_BUY'],
-                    opacity=0.2,
-                    name='OB Buy'
-                )
-            
-            for ob in smc.structures['ob_sell']:
-                fig.add_shape(
-                    type="rect",
-                    x0=ob['timestamp'],
-                    y0=ob['price_low'],
-                    x1=df.index[-1],
-                    y1=ob['price_high'],
-                    line=dict(color=COLORS['OB_SELL'], width=1),
-                    fillcolor=COLORS['OB_SELL'],
+                    line=dict(color=color, width=1),
+                    fillcolor=color,
                     opacity=0.2,
-                    name='OB Sell'
-                )
+                    layer='below',
+                    name=name
+                ) for ob in zones)
             
             # Линии EQH/EQL
-            for eqh in smc.structures['eqh']:
-                fig.add_shape(
+            for struct_type, color, name in (('eqh', COLORS['EQH'], 'EQH'), ('eql', COLORS['EQL'], 'EQL')):
+                shapes.extend(dict(
                     type="line",
-                    x0=eqh['timestamp'],
-                    y0=eqh['price'],
-                    x1=df.index[-1],
-                    y1=eqh['price'],
-                    line=dict(color=COLORS['EQH'], width=1, dash="dash"),
-                    name='EQH'
-                )
-            
-            for eql in smc.structures['eql']:
-                fig.add_shape(
-                    type="line",
-                    x0=eql['timestamp'],
-                    y0=eql['price'],
-                    x1=df.index[-1],
-                    y1=eql['price'],
-                    line=dict(color=COLORS['EQL'], width=1, dash="dash"),
-                    name='EQL'
-                )
-            
-            # BOS/BMS
-            for bos in smc.structures['bos']:
-                fig.add_trace(go.Scatter(
-                    x=[bos['timestamp']],
-                    y=[bos['price']],
-                    mode='markers',
-                    marker=dict(
-                        symbol='triangle-up' if 'up' in bos['type'] else 'triangle-down',
-                        color=COLORS['BOS'],
-                        size=12
-                    ),
-                    name='BOS'
-                ))
-            
-            # SC
-            for sc in smc.structures['sc']:
-                fig.add_trace(go.Scatter(
-                    x=[sc['timestamp']],
-                    y=[sc['price']],
-                    mode='markers',
-                    marker=dict(
-                        symbol='star',
-                        color=COLORS['SC'],
-                        size=12
-                    ),
-                    name='SC'
-                ))
-            
-            # Wicks
-            for wick in smc.structures['wick']:
-                fig.add_trace(go.Scatter(
-                    x=[wick['timestamp']],
-                    y=[wick['price']],
-                    mode='markers',
-                    marker=dict(
-                        symbol='diamond',
-                        color=COLORS['WICK'],
-                        size=10
-                    ),
-                    name='Wick'
-                ))
-            
-            # SFP
-            for sfp in smc.structures['sfp']:
-                fig.add_trace(go.Scatter(
-                    x=[sfp['timestamp']],
-                    y=[sfp['price']],
-                    mode='markers',
-                    marker=dict(
-                        symbol='x',
-                        color=COLORS['SFP'],
-                        size=12
-                    ),
-                    name='SFP'
-                ))
-            
-            # POI
-            for poi in smc.structures['poi']:
-                fig.add_trace(go.Scatter(
-                    x=[poi['timestamp']],
-                    y=[(poi['price_high'] + poi['price_low']) / 2],
-                    mode='markers',
-                    marker=dict(
-                        symbol='circle',
-                        color=COLORS['POI'],
-                        size=14,
-                        line=dict(width=2, color='white')
-                    ),
-                    name='POI'
-                ))
+                    x0=level['timestamp'],
+                    y0=level['price'],
+                    x1=last_timestamp,
+                    y1=level['price'],
+                    line=dict(color=color, width=1, dash="dash"),
+                    name=name
+                ) for level in smc.structures[struct_type])
             
             # Добавляем OTE зоны
-            ote_zones = smc.find_optimal_trade_entry()
-            for i, zone in enumerate(ote_zones):
-                color = 'green' if 'buy' in zone['type'] else 'red'
-                fig.add_shape(
+            for is_buy, color in ((True, 'green'), (False, 'red')):
+                zones, summary = recent_zones([zone for zone in ote_zones if ('buy' in zone['type']) == is_buy])
+                shapes.extend(_summary_shapes(summary, color, 'OTE Zone'))
+                shapes.extend(dict(
                     type="rect",
                     x0=zone['timestamp'],
                     y0=zone['price_low'],
-                    x1=df.index[-1],
+                    x1=last_timestamp,
                     y1=zone['price_high'],
                     line=dict(color=color, width=1),
                     fillcolor=color,
                     opacity=0.1,
-                    name=f'OTE Zone {i+1}'
-                )
+                    layer='below',
+                    name=f"OTE Zone ({zone['type']})"
+                ) for zone in zones)
+            
+            fig.update_layout(shapes=shapes)
+            
+            # Маркеры BOS/BMS, SC, Wicks, SFP и POI
+            traces = []
+            
+            bos_list = smc.structures['bos']
+            if bos_list:
+                traces.append(_marker_trace(
+                    bos_list, 'BOS', [bos['price'] for bos in bos_list],
+                    symbol=['triangle-up' if 'up' in bos['type'] else 'triangle-down' for bos in bos_list],
+                    color=COLORS['BOS'], size=12))
+            
+            for struct_type, name, marker_symbol, size in (('sc', 'SC', 'star', 12),
+                                                           ('wick', 'Wick', 'diamond', 10),
+                                                           ('sfp', 'SFP', 'x', 12)):
+                items = smc.structures[struct_type]
+                if items:
+                    traces.append(_marker_trace(
+                        items, name, [item['price'] for item in items],
+                        symbol=marker_symbol, color=COLORS[name.upper()], size=size))
+            
+            poi_list = smc.structures['poi']
+            if poi_list:
+                traces.append(_marker_trace(
+                    poi_list, 'POI', [(poi['price_high'] + poi['price_low']) / 2 for poi in poi_list],
+                    symbol='circle', color=COLORS['POI'], size=14, line=dict(width=2, color='white')))
+            
+            fig.add_traces(traces)
             
             # Обновляем layout
-            fig.update_layout(
-                title=f'{symbol} - {timeframe}',
-                xaxis_title='Время',
-                yaxis_title='Цена',
-                height=800,
-                width=1200,
-                template='plotly_white',
-                showlegend=True
-            )
+            fig.update_layout(title=f'{symbol} - {timeframe}', **CHART_LAYOUT)
             
-            # Сохраняем график если нужно
+            # Сохраняем график если нужно (фигура собрана из типизированных объектов
+            # plotly, поэтому повторная проверка схемы при записи не нужна)
             if save_path:
-                fig.write_html(save_path)
-                logger.info(f"График сохранен в {save_path}")
+                fig.write_html(save_path, include_plotlyjs='cdn', validate=False)
+                logger.info("График сохранен в %s", save_path)
             
-            # Показываем график
-            fig.show()
+            # Показываем график только в интерактивном режиме
+            if show:
+                fig.show()
             
             return True
         
         except Exception as e:
-            logger.error(f"Ошибка при построении графика: {e}")
+            logger.error("Ошибка при построении графика: %s", e)
             return False
     
-    def _plot_matplotlib(self, df, smc, symbol, timeframe, save_path=None):
+    def _plot_matplotlib(self, df, smc, symbol, timeframe, save_path=None, ote_zones=None, show=False):
         """
         Строит статический график с использованием Matplotlib
         
@@ -343,88 +317,80 @@ class CryptoAssistant:
             symbol (str): Торговая пара
             timeframe (str): Таймфрейм
             save_path (str): Путь для сохранения графика
+            show (bool): Показать график (в интерактивном режиме)
+            ote_zones (list, optional): OTE зоны из результата анализа, чтобы не искать их повторно
             
         Returns:
             bool: True если график построен, иначе False
         """
+        if ote_zones is None:
+            ote_zones = smc.find_optimal_trade_entry()
+        
         try:
             # Создаем фигуру и оси
             fig, ax = plt.subplots(figsize=(16, 8))
             
-            # Рисуем свечи
-            for i in range(len(df)):
-                open_price = df['open'].iloc[i]
-                close_price = df['close'].iloc[i]
-                high_price = df['high'].iloc[i]
-                low_price = df['low'].iloc[i]
-                
-                color = 'green' if close_price >= open_price else 'red'
-                
-                # Тело свечи
-                ax.plot([i, i], [open_price, close_price], color=color, linewidth=4)
-                
-                # Верхний и нижний фитили
-                ax.plot([i, i], [close_price, high_price], color=color, linewidth=1)
-                ax.plot([i, i], [open_price, low_price], color=color, linewidth=1)
-            
-            # Рисуем EMA
-            ax.plot(df['ema20'], color='blue', linewidth=1, label='EMA 20')
-            ax.plot(df['ema50'], color='orange', linewidth=1, label='EMA 50')
-            ax.plot(df['ema200'], color='purple', linewidth=1.5, label='EMA 200')
-            
-            # Добавляем структуры
-            
-            # Order Blocks
-            for ob in smc.structures['ob_buy']:
-                idx = df.index.get_loc(ob['timestamp'])
-                ax.axhspan(ob['price_low'], ob['price_high'], xmin=idx/len(df), xmax=1, alpha=0.2, color=COLORS['OB_BUY'])
-            
-            for ob in smc.structures['ob_sell']:
-                idx = df.index.get_loc(ob['timestamp'])
-                ax.axhspan(ob['price_low'], ob['price_high'], xmin=idx/len(df), xmax=1, alpha=0.2, color=COLORS['OB_SELL'])
+            # Рисуем свечи: тела и фитили - по одной коллекции отрезков. При большом числе
+            # свечей соседние свечи объединяются, позиция группы - номер ее первой свечи
+            n = len(df)
+            candles = downsample_ohlc(df)
+            x = np.arange(n) if candles is df else df.index.get_indexer(candles.index)
+            opens, highs, lows, closes = candles[['open', 'high', 'low', 'close']].to_numpy().T
+            colors = UP_DOWN_RGBA[(closes < opens).astype(np.intp)]
+            
+            # Тело свечи
+            bodies = np.stack([np.column_stack([x, opens]), np.column_stack([x, closes])], axis=1)
+            ax.add_collection(LineCollection(bodies, colors=colors, linewidths=4))
+            
+            # Верхний и нижний фитили
+            wicks = np.concatenate([
+                np.stack([np.column_stack([x, closes]), np.column_stack([x, highs])], axis=1),
+                np.stack([np.column_stack([x, opens]), np.column_stack([x, lows])], axis=1)
+            ])
+            ax.add_collection(LineCollection(wicks, colors=np.concatenate([colors, colors]), linewidths=1))
+            ax.autoscale_view()
+            
+            # Рисуем EMA (по номерам свечей, как и сами свечи)
+            ax.plot(x, candles['ema20'].to_numpy(), color='blue', linewidth=1, label='EMA 20')
+            ax.plot(x, candles['ema50'].to_numpy(), color='orange', linewidth=1, label='EMA 50')
+            ax.plot(x, candles['ema200'].to_numpy(), color='purple', linewidth=1.5, label='EMA 200')
+            
+            # Зоны, уровни и маркеры структур: по одному объекту на каждый тип структур
+            
+            # Order Blocks (последние MAX_CHART_ZONES зон каждого типа, более старые - одной полосой)
+            for struct_type, color in (('ob_buy', COLORS['OB_BUY']), ('ob_sell', COLORS['OB_SELL'])):
+                zones, summary = recent_zones(smc.structures[struct_type])
+                _add_summary_band(ax, summary, color)
+                _add_spans(ax, zones, n, color, 0.2)
             
             # Линии EQH/EQL
-            for eqh in smc.structures['eqh']:
-                idx = df.index.get_loc(eqh['timestamp'])
-                ax.axhline(y=eqh['price'], xmin=idx/len(df), xmax=1, color=COLORS['EQH'], linestyle='--')
-            
-            for eql in smc.structures['eql']:
-                idx = df.index.get_loc(eql['timestamp'])
-                ax.axhline(y=eql['price'], xmin=idx/len(df), xmax=1, color=COLORS['EQL'], linestyle='--')
+            _add_levels(ax, smc.structures['eqh'], n, COLORS['EQH'])
+            _add_levels(ax, smc.structures['eql'], n, COLORS['EQL'])
             
             # BOS/BMS
-            for bos in smc.structures['bos']:
-                idx = df.index.get_loc(bos['timestamp'])
-                marker = '^' if 'up' in bos['type'] else 'v'
-                ax.plot(idx, bos['price'], marker=marker, markersize=10, color=COLORS['BOS'])
-            
-            # SC
-            for sc in smc.structures['sc']:
-                idx = df.index.get_loc(sc['timestamp'])
-                ax.plot(idx, sc['price'], marker='*', markersize=12, color=COLORS['SC'])
-            
-            # Wicks
-            for wick in smc.structures['wick']:
-                idx = df.index.get_loc(wick['timestamp'])
-                ax.plot(idx, wick['price'], marker='d', markersize=8, color=COLORS['WICK'])
-            
-            # SFP
-            for sfp in smc.structures['sfp']:
-                idx = df.index.get_loc(sfp['timestamp'])
-                ax.plot(idx, sfp['price'], marker='x', markersize=10, color=COLORS['SFP'])
+            for direction, marker in (('up', '^'), ('down', 'v')):
+                items = [bos for bos in smc.structures['bos'] if direction in bos['type']]
+                _plot_markers(ax, items, [bos['price'] for bos in items],
+                              marker=marker, markersize=10, color=COLORS['BOS'])
+            
+            # SC, Wicks, SFP
+            for struct_type, marker, size, color in (('sc', '*', 12, COLORS['SC']),
+                                                     ('wick', 'd', 8, COLORS['WICK']),
+                                                     ('sfp', 'x', 10, COLORS['SFP'])):
+                items = smc.structures[struct_type]
+                _plot_markers(ax, items, [item['price'] for item in items],
+                              marker=marker, markersize=size, color=color)
             
             # POI
-            for poi in smc.structures['poi']:
-                idx = df.index.get_loc(poi['timestamp'])
-                price = (poi['price_high'] + poi['price_low']) / 2
-                ax.plot(idx, price, marker='o', markersize=12, color=COLORS['POI'], mfc='none')
+            poi_list = smc.structures['poi']
+            _plot_markers(ax, poi_list, [(poi['price_high'] + poi['price_low']) / 2 for poi in poi_list],
+                          marker='o', markersize=12, color=COLORS['POI'], mfc='none')
             
             # Добавляем OTE зоны
-            ote_zones = smc.find_optimal_trade_entry()
-            for zone in ote_zones:
-                idx = df.index.get_loc(zone['timestamp'])
-                color = 'green' if 'buy' in zone['type'] else 'red'
-                ax.axhspan(zone['price_low'], zone['price_high'], xmin=idx/len(df), xmax=1, alpha=0.1, color=color)
+            for is_buy, color in ((True, 'green'), (False, 'red')):
+                zones, summary = recent_zones([zone for zone in ote_zones if ('buy' in zone['type']) == is_buy])
+                _add_summary_band(ax, summary, color)
+                _add_spans(ax, zones, n, color, 0.1)
             
             # Настройка графика
             ax.set_title(f'{symbol} - {timeframe}')
@@ -432,20 +398,22 @@ class CryptoAssistant:
             ax.set_ylabel('Цена')
             ax.grid(True, alpha=0.3)
             ax.legend()
-            plt.tight_layout()
+            fig.tight_layout()
             
             # Сохраняем график если нужно
             if save_path:
-                plt.savefig(save_path)
-                logger.info(f"График сохранен в {save_path}")
+                fig.savefig(save_path)
+                logger.info("График сохранен в %s", save_path)
             
-            # Показываем график
-            plt.show()
+            # Показываем график только в интерактивном режиме и освобождаем фигуру
+            if show:
+                plt.show()
+            plt.close(fig)
             
             return True
         
         except Exception as e:
-            logger.error(f"Ошибка при построении графика: {e}")
+            logger.error("Ошибка при построении графика: %s", e)
             return False
     
     def send_telegram_notification(self, message):
@@ -458,32 +426,7 @@ class CryptoAssistant:
         Returns:
             bool: True если сообщение отправлено, иначе False
         """
-        if not TELEGRAM_BOT_TOKEN or not TELEGRAM_CHAT_ID:
-            logger.warning("Не настроены Telegram уведомления. Проверьте конфигурацию.")
-            return False
-        
-        try:
-            import requests
-            
-            url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
-            data = {
-                "chat_id": TELEGRAM_CHAT_ID,
-                "text": message,
-                "parse_mode": "Markdown"
-            }
-            
-            response = requests.post(url, data=data)
-            
-            if response.status_code == 200:
-                logger.info("Уведомление в Telegram отправлено успешно")
-                return True
-            else:
-                logger.error(f"Ошибка при отправке уведомления в Telegram: {response.text}")
-                return False
-                
-        except Exception as e:
-            logger.error(f"Ошибка при отправке уведомления в Telegram: {e}")
-            return False
+        return send_telegram_notification(message)
     
     def run_continuous_analysis(self, symbols, timeframes, interval_minutes=5):
         """
@@ -494,14 +437,24 @@ class CryptoAssistant:
             timeframes (list): Список таймфреймов
             interval_minutes (int): Интервал между анализами в минутах
         """
-        logger.info(f"Запуск непрерывного анализа. Интервал: {interval_minutes} минут")
+        logger.info("Запуск непрерывного анализа. Интервал: %s минут", interval_minutes)
+        
+        pairs = [(symbol, timeframe) for symbol in symbols for timeframe in timeframes]
         
         try:
-            while True:
-                logger.info("Начинаем новый цикл анализа...")
-                
-                for symbol in symbols:
-                    for timeframe in timeframes:
+            with ThreadPoolExecutor(max_workers=min(8, len(pairs)) or 1) as executor:
+                while True:
+                    logger.info("Начинаем новый цикл анализа...")
+                    
+                    # Данные всех пар загружаются параллельно в кэш ExchangeClient,
+                    # поэтому analyze_market ниже не ждет сетевых запросов
+                    list(executor.map(lambda pair: self.exchange_client.get_ohlcv(pair[0], pair[1], DEFAULT_LIMIT),
+                                      pairs))
+                    
+                    # Уведомления цикла отправляются одним пакетом в конце цикла
+                    alerts = []
+                    chart_futures = []
+                    for symbol, timeframe in pairs:
                         # Анализируем рынок
                         analysis = self.analyze_market(symbol, timeframe)
                         
@@ -511,9 +464,9 @@ class CryptoAssistant:
                         # Получаем сетапы
                         setups = analysis['trade_setups']
                         
-                        # Если есть сетапы, отправляем уведомление и сохраняем график
+                        # Если есть сетапы, готовим уведомление и сохраняем график
                         if setups:
-                            logger.info(f"Найдены торговые сетапы для {symbol} на {timeframe}")
+                            logger.info("Найдены торговые сетапы для %s на %s", symbol, timeframe)
                             
                             # Формируем сообщение
                             message = f"*Торговый сигнал!*\n\n"
@@ -525,26 +478,38 @@ class CryptoAssistant:
                             for i, setup in enumerate(setups, 1):
                                 message += f"{i}. {setup['type']}: {setup['desc']}\n"
                             
-                            # Отправляем уведомление
-                            self.send_telegram_notification(message)
+                            alerts.append(message)
                             
-                            # Сохраняем график
+                            # Сохраняем график в пуле потоков по данным этого анализа
                             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
                             chart_path = f"charts/{symbol.replace('/', '')}_tf{timeframe}_{timestamp}.html"
-                            self.plot_chart(chart_path)
-                
-                logger.info(f"Ожидаем {interval_minutes} минут до следующего анализа...")
-                time.sleep(interval_minutes * 60)
+                            chart_futures.append(executor.submit(
+                                self._plot_plotly, self.last_analysis['df'], self.last_analysis['smc'],
+                                symbol, timeframe, chart_path, analysis['ote_zones']))
+                    
+                    # Отправляем уведомления
+                    if alerts:
+                        send_telegram_notifications(alerts)
+                    
+                    # Дожидаемся сохранения графиков до следующего цикла
+                    for chart_future in chart_futures:
+                        chart_future.result()
+                    
+                    logger.info("Ожидаем %s минут до следующего анализа...", interval_minutes)
+                    time.sleep(interval_minutes * 60)
                 
         except KeyboardInterrupt:
             logger.info("Анализ прерван пользователем")
         except Exception as e:
-            logger.error(f"Ошибка при выполнении непрерывного анализа: {e}")
+            logger.error("Ошибка при выполнении непрерывного анализа: %s", e)
     
     def backtest_strategy(self, symbol, timeframe, start_date=None, end_date=None):
         """
         Выполняет бэктестинг стратегии
         
+        Индикаторы и структуры считаются один раз по всей истории в
+        backtest.backtest_strategy, а не заново на каждой свече.
+        
         Args:
             symbol (str): Торговая пара
             timeframe (str): Таймфрейм
@@ -554,259 +519,24 @@ class CryptoAssistant:
         Returns:
             dict: Результаты бэктестинга
         """
-        logger.info(f"Запуск бэктестинга для {symbol} на {timeframe}")
-        
-        # Получаем данные
-        if start_date:
-            # Преобразуем дату в timestamp
-            start_timestamp = int(datetime.strptime(start_date, '%Y-%m-%d').timestamp() * 1000)
-            
-            # Если конечная дата не указана, берем текущую
-            if not end_date:
-                end_timestamp = int(datetime.now().timestamp() * 1000)
-            else:
-                end_timestamp = int(datetime.strptime(end_date, '%Y-%m-%d').timestamp() * 1000)
-            
-            # Получаем данные с учетом дат
-            df = self.exchange_client.get_ohlcv(symbol, timeframe, limit=1000, since=start_timestamp, end=end_timestamp)
-        else:
-            # Если даты не указаны, берем последние 500 свечей
-            df = self.exchange_client.get_ohlcv(symbol, timeframe, limit=500)
-        
-        if df is None or len(df) == 0:
-            logger.error(f"Не удалось получить данные для {symbol}")
-            return None
-        
-        # Технический анализ
-        ta = TechnicalAnalysis(df)
-        
-        # Smart Money анализ
-        smc = SmartMoneyAnalysis(ta.df)
-        
-        # Результаты торговли
-        trades = []
-        equity = 1000  # Начальный капитал
-        win_count = 0
-        loss_count = 0
-        
-        # Проходим по всем свечам
-        for i in range(50, len(df)-1):  # Начинаем с 50-й свечи для расчета индикаторов
-            # Создаем подмножество данных до текущей свечи
-            subset_df = df.iloc[:i+1].copy()
-            
-            # Технический анализ на подмножестве
-            subset_ta = TechnicalAnalysis(subset_df)
-            
-            # Smart Money анализ на подмножестве
-            subset_smc = SmartMoneyAnalysis(subset_ta.df)
-            
-            # Находим торговые сетапы
-            trade_setups = subset_smc.find_trade_setups()
-            
-            # Если найдены сетапы
-            if trade_setups:
-                for setup in trade_setups:
-                    # Проверяем, что сетап на последней свече подмножества
-                    if setup['timestamp'] == subset_df.index[-1]:
-                        # Получаем данные для следующей свечи
-                        next_candle = df.iloc[i+1]
-                        
-                        # Моделируем торговлю
-                        entry_price = next_candle['open']
-                        
-                        # Определяем направление
-                        direction = 1 if setup['type'] == 'buy_setup' else -1
-                        
-                        # Определяем стоп-лосс и тейк-профит
-                        atr = subset_df['high'].iloc[-20:].max() - subset_df['low'].iloc[-20:].min()
-                        stop_loss = entry_price - direction * atr * 0.5
-                        take_profit = entry_price + direction * atr * 1.5
-                        
-                        # Симулируем исполнение
-                        exit_price = None
-                        exit_reason = None
-                        
-                        # Проверяем следующие свечи
-                        for j in range(i+1, min(i+20, len(df))):
-                            future_candle = df.iloc[j]
-                            
-                            # Для покупки
-                            if direction == 1:
-                                # Сработал стоп-лосс
-                                if future_candle['low'] <= stop_loss:
-                                    exit_price = stop_loss
-                                    exit_reason = 'stop_loss'
-                                    break
-                                
-                                # Сработал тейк-профит
-                                if future_candle['high'] >= take_profit:
-                                    exit_price = take_profit
-                                    exit_reason = 'take_profit'
-                                    break
-                            
-                            # Для продажи
-                            else:
-                                # Сработал стоп-лосс
-                                if future_candle['high'] >= stop_loss:
-                                    exit_price = stop_loss
-                                    exit_reason = 'stop_loss'
-                                    break
-                                
-                                # Сработал тейк-профит
-                                if future_candle['low'] <= take_profit:
-                                    exit_price = take_profit
-                                    exit_reason = 'take_profit'
-                                    break
-                        
-                        # Если не было выхода из сделки, закрываем по последней цене
-                        if exit_price is None:
-                            exit_price = df.iloc[min(i+20, len(df)-1)]['close']
-                            exit_reason = 'timeout'
-                        
-                        # Расчет прибыли/убытка
-                        pnl = (exit_price - entry_price) * direction
-                        pnl_pct = pnl / entry_price * 100
-                        
-                        # Обновляем капитал
-                        equity += equity * pnl_pct / 100
-                        
-                        # Обновляем статистику
-                        if pnl > 0:
-                            win_count += 1
-                        else:
-                            loss_count += 1
-                        
-                        # Записываем сделку
-                        trades.append({
-                            'timestamp': setup['timestamp'],
-                            'type': setup['type'],
-                            'entry_price': entry_price,
-                            'exit_price': exit_price,
-                            'exit_reason': exit_reason,
-                            'pnl': pnl,
-                            'pnl_pct': pnl_pct,
-                            'equity': equity
-                        })
-        
-        # Подводим итоги бэктестинга
-        total_trades = len(trades)
-        win_rate = win_count / total_trades * 100 if total_trades > 0 else 0
-        avg_profit = sum(trade['pnl_pct'] for trade in trades) / total_trades if total_trades > 0 else 0
-        
-        # Расчет просадки
-        max_equity = 1000
-        max_drawdown = 0
-        
-        for trade in trades:
-            max_equity = max(max_equity, trade['equity'])
-            drawdown = (max_equity - trade['equity']) / max_equity * 100
-            max_drawdown = max(max_drawdown, drawdown)
-        
-        # Результаты бэктестинга
-        backtest_result = {
-            'symbol': symbol,
-            'timeframe': timeframe,
-            'start_date': df.index[0],
-            'end_date': df.index[-1],
-            'total_trades': total_trades,
-            'win_count': win_count,
-            'loss_count': loss_count,
-            'win_rate': win_rate,
-            'avg_profit': avg_profit,
-            'final_equity': equity,
-            'roi': (equity - 1000) / 1000 * 100,
-            'max_drawdown': max_drawdown,
-            'trades': trades
-        }
-        
-        return backtest_result
+        return backtest_strategy(self.exchange_client, symbol, timeframe, start_date, end_date)
         
-    def plot_backtest_results(self, backtest_result, save_path=None):
+    def plot_backtest_results(self, backtest_result, save_path=None, show=False):
         """
         Визуализирует результаты бэктестинга
         
-        Args:
-            backtest_result (dict): Результаты бэктестинга
-            save_path (str): Путь для сохранения графика
-            
-        Returns:
-            bool: True если график построен, иначе False
-        """
-        if not backtest_result or not backtest_result['trades']:
-            logger.error("Нет данных для построения графика")
-            return False
-        
-        try:
-            # Создаем график
-            fig, (ax1, ax2) = pltdef plot_backtest_results(self, backtest_result, save_path=None):
-        """
-        Визуализирует результаты бэктестинга
+        Сделки бэктеста - структурированный массив, поэтому график строится по
+        колонкам в backtest.plot_backtest_results.
         
         Args:
             backtest_result (dict): Результаты бэктестинга
             save_path (str): Путь для сохранения графика
+            show (bool): Показать график (в интерактивном режиме)
             
         Returns:
             bool: True если график построен, иначе False
         """
-        if not backtest_result or not backtest_result['trades']:
-            logger.error("Нет данных для построения графика")
-            return False
-        
-        try:
-            # Создаем график
-            fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(16, 12), gridspec_kw={'height_ratios': [3, 1]})
-            
-            # Подготавливаем данные для графика
-            trades = backtest_result['trades']
-            dates = [trade['timestamp'] for trade in trades]
-            equity = [trade['equity'] for trade in trades]
-            
-            # График капитала
-            ax1.plot(dates, equity, 'b-', linewidth=2)
-            ax1.set_title(f"Результаты бэктестинга для {backtest_result['symbol']} на {backtest_result['timeframe']}")
-            ax1.set_ylabel('Капитал')
-            ax1.grid(True, alpha=0.3)
-            
-            # График сделок
-            for trade in trades:
-                color = 'green' if trade['pnl'] > 0 else 'red'
-                marker = '^' if trade['type'] == 'buy_setup' else 'v'
-                ax1.scatter(trade['timestamp'], trade['equity'], color=color, marker=marker, s=100)
-            
-            # График прибыли/убытка
-            pnl = [trade['pnl_pct'] for trade in trades]
-            colors = ['green' if p > 0 else 'red' for p in pnl]
-            ax2.bar(dates, pnl, color=colors)
-            ax2.set_ylabel('Прибыль/убыток (%)')
-            ax2.set_xlabel('Время')
-            ax2.grid(True, alpha=0.3)
-            
-            # Добавляем статистику на график
-            stats_text = f"Всего сделок: {backtest_result['total_trades']}\n"
-            stats_text += f"Win Rate: {backtest_result['win_rate']:.2f}%\n"
-            stats_text += f"Средняя прибыль: {backtest_result['avg_profit']:.2f}%\n"
-            stats_text += f"ROI: {backtest_result['roi']:.2f}%\n"
-            stats_text += f"Макс. просадка: {backtest_result['max_drawdown']:.2f}%"
-            
-            ax1.text(0.02, 0.95, stats_text, transform=ax1.transAxes, fontsize=10,
-                    verticalalignment='top', bbox=dict(boxstyle='round', facecolor='white', alpha=0.5))
-            
-            plt.tight_layout()
-            
-            # Сохраняем график если нужно
-            if save_path:
-                plt.savefig(save_path)
-                logger.info(f"График результатов бэктестинга сохранен в {save_path}")
-            
-            # Показываем график
-            plt.show()
-            
-            return True
-            
-        except Exception as e:
-            logger.error(f"Ошибка при построении графика результатов бэктестинга: {e}")
-            return False
+        return plot_backtest_results(backtest_result, save_path, show)
 
 
 def parse_args():
@@ -846,6 +576,92 @@ def parse_args():
     return parser.parse_args()
 
 
+def _run_analyze(assistant, args):
+    """
+    Выполняет команду 'analyze'
+    
+    Args:
+        assistant (CryptoAssistant): Объект CryptoAssistant
+        args (argparse.Namespace): Аргументы командной строки
+    """
+    # Анализируем рынок
+    result = assistant.analyze_market(args.symbol, args.timeframe, args.limit)
+    
+    if result:
+        print(f"\nАнализ рынка для {args.symbol} на таймфрейме {args.timeframe} завершен.")
+        print(f"Текущая цена: {result['last_price']}")
+        print(f"Контекст рынка: {result['market_context']}")
+        
+        if result['trade_setups']:
+            print("\nНайденные торговые сетапы:")
+            for i, setup in enumerate(result['trade_setups'], 1):
+                print(f"{i}. {setup['type']}: {setup['desc']}")
+        else:
+            print("\nТорговые сетапы не найдены.")
+        
+        if result['ote_zones']:
+            print("\nОптимальные зоны для входа:")
+            for i, zone in enumerate(result['ote_zones'], 1):
+                print(f"{i}. {zone['type']}: {zone['price_low']} - {zone['price_high']}")
+        else:
+            print("\nОптимальные зоны для входа не найдены.")
+        
+        # Строим график если нужно
+        if args.plot:
+            assistant.plot_chart(args.output, show=True)
+
+def _run_monitor(assistant, args):
+    """
+    Выполняет команду 'monitor'
+    
+    Args:
+        assistant (CryptoAssistant): Объект CryptoAssistant
+        args (argparse.Namespace): Аргументы командной строки
+    """
+    # Запускаем непрерывный анализ
+    assistant.run_continuous_analysis(args.symbols, args.timeframes, args.interval)
+
+def _run_backtest(assistant, args):
+    """
+    Выполняет команду 'backtest'
+    
+    Args:
+        assistant (CryptoAssistant): Объект CryptoAssistant
+        args (argparse.Namespace): Аргументы командной строки
+    """
+    # Выполняем бэктестинг
+    result = assistant.backtest_strategy(args.symbol, args.timeframe, args.start_date, args.end_date)
+    
+    if result:
+        print(f"\nБэктестинг для {args.symbol} на таймфрейме {args.timeframe} завершен.")
+        print(f"Всего сделок: {result['total_trades']}")
+        print(f"Win Rate: {result['win_rate']:.2f}%")
+        print(f"Средняя прибыль: {result['avg_profit']:.2f}%")
+        print(f"Средняя задержка подтверждения сетапа: {result['avg_signal_delay']:.1f} свечей")
+        print(f"ROI: {result['roi']:.2f}%")
+        print(f"Макс. просадка: {result['max_drawdown']:.2f}%")
+        
+        # Строим график если нужно
+        if args.plot:
+            assistant.plot_backtest_results(result, args.output, show=True)
+
+def _run_help(assistant, args):
+    """
+    Сообщает, что команда не указана
+    
+    Args:
+        assistant (CryptoAssistant): Объект CryptoAssistant
+        args (argparse.Namespace): Аргументы командной строки
+    """
+    print("Команда не указана. Используйте --help для получения справки.")
+
+# Обработчики команд по имени команды
+COMMANDS = {
+    'analyze': _run_analyze,
+    'monitor': _run_monitor,
+    'backtest': _run_backtest
+}
+
 def main():
     """
     Основная функция для запуска из командной строки
@@ -855,55 +671,7 @@ def main():
     # Создаем объект CryptoAssistant
     assistant = CryptoAssistant()
     
-    if args.command == 'analyze':
-        # Анализируем рынок
-        result = assistant.analyze_market(args.symbol, args.timeframe, args.limit)
-        
-        if result:
-            print(f"\nАнализ рынка для {args.symbol} на таймфрейме {args.timeframe} завершен.")
-            print(f"Текущая цена: {result['last_price']}")
-            print(f"Контекст рынка: {result['market_context']}")
-            
-            if result['trade_setups']:
-                print("\nНайденные торговые сетапы:")
-                for i, setup in enumerate(result['trade_setups'], 1):
-                    print(f"{i}. {setup['type']}: {setup['desc']}")
-            else:
-                print("\nТорговые сетапы не найдены.")
-            
-            if result['ote_zones']:
-                print("\nОптимальные зоны для входа:")
-                for i, zone in enumerate(result['ote_zones'], 1):
-                    print(f"{i}. {zone['type']}: {zone['price_low']} - {zone['price_high']}")
-            else:
-                print("\nОптимальные зоны для входа не найдены.")
-            
-            # Строим график если нужно
-            if args.plot:
-                assistant.plot_chart(args.output)
-        
-    elif args.command == 'monitor':
-        # Запускаем непрерывный анализ
-        assistant.run_continuous_analysis(args.symbols, args.timeframes, args.interval)
-        
-    elif args.command == 'backtest':
-        # Выполняем бэктестинг
-        result = assistant.backtest_strategy(args.symbol, args.timeframe, args.start_date, args.end_date)
-        
-        if result:
-            print(f"\nБэктестинг для {args.symbol} на таймфрейме {args.timeframe} завершен.")
-            print(f"Всего сделок: {result['total_trades']}")
-            print(f"Win Rate: {result['win_rate']:.2f}%")
-            print(f"Средняя прибыль: {result['avg_profit']:.2f}%")
-            print(f"ROI: {result['roi']:.2f}%")
-            print(f"Макс. просадка: {result['max_drawdown']:.2f}%")
-            
-            # Строим график если нужно
-            if args.plot:
-                assistant.plot_backtest_results(result, args.output)
-    
-    else:
-        print("Команда не указана. Используйте --help для получения справки.")
+    COMMANDS.get(args.command, _run_help)(assistant, args)
 
 
 if __name__ == '__main__':
@@ -3,9 +3,12 @@
 Пример мультитаймфреймного анализа нескольких криптовалют
 """
 
+import io
 import os
 import sys
 import argparse
+import itertools
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from tabulate import tabulate
 
@@ -16,6 +19,12 @@ from exchange import ExchangeClient
 from analysis import TechnicalAnalysis, SmartMoneyAnalysis
 from config import DEFAULT_EXCHANGE
 
+# Тип сетапов, совпадающих с трендом, и соответствующая рекомендация
+TREND_DIRECTIONS = {
+    "Восходящий": ("buy_setup", "ПОКУПКА"),
+    "Нисходящий": ("sell_setup", "ПРОДАЖА")
+}
+
 def format_price(price):
     """Форматирует цену для вывода с разделителями разрядов"""
     return f"{price:,.2f}" if price >= 1 else f"{price:.8f}"
@@ -35,13 +44,15 @@ def analyze_multi_timeframe(symbols, timeframes, exchange_id=DEFAULT_EXCHANGE):
     # Сохраняем результаты анализа
     all_results = []
     
-    for symbol in symbols:
-        for timeframe in timeframes:
+    # Данные всех пар загружаются параллельно: время загрузки определяется сетевыми запросами,
+    # анализ выполняется последовательно в порядке пар
+    pairs = list(itertools.product(symbols, timeframes))
+    with ThreadPoolExecutor(max_workers=min(8, len(pairs)) or 1) as executor:
+        frames = executor.map(lambda pair: exchange.get_ohlcv(pair[0], pair[1], 200), pairs)
+        
+        for (symbol, timeframe), df in zip(pairs, frames):
             print(f"Анализируем {symbol} на таймфрейме {timeframe}...")
             
-            # Получаем OHLCV данные
-            df = exchange.get_ohlcv(symbol, timeframe, 200)
-            
             if df is None or len(df) == 0:
                 print(f"Не удалось получить данные для {symbol} на таймфрейме {timeframe}")
                 continue
@@ -52,41 +63,32 @@ def analyze_multi_timeframe(symbols, timeframes, exchange_id=DEFAULT_EXCHANGE):
             # Smart Money анализ
             smc = SmartMoneyAnalysis(ta.df)
             
-            # Находим торговые сетапы
-            trade_setups = smc.find_trade_setups()
-            
-            # Получаем текущий контекст рынка
-            market_context = smc.get_current_market_context()
-            
-            # Находим оптимальные зоны для входа
-            ote_zones = smc.find_optimal_trade_entry()
+            # Торговые сетапы, текущий контекст рынка и оптимальные зоны для входа
+            smc_out = smc.analyze_all()
+            trade_setups = smc_out['setups']
+            market_context = smc_out['context']
+            ote_zones = smc_out['ote_zones']
             
             # Собираем рекомендацию
             recommendation = "НЕЙТРАЛЬНО"
             reason = "Нет явных сигналов"
             
-            # Если есть сетапы
-            if trade_setups:
-                # Проверяем соответствие сетапов тренду
-                trend = market_context['trend']
-                
-                buy_setups = [s for s in trade_setups if "buy" in s['type'].lower()]
-                sell_setups = [s for s in trade_setups if "sell" in s['type'].lower()]
-                
-                if buy_setups and trend == "Восходящий":
-                    recommendation = "ПОКУПКА"
-                    reason = buy_setups[0]['desc']
-                elif sell_setups and trend == "Нисходящий":
-                    recommendation = "ПРОДАЖА"
-                    reason = sell_setups[0]['desc']
+            # Рекомендацию дает первый сетап по направлению тренда, остальные не просматриваются
+            direction = TREND_DIRECTIONS.get(market_context['trend'])
+            if direction is not None:
+                setup_type, label = direction
+                setup = next((s for s in trade_setups if s['type'] == setup_type), None)
+                if setup is not None:
+                    recommendation = label
+                    reason = setup['desc']
             
             # Добавляем результат в общий список
             all_results.append({
                 'symbol': symbol,
                 'timeframe': timeframe,
-                'price': df['close'].iloc[-1],
+                'price': df['close'].iat[-1],
                 'trend': market_context['trend'],
-                'rsi': ta.df['rsi'].iloc[-1],
+                'rsi': ta.df['rsi'].iat[-1],
                 'trade_setups_count': len(trade_setups),
                 'ote_zones_count': len(ote_zones),
                 'nearest_support': market_context['nearest_support'],
@@ -97,9 +99,11 @@ def analyze_multi_timeframe(symbols, timeframes, exchange_id=DEFAULT_EXCHANGE):
     
     # Выводим результаты в виде таблицы
     if all_results:
-        print("\n" + "=" * 80)
-        print(f"Мультитаймфреймный анализ - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-        print("=" * 80)
+        # Отчет собирается в памяти и выводится одной записью
+        report = io.StringIO()
+        print("\n" + "=" * 80, file=report)
+        print(f"Мультитаймфреймный анализ - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", file=report)
+        print("=" * 80, file=report)
         
         # Преобразуем результаты для вывода в таблицу
         table_data = []
@@ -117,13 +121,15 @@ def analyze_multi_timeframe(symbols, timeframes, exchange_id=DEFAULT_EXCHANGE):
         
         # Выводим таблицу с результатами
         headers = ['Символ', 'Таймфрейм', 'Цена', 'Тренд', 'RSI', 'Сетапы', 'OTE Зоны', 'Рекомендация']
-        print(tabulate(table_data, headers=headers, tablefmt='psql'))
+        print(tabulate(table_data, headers=headers, tablefmt='psql'), file=report)
         
         # Выводим подробности по рекомендациям
-        print("\nПодробности по рекомендациям:")
+        print("\nПодробности по рекомендациям:", file=report)
         for result in all_results:
             if result['recommendation'] != "НЕЙТРАЛЬНО":
-                print(f"{result['symbol']} ({result['timeframe']}): {result['recommendation']} - {result['reason']}")
+                print(f"{result['symbol']} ({result['timeframe']}): {result['recommendation']} - {result['reason']}", file=report)
+        
+        sys.stdout.write(report.getvalue())
     else:
         print("Не удалось получить результаты анализа")
 
@@ -1,9 +1,24 @@
 import logging
+import re
 import requests
+from requests.adapters import HTTPAdapter
 from config import TELEGRAM_BOT_TOKEN, TELEGRAM_CHAT_ID
 
 logger = logging.getLogger("CryptoAssistant.Notification")
 
+# Максимальная длина текста одного сообщения Telegram
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+# Таймаут запроса к Telegram API в секундах, чтобы зависший запрос не останавливал мониторинг
+TELEGRAM_TIMEOUT = 5
+
+# Символы разметки Markdown: сообщения без них отправляются простым текстом
+_MARKDOWN_CHARS = re.compile(r'[*_`\[]')
+
+# Одна HTTP сессия на все уведомления: соединение с api.telegram.org переиспользуется
+_session = requests.Session()
+_session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=4))
+
 def send_telegram_notification(message):
     """
     Отправляет уведомление в Telegram
@@ -22,23 +37,76 @@ def send_telegram_notification(message):
         url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
         data = {
             "chat_id": TELEGRAM_CHAT_ID,
-            "text": message,
-            "parse_mode": "Markdown"
+            "text": message
         }
+        if _MARKDOWN_CHARS.search(message):
+            data["parse_mode"] = "Markdown"
+        
+        response = _session.post(url, data=data, timeout=TELEGRAM_TIMEOUT)
         
-        response = requests.post(url, data=data)
+        # Telegram отклоняет сообщение с некорректной разметкой (400 "can't parse entities"),
+        # тогда оно повторно отправляется простым текстом, чтобы уведомление не потерялось
+        if response.status_code == 400 and "parse_mode" in data and "can't parse entities" in response.text:
+            logger.warning("Telegram не смог разобрать Markdown, отправляем простым текстом: %s", response.text)
+            del data["parse_mode"]
+            response = _session.post(url, data=data, timeout=TELEGRAM_TIMEOUT)
         
         if response.status_code == 200:
             logger.info("Уведомление в Telegram отправлено успешно")
             return True
         else:
-            logger.error(f"Ошибка при отправке уведомления в Telegram: {response.text}")
+            logger.error("Ошибка при отправке уведомления в Telegram: %s", response.text)
             return False
             
     except Exception as e:
-        logger.error(f"Ошибка при отправке уведомления в Telegram: {e}")
+        logger.error("Ошибка при отправке уведомления в Telegram: %s", e)
         return False
 
+def _split_message(message, limit=TELEGRAM_MESSAGE_LIMIT):
+    """
+    Разбивает текст на части не длиннее ограничения Telegram по границам строк
+    
+    Args:
+        message (str): Текст сообщения
+        limit (int): Максимальная длина части
+        
+    Returns:
+        list: Части сообщения (строка длиннее ограничения разрезается по длине)
+    """
+    parts = []
+    for line in message.split("\n"):
+        for start in range(0, max(len(line), 1), limit):
+            piece = line[start:start + limit]
+            if parts and start == 0 and len(parts[-1]) + 1 + len(piece) <= limit:
+                parts[-1] += "\n" + piece
+            else:
+                parts.append(piece)
+    return parts
+
+def send_telegram_notifications(messages, separator="\n---\n"):
+    """
+    Отправляет несколько уведомлений в Telegram минимальным числом сообщений
+    
+    Уведомления объединяются в сообщения, не превышающие ограничение Telegram
+    на длину текста, слишком длинные уведомления предварительно разбиваются по строкам.
+    
+    Args:
+        messages (list): Тексты уведомлений
+        separator (str): Разделитель между уведомлениями в одном сообщении
+        
+    Returns:
+        bool: True если все сообщения отправлены, иначе False
+    """
+    batches = []
+    for message in (part for message in messages for part in _split_message(message)):
+        if batches and len(batches[-1]) + len(separator) + len(message) <= TELEGRAM_MESSAGE_LIMIT:
+            batches[-1] += separator + message
+        else:
+            batches.append(message)
+    
+    sent = [send_telegram_notification(batch) for batch in batches]
+    return all(sent)
+
 def send_email_notification(subject, message, to_email):
     """
     Отправляет уведомление по электронной почте
@@ -8,7 +8,6 @@ import sys
 import logging
 from dotenv import load_dotenv
 from tabulate import tabulate
-from exchange import ExchangeClient
 
 # Настройка логирования
 logging.basicConfig(
@@ -24,22 +23,24 @@ def test_exchange_connection(exchange_id):
     Args:
         exchange_id (str): ID биржи (binance, bybit, mexc)
     """
+    # ccxt загружается только когда есть биржа для проверки (импорт занимает около 0.5 с)
+    from exchange import ExchangeClient
+    
     try:
-        logger.info(f"Тестирование соединения с биржей {exchange_id}...")
+        logger.info("Тестирование соединения с биржей %s...", exchange_id)
         exchange = ExchangeClient(exchange_id)
         
         # Проверка соединения путем получения списка торговых пар
         symbols = exchange.get_available_symbols()
         
         if not symbols:
-            logger.error(f"Не удалось получить список торговых пар для {exchange_id}")
+            logger.error("Не удалось получить список торговых пар для %s", exchange_id)
             return False
         
         # Выводим первые 10 торговых пар
-        logger.info(f"Соединение с {exchange_id} установлено успешно!")
+        logger.info("Соединение с %s установлено успешно!", exchange_id)
         print(f"\nДоступные торговые пары на {exchange_id.capitalize()} (первые 10):")
-        for i, symbol in enumerate(symbols[:10], 1):
-            print(f"{i}. {symbol}")
+        print("\n".join(f"{i}. {symbol}" for i, symbol in enumerate(symbols[:10], 1)))
         
         # Проверяем получение OHLCV данных для BTC/USDT
         if "BTC/USDT" in symbols:
@@ -65,7 +66,7 @@ def test_exchange_connection(exchange_id):
         return True
     
     except Exception as e:
-        logger.error(f"Ошибка при тестировании соединения с {exchange_id}: {e}")
+        logger.error("Ошибка при тестировании соединения с %s: %s", exchange_id, e)
         return False
 
 def main():
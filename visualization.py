@@ -1,15 +1,221 @@
+import os
+import sys
+import logging
+import matplotlib
+
+# На сервере без дисплея графики только сохраняются в файлы: сразу выбираем backend Agg,
+# чтобы pyplot не пытался подключить оконный интерфейс (явно заданный MPLBACKEND не трогаем)
+if (sys.platform.startswith('linux') and 'MPLBACKEND' not in os.environ
+        and not os.environ.get('DISPLAY') and not os.environ.get('WAYLAND_DISPLAY')):
+    matplotlib.use('Agg')
+
 import matplotlib.pyplot as plt
+from matplotlib.collections import LineCollection, PolyCollection
+from matplotlib.colors import to_rgba
 import plotly.graph_objects as go
+import plotly.io as pio
 import pandas as pd
 import numpy as np
-import os
-from datetime import datetime
-import logging
-from config import COLORS
+from config import COLORS, MAX_CHART_CANDLES, MAX_CHART_ZONES
 
 # Настройка логирования
 logger = logging.getLogger("CryptoAssistant.Visualization")
 
+# Шаблон графиков Plotly задается один раз по умолчанию: новые фигуры получают уже
+# загруженный шаблон, и он не проверяется и не копируется заново при каждом построении
+pio.templates.default = 'plotly_white'
+
+# Цвета роста и падения в RGBA: массив цветов свечей и сделок собирается индексированием,
+# без разбора имени цвета для каждой свечи при создании коллекции
+UP_DOWN_RGBA = np.array([to_rgba('green'), to_rgba('red')])
+
+# Общие параметры layout графиков Plotly
+CHART_LAYOUT = dict(
+    xaxis_title='Время',
+    yaxis_title='Цена',
+    height=800,
+    width=1200,
+    showlegend=True
+)
+
+def downsample_ohlc(df, max_candles=MAX_CHART_CANDLES):
+    """
+    Объединяет соседние свечи, чтобы на графике было не больше max_candles свечей
+    
+    Каждая группа свечей заменяется одной свечой (открытие первой, максимум,
+    минимум, закрытие последней), поэтому экстремумы и фитили сохраняются.
+    EMA берутся на закрытии группы.
+    
+    Args:
+        df (pd.DataFrame): DataFrame с OHLC данными и индикаторами
+        max_candles (int): Максимальное количество свечей
+        
+    Returns:
+        pd.DataFrame: DataFrame для отображения (исходный, если свечей немного)
+    """
+    n = len(df)
+    if n <= max_candles:
+        return df
+    
+    step = -(-n // max_candles)
+    starts = np.arange(0, n, step)
+    ends = np.minimum(starts + step, n) - 1
+    
+    data = {
+        'open': df['open'].to_numpy()[starts],
+        'high': np.maximum.reduceat(df['high'].to_numpy(), starts),
+        'low': np.minimum.reduceat(df['low'].to_numpy(), starts),
+        'close': df['close'].to_numpy()[ends]
+    }
+    for column in ('ema20', 'ema50', 'ema200'):
+        if column in df.columns:
+            data[column] = df[column].to_numpy()[ends]
+    
+    return pd.DataFrame(data, index=df.index[starts])
+
+def recent_zones(zones, max_zones=MAX_CHART_ZONES):
+    """
+    Оставляет для отображения последние max_zones зон, более старые объединяет в одну полосу
+    
+    Старые зоны одного типа перекрываются и на графике сливаются в сплошную полосу,
+    поэтому вместо них рисуется одна полоса от первой до последней из них по
+    времени и от минимальной до максимальной цены.
+    
+    Args:
+        zones (list): Зоны с индексами свечей и границами price_low/price_high
+        max_zones (int): Максимальное количество отдельно рисуемых зон
+        
+    Returns:
+        tuple: (последние зоны, словарь полосы старых зон или None)
+    """
+    if len(zones) <= max_zones:
+        return zones, None
+    
+    zones = sorted(zones, key=lambda zone: zone['index'])
+    omitted = zones[:-max_zones]
+    summary = {
+        'index': omitted[0]['index'],
+        'timestamp': omitted[0]['timestamp'],
+        'end_index': omitted[-1]['index'],
+        'end_timestamp': omitted[-1]['timestamp'],
+        'price_low': min(zone['price_low'] for zone in omitted),
+        'price_high': max(zone['price_high'] for zone in omitted),
+        'count': len(omitted)
+    }
+    return zones[-max_zones:], summary
+
+def _marker_trace(items, name, y, **marker):
+    """
+    Строит одну WebGL трассу маркеров для всех структур одного типа
+    
+    Args:
+        items (list): Структуры с временными метками
+        name (str): Название трассы в легенде
+        y (list): Цены маркеров
+        **marker: Параметры маркеров (symbol, color, size, line)
+        
+    Returns:
+        go.Scattergl: Трасса маркеров
+    """
+    return go.Scattergl(
+        x=[item['timestamp'] for item in items],
+        y=y,
+        mode='markers',
+        marker=marker,
+        name=name
+    )
+
+def _summary_shapes(summary, color, name):
+    """
+    Строит фигуру Plotly для полосы старых зон
+    
+    Args:
+        summary (dict): Полоса старых зон из recent_zones или None
+        color (str): Цвет зон
+        name (str): Название типа зон
+        
+    Returns:
+        list: Список из одной фигуры или пустой список
+    """
+    if summary is None:
+        return []
+    return [dict(
+        type="rect",
+        x0=summary['timestamp'],
+        y0=summary['price_low'],
+        x1=summary['end_timestamp'],
+        y1=summary['price_high'],
+        line=dict(width=0),
+        fillcolor=color,
+        opacity=0.05,
+        layer='below',
+        name=f"{name}: еще {summary['count']}"
+    )]
+
+def _add_summary_band(ax, summary, color):
+    """
+    Добавляет на график Matplotlib полосу старых зон
+    
+    Args:
+        ax (matplotlib.axes.Axes): Оси графика
+        summary (dict): Полоса старых зон из recent_zones или None
+        color (str): Цвет зон
+    """
+    if summary is None:
+        return
+    verts = [(summary['index'], summary['price_low']), (summary['end_index'], summary['price_low']),
+             (summary['end_index'], summary['price_high']), (summary['index'], summary['price_high'])]
+    ax.add_collection(PolyCollection([verts], facecolors=color, edgecolors='none', alpha=0.05), autolim=False)
+
+def _add_spans(ax, items, n, colors, alpha):
+    """
+    Добавляет горизонтальные зоны от свечи структуры до правого края графика одной коллекцией
+    
+    Args:
+        ax (matplotlib.axes.Axes): Оси графика
+        items (list): Структуры с индексами свечей и границами price_low/price_high
+        n (int): Количество свечей на графике
+        colors (str or list): Цвет зон или цвета для каждой зоны
+        alpha (float): Прозрачность зон
+    """
+    if not items:
+        return
+    # Как у axhspan: координата x в долях ширины осей, y - в ценах
+    verts = [[(item['index'] / n, item['price_low']), (1, item['price_low']),
+              (1, item['price_high']), (item['index'] / n, item['price_high'])] for item in items]
+    ax.add_collection(PolyCollection(verts, facecolors=colors, edgecolors=colors, alpha=alpha,
+                                     transform=ax.get_yaxis_transform()), autolim=False)
+
+def _add_levels(ax, items, n, color):
+    """
+    Добавляет пунктирные уровни от свечи структуры до правого края графика одной коллекцией
+    
+    Args:
+        ax (matplotlib.axes.Axes): Оси графика
+        items (list): Структуры с индексами свечей и ценами уровней
+        n (int): Количество свечей на графике
+        color (str): Цвет уровней
+    """
+    if not items:
+        return
+    # Как у axhline: координата x в долях ширины осей, y - в ценах
+    segments = [[(item['index'] / n, item['price']), (1, item['price'])] for item in items]
+    ax.add_collection(LineCollection(segments, colors=color, linestyles='--',
+                                     transform=ax.get_yaxis_transform()), autolim=False)
+
+def _plot_markers(ax, items, y, **style):
+    """
+    Рисует маркеры всех структур одного типа одной линией без соединяющих отрезков
+    
+    Args:
+        ax (matplotlib.axes.Axes): Оси графика
+        items (list): Структуры с индексами свечей
+        y (list): Цены маркеров
+        **style: Параметры маркеров (marker, markersize, color, mfc)
+    """
+    if items:
+        ax.plot([item['index'] for item in items], y, linestyle='none', **style)
+
 class ChartVisualizer:
     """
     Класс для визуализации графиков и результатов анализа
@@ -26,7 +232,8 @@ class ChartVisualizer:
         # Создаем директорию для сохранения графиков, если её нет
         os.makedirs(save_dir, exist_ok=True)
     
-    def plot_with_plotly(self, df, smc_structures, symbol, timeframe, save_path=None):
+    def plot_with_plotly(self, df, smc_structures, symbol, timeframe, save_path=None, show=False,
+                         max_candles=MAX_CHART_CANDLES):
         """
         Строит интерактивный график с использованием Plotly
         
@@ -36,220 +243,155 @@ class ChartVisualizer:
             symbol (str): Торговая пара
             timeframe (str): Таймфрейм
             save_path (str): Путь для сохранения графика
+            show (bool): Показать график (в интерактивном режиме)
+            max_candles (int): Максимум свечей на графике, при большем числе соседние свечи объединяются
             
         Returns:
             bool: True если график построен, иначе False
         """
         try:
-            # Создаем график свечей
+            # Создаем график свечей (при большом числе свечей соседние свечи объединяются)
+            candles = downsample_ohlc(df, max_candles)
+            # Plotly получает массивы NumPy, общий для всех трасс массив времени берется один раз
+            x = candles.index.to_numpy()
             fig = go.Figure(data=[go.Candlestick(
-                x=df.index,
-                open=df['open'],
-                high=df['high'],
-                low=df['low'],
-                close=df['close'],
+                x=x,
+                open=candles['open'].to_numpy(),
+                high=candles['high'].to_numpy(),
+                low=candles['low'].to_numpy(),
+                close=candles['close'].to_numpy(),
                 name='Цена'
             )])
             
             # Добавляем EMA
-            if 'ema20' in df.columns:
+            if 'ema20' in candles.columns:
                 fig.add_trace(go.Scatter(
-                    x=df.index,
-                    y=df['ema20'],
+                    x=x,
+                    y=candles['ema20'].to_numpy(),
                     line=dict(color='blue', width=1),
                     name='EMA 20'
                 ))
             
-            if 'ema50' in df.columns:
+            if 'ema50' in candles.columns:
                 fig.add_trace(go.Scatter(
-                    x=df.index,
-                    y=df['ema50'],
+                    x=x,
+                    y=candles['ema50'].to_numpy(),
                     line=dict(color='orange', width=1),
                     name='EMA 50'
                 ))
             
-            if 'ema200' in df.columns:
+            if 'ema200' in candles.columns:
                 fig.add_trace(go.Scatter(
-                    x=df.index,
-                    y=df['ema200'],
+                    x=x,
+                    y=candles['ema200'].to_numpy(),
                     line=dict(color='purple', width=1.5),
                     name='EMA 200'
                 ))
             
-            # Добавляем структуры
-            
-            # Order Blocks
-            if 'ob_buy' in smc_structures:
-                for ob in smc_structures['ob_buy']:
-                    fig.add_shape(
-                        type="rect",
-                        x0=ob['timestamp'],
-                        y0=ob['price_low'],
-                        x1=df.index[-1],
-                        y1=ob['price_high'],
-                        line=dict(color=COLORS['OB_BUY'], width=1),
-                        fillcolor=COLORS['OB_BUY'],
-                        opacity=0.2,
-                        name='OB Buy'
-                    )
-            
-            if 'ob_sell' in smc_structures:
-                for ob in smc_structures['ob_sell']:
-                    fig.add_shape(
-                        type="rect",
-                        x0=ob['timestamp'],
-                        y0=ob['price_low'],
-                        x1=df.index[-1],
-                        y1=ob['price_high'],
-                        line=dict(color=COLORS['OB_SELL'], width=1),
-                        fillcolor=COLORS['OB_SELL'],
-                        opacity=0.2,
-                        name='OB Sell'
-                    )
+            # Добавляем структуры: фигуры собираются в список и передаются в layout одним вызовом,
+            # маркеры структур одного типа рисуются одной трассой
+            last_timestamp = df.index[-1]
+            shapes = []
+            
+            # Order Blocks (прямоугольники зон рисуются под свечами и не перекрывают их)
+            # Рисуются последние MAX_CHART_ZONES зон каждого типа, более старые - одной общей полосой
+            for struct_type, color, name in (('ob_buy', COLORS['OB_BUY'], 'OB Buy'),
+                                             ('ob_sell', COLORS['OB_SELL'], 'OB Sell')):
+                zones, summary = recent_zones(smc_structures.get(struct_type, []))
+                shapes.extend(_summary_shapes(summary, color, name))
+                shapes.extend(dict(
+                    type="rect",
+                    x0=ob['timestamp'],
+                    y0=ob['price_low'],
+                    x1=last_timestamp,
+                    y1=ob['price_high'],
+                    line=dict(color=color, width=1),
+                    fillcolor=color,
+                    opacity=0.2,
+                    layer='below',
+                    name=name
+                ) for ob in zones)
             
             # Линии EQH/EQL
-            if 'eqh' in smc_structures:
-                for eqh in smc_structures['eqh']:
-                    fig.add_shape(
-                        type="line",
-                        x0=eqh['timestamp'],
-                        y0=eqh['price'],
-                        x1=df.index[-1],
-                        y1=eqh['price'],
-                        line=dict(color=COLORS['EQH'], width=1, dash="dash"),
-                        name='EQH'
-                    )
-            
-            if 'eql' in smc_structures:
-                for eql in smc_structures['eql']:
-                    fig.add_shape(
-                        type="line",
-                        x0=eql['timestamp'],
-                        y0=eql['price'],
-                        x1=df.index[-1],
-                        y1=eql['price'],
-                        line=dict(color=COLORS['EQL'], width=1, dash="dash"),
-                        name='EQL'
-                    )
-            
-            # BOS/BMS
-            if 'bos' in smc_structures:
-                for bos in smc_structures['bos']:
-                    fig.add_trace(go.Scatter(
-                        x=[bos['timestamp']],
-                        y=[bos['price']],
-                        mode='markers',
-                        marker=dict(
-                            symbol='triangle-up' if 'up' in bos['type'] else 'triangle-down',
-                            color=COLORS['BOS'],
-                            size=12
-                        ),
-                        name='BOS'
-                    ))
-            
-            # SC
-            if 'sc' in smc_structures:
-                for sc in smc_structures['sc']:
-                    fig.add_trace(go.Scatter(
-                        x=[sc['timestamp']],
-                        y=[sc['price']],
-                        mode='markers',
-                        marker=dict(
-                            symbol='star',
-                            color=COLORS['SC'],
-                            size=12
-                        ),
-                        name='SC'
-                    ))
-            
-            # Wicks
-            if 'wick' in smc_structures:
-                for wick in smc_structures['wick']:
-                    fig.add_trace(go.Scatter(
-                        x=[wick['timestamp']],
-                        y=[wick['price']],
-                        mode='markers',
-                        marker=dict(
-                            symbol='diamond',
-                            color=COLORS['WICK'],
-                            size=10
-                        ),
-                        name='Wick'
-                    ))
-            
-            # SFP
-            if 'sfp' in smc_structures:
-                for sfp in smc_structures['sfp']:
-                    fig.add_trace(go.Scatter(
-                        x=[sfp['timestamp']],
-                        y=[sfp['price']],
-                        mode='markers',
-                        marker=dict(
-                            symbol='x',
-                            color=COLORS['SFP'],
-                            size=12
-                        ),
-                        name='SFP'
-                    ))
-            
-            # POI
-            if 'poi' in smc_structures:
-                for poi in smc_structures['poi']:
-                    fig.add_trace(go.Scatter(
-                        x=[poi['timestamp']],
-                        y=[(poi['price_high'] + poi['price_low']) / 2],
-                        mode='markers',
-                        marker=dict(
-                            symbol='circle',
-                            color=COLORS['POI'],
-                            size=14,
-                            line=dict(width=2, color='white')
-                        ),
-                        name='POI'
-                    ))
+            for struct_type, color, name in (('eqh', COLORS['EQH'], 'EQH'), ('eql', COLORS['EQL'], 'EQL')):
+                shapes.extend(dict(
+                    type="line",
+                    x0=level['timestamp'],
+                    y0=level['price'],
+                    x1=last_timestamp,
+                    y1=level['price'],
+                    line=dict(color=color, width=1, dash="dash"),
+                    name=name
+                ) for level in smc_structures.get(struct_type, []))
             
             # Добавляем OTE зоны если есть
-            if 'ote_zones' in smc_structures:
-                for i, zone in enumerate(smc_structures['ote_zones']):
-                    color = 'green' if 'buy' in zone['type'] else 'red'
-                    fig.add_shape(
-                        type="rect",
-                        x0=zone['timestamp'],
-                        y0=zone['price_low'],
-                        x1=df.index[-1],
-                        y1=zone['price_high'],
-                        line=dict(color=color, width=1),
-                        fillcolor=color,
-                        opacity=0.1,
-                        name=f'OTE Zone {i+1}'
-                    )
+            ote_zones = smc_structures.get('ote_zones', [])
+            for is_buy, color in ((True, 'green'), (False, 'red')):
+                zones, summary = recent_zones([zone for zone in ote_zones if ('buy' in zone['type']) == is_buy])
+                shapes.extend(_summary_shapes(summary, color, 'OTE Zone'))
+                shapes.extend(dict(
+                    type="rect",
+                    x0=zone['timestamp'],
+                    y0=zone['price_low'],
+                    x1=last_timestamp,
+                    y1=zone['price_high'],
+                    line=dict(color=color, width=1),
+                    fillcolor=color,
+                    opacity=0.1,
+                    layer='below',
+                    name=f"OTE Zone ({zone['type']})"
+                ) for zone in zones)
+            
+            fig.update_layout(shapes=shapes)
+            
+            # Маркеры BOS/BMS, SC, Wicks, SFP и POI
+            traces = []
+            
+            bos_list = smc_structures.get('bos', [])
+            if bos_list:
+                traces.append(_marker_trace(
+                    bos_list, 'BOS', [bos['price'] for bos in bos_list],
+                    symbol=['triangle-up' if 'up' in bos['type'] else 'triangle-down' for bos in bos_list],
+                    color=COLORS['BOS'], size=12))
+            
+            for struct_type, name, marker_symbol, size in (('sc', 'SC', 'star', 12),
+                                                           ('wick', 'Wick', 'diamond', 10),
+                                                           ('sfp', 'SFP', 'x', 12)):
+                items = smc_structures.get(struct_type, [])
+                if items:
+                    traces.append(_marker_trace(
+                        items, name, [item['price'] for item in items],
+                        symbol=marker_symbol, color=COLORS[name.upper()], size=size))
+            
+            poi_list = smc_structures.get('poi', [])
+            if poi_list:
+                traces.append(_marker_trace(
+                    poi_list, 'POI', [(poi['price_high'] + poi['price_low']) / 2 for poi in poi_list],
+                    symbol='circle', color=COLORS['POI'], size=14, line=dict(width=2, color='white')))
+            
+            fig.add_traces(traces)
             
             # Обновляем layout
-            fig.update_layout(
-                title=f'{symbol} - {timeframe}',
-                xaxis_title='Время',
-                yaxis_title='Цена',
-                height=800,
-                width=1200,
-                template='plotly_white',
-                showlegend=True
-            )
+            fig.update_layout(title=f'{symbol} - {timeframe}', **CHART_LAYOUT)
             
-            # Сохраняем график если нужно
+            # Сохраняем график если нужно (фигура собрана из типизированных объектов
+            # plotly, поэтому повторная проверка схемы при записи не нужна)
             if save_path:
-                fig.write_html(save_path)
-                logger.info(f"График сохранен в {save_path}")
+                fig.write_html(save_path, include_plotlyjs='cdn', validate=False)
+                logger.info("График сохранен в %s", save_path)
             
-            # Показываем график
-            fig.show()
+            # Показываем график только в интерактивном режиме
+            if show:
+                fig.show()
             
             return True
         
         except Exception as e:
-            logger.error(f"Ошибка при построении графика с Plotly: {e}")
+            logger.error("Ошибка при построении графика с Plotly: %s", e)
             return False
     
-    def plot_with_matplotlib(self, df, smc_structures, symbol, timeframe, save_path=None):
+    def plot_with_matplotlib(self, df, smc_structures, symbol, timeframe, save_path=None, show=False,
+                             max_candles=MAX_CHART_CANDLES):
         """
         Строит статический график с использованием Matplotlib
         
@@ -259,6 +401,8 @@ class ChartVisualizer:
             symbol (str): Торговая пара
             timeframe (str): Таймфрейм
             save_path (str): Путь для сохранения графика
+            show (bool): Показать график (в интерактивном режиме)
+            max_candles (int): Максимум свечей на графике, при большем числе соседние свечи объединяются
             
         Returns:
             bool: True если график построен, иначе False
@@ -267,94 +411,76 @@ class ChartVisualizer:
             # Создаем фигуру и оси
             fig, ax = plt.subplots(figsize=(16, 8))
             
-            # Рисуем свечи
-            for i in range(len(df)):
-                open_price = df['open'].iloc[i]
-                close_price = df['close'].iloc[i]
-                high_price = df['high'].iloc[i]
-                low_price = df['low'].iloc[i]
-                
-                color = 'green' if close_price >= open_price else 'red'
-                
-                # Тело свечи
-                ax.plot([i, i], [open_price, close_price], color=color, linewidth=4)
-                
-                # Верхний и нижний фитили
-                ax.plot([i, i], [close_price, high_price], color=color, linewidth=1)
-                ax.plot([i, i], [open_price, low_price], color=color, linewidth=1)
-            
-            # Рисуем EMA
-            if 'ema20' in df.columns:
-                ax.plot(df['ema20'], color='blue', linewidth=1, label='EMA 20')
-            
-            if 'ema50' in df.columns:
-                ax.plot(df['ema50'], color='orange', linewidth=1, label='EMA 50')
-            
-            if 'ema200' in df.columns:
-                ax.plot(df['ema200'], color='purple', linewidth=1.5, label='EMA 200')
+            # Рисуем свечи: тела и фитили - по одной коллекции отрезков. При большом числе
+            # свечей соседние свечи объединяются, позиция группы - номер ее первой свечи
+            n = len(df)
+            candles = downsample_ohlc(df, max_candles)
+            x = np.arange(n) if candles is df else df.index.get_indexer(candles.index)
+            opens, highs, lows, closes = candles[['open', 'high', 'low', 'close']].to_numpy().T
+            colors = UP_DOWN_RGBA[(closes < opens).astype(np.intp)]
+            
+            # Тело свечи
+            bodies = np.stack([np.column_stack([x, opens]), np.column_stack([x, closes])], axis=1)
+            ax.add_collection(LineCollection(bodies, colors=colors, linewidths=4))
+            
+            # Верхний и нижний фитили
+            wicks = np.concatenate([
+                np.stack([np.column_stack([x, closes]), np.column_stack([x, highs])], axis=1),
+                np.stack([np.column_stack([x, opens]), np.column_stack([x, lows])], axis=1)
+            ])
+            ax.add_collection(LineCollection(wicks, colors=np.concatenate([colors, colors]), linewidths=1))
+            ax.autoscale_view()
+            
+            # Рисуем EMA (по номерам свечей, как и сами свечи)
+            if 'ema20' in candles.columns:
+                ax.plot(x, candles['ema20'].to_numpy(), color='blue', linewidth=1, label='EMA 20')
+            
+            if 'ema50' in candles.columns:
+                ax.plot(x, candles['ema50'].to_numpy(), color='orange', linewidth=1, label='EMA 50')
+            
+            if 'ema200' in candles.columns:
+                ax.plot(x, candles['ema200'].to_numpy(), color='purple', linewidth=1.5, label='EMA 200')
             
             # Добавляем структуры
             
-            # Order Blocks
-            if 'ob_buy' in smc_structures:
-                for ob in smc_structures['ob_buy']:
-                    idx = df.index.get_loc(ob['timestamp'])
-                    ax.axhspan(ob['price_low'], ob['price_high'], xmin=idx/len(df), xmax=1, alpha=0.2, color=COLORS['OB_BUY'])
+            # Зоны, уровни и маркеры структур: по одному объекту на каждый тип структур
             
-            if 'ob_sell' in smc_structures:
-                for ob in smc_structures['ob_sell']:
-                    idx = df.index.get_loc(ob['timestamp'])
-                    ax.axhspan(ob['price_low'], ob['price_high'], xmin=idx/len(df), xmax=1, alpha=0.2, color=COLORS['OB_SELL'])
+            # Order Blocks (последние MAX_CHART_ZONES зон каждого типа, более старые - одной полосой)
+            for struct_type, color in (('ob_buy', COLORS['OB_BUY']), ('ob_sell', COLORS['OB_SELL'])):
+                zones, summary = recent_zones(smc_structures.get(struct_type, []))
+                _add_summary_band(ax, summary, color)
+                _add_spans(ax, zones, n, color, 0.2)
             
             # Линии EQH/EQL
-            if 'eqh' in smc_structures:
-                for eqh in smc_structures['eqh']:
-                    idx = df.index.get_loc(eqh['timestamp'])
-                    ax.axhline(y=eqh['price'], xmin=idx/len(df), xmax=1, color=COLORS['EQH'], linestyle='--')
-            
-            if 'eql' in smc_structures:
-                for eql in smc_structures['eql']:
-                    idx = df.index.get_loc(eql['timestamp'])
-                    ax.axhline(y=eql['price'], xmin=idx/len(df), xmax=1, color=COLORS['EQL'], linestyle='--')
+            _add_levels(ax, smc_structures.get('eqh', []), n, COLORS['EQH'])
+            _add_levels(ax, smc_structures.get('eql', []), n, COLORS['EQL'])
             
             # BOS/BMS
-            if 'bos' in smc_structures:
-                for bos in smc_structures['bos']:
-                    idx = df.index.get_loc(bos['timestamp'])
-                    marker = '^' if 'up' in bos['type'] else 'v'
-                    ax.plot(idx, bos['price'], marker=marker, markersize=10, color=COLORS['BOS'])
-            
-            # SC
-            if 'sc' in smc_structures:
-                for sc in smc_structures['sc']:
-                    idx = df.index.get_loc(sc['timestamp'])
-                    ax.plot(idx, sc['price'], marker='*', markersize=12, color=COLORS['SC'])
-            
-            # Wicks
-            if 'wick' in smc_structures:
-                for wick in smc_structures['wick']:
-                    idx = df.index.get_loc(wick['timestamp'])
-                    ax.plot(idx, wick['price'], marker='d', markersize=8, color=COLORS['WICK'])
-            
-            # SFP
-            if 'sfp' in smc_structures:
-                for sfp in smc_structures['sfp']:
-                    idx = df.index.get_loc(sfp['timestamp'])
-                    ax.plot(idx, sfp['price'], marker='x', markersize=10, color=COLORS['SFP'])
+            bos_list = smc_structures.get('bos', [])
+            for direction, marker in (('up', '^'), ('down', 'v')):
+                items = [bos for bos in bos_list if direction in bos['type']]
+                _plot_markers(ax, items, [bos['price'] for bos in items],
+                              marker=marker, markersize=10, color=COLORS['BOS'])
+            
+            # SC, Wicks, SFP
+            for struct_type, marker, size, color in (('sc', '*', 12, COLORS['SC']),
+                                                     ('wick', 'd', 8, COLORS['WICK']),
+                                                     ('sfp', 'x', 10, COLORS['SFP'])):
+                items = smc_structures.get(struct_type, [])
+                _plot_markers(ax, items, [item['price'] for item in items],
+                              marker=marker, markersize=size, color=color)
             
             # POI
-            if 'poi' in smc_structures:
-                for poi in smc_structures['poi']:
-                    idx = df.index.get_loc(poi['timestamp'])
-                    price = (poi['price_high'] + poi['price_low']) / 2
-                    ax.plot(idx, price, marker='o', markersize=12, color=COLORS['POI'], mfc='none')
+            poi_list = smc_structures.get('poi', [])
+            _plot_markers(ax, poi_list, [(poi['price_high'] + poi['price_low']) / 2 for poi in poi_list],
+                          marker='o', markersize=12, color=COLORS['POI'], mfc='none')
             
             # Добавляем OTE зоны если есть
-            if 'ote_zones' in smc_structures:
-                for zone in smc_structures['ote_zones']:
-                    idx = df.index.get_loc(zone['timestamp'])
-                    color = 'green' if 'buy' in zone['type'] else 'red'
-                    ax.axhspan(zone['price_low'], zone['price_high'], xmin=idx/len(df), xmax=1, alpha=0.1, color=color)
+            ote_zones = smc_structures.get('ote_zones', [])
+            for is_buy, color in ((True, 'green'), (False, 'red')):
+                zones, summary = recent_zones([zone for zone in ote_zones if ('buy' in zone['type']) == is_buy])
+                _add_summary_band(ax, summary, color)
+                _add_spans(ax, zones, n, color, 0.1)
             
             # Настройка графика
             ax.set_title(f'{symbol} - {timeframe}')
@@ -362,34 +488,37 @@ class ChartVisualizer:
             ax.set_ylabel('Цена')
             ax.grid(True, alpha=0.3)
             ax.legend()
-            plt.tight_layout()
+            fig.tight_layout()
             
             # Сохраняем график если нужно
             if save_path:
-                plt.savefig(save_path)
-                logger.info(f"График сохранен в {save_path}")
+                fig.savefig(save_path)
+                logger.info("График сохранен в %s", save_path)
             
-            # Показываем график
-            plt.show()
+            # Показываем график только в интерактивном режиме и освобождаем фигуру
+            if show:
+                plt.show()
+            plt.close(fig)
             
             return True
         
         except Exception as e:
-            logger.error(f"Ошибка при построении графика с Matplotlib: {e}")
+            logger.error("Ошибка при построении графика с Matplotlib: %s", e)
             return False
     
-    def plot_backtest_results(self, backtest_result, save_path=None):
+    def plot_backtest_results(self, backtest_result, save_path=None, show=False):
         """
         Визуализирует результаты бэктестинга
         
         Args:
             backtest_result (dict): Результаты бэктестинга
             save_path (str): Путь для сохранения графика
+            show (bool): Показать график (в интерактивном режиме)
             
         Returns:
             bool: True если график построен, иначе False
         """
-        if not backtest_result or not backtest_result.get('trades', []):
+        if not backtest_result or len(backtest_result.get('trades', [])) == 0:
             logger.error("Нет данных для построения графика")
             return False
         
@@ -397,10 +526,13 @@ class ChartVisualizer:
             # Создаем график
             fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(16, 12), gridspec_kw={'height_ratios': [3, 1]})
             
-            # Подготавливаем данные для графика
+            # Подготавливаем массивы данных для графика: колонки сделок берутся один раз
             trades = backtest_result['trades']
-            dates = [trade['timestamp'] for trade in trades]
-            equity = [trade['equity'] for trade in trades]
+            dates = trades['timestamp']
+            equity = trades['equity']
+            pnl = trades['pnl_pct']
+            is_buy = trades['type'] == 'buy_setup'
+            colors = UP_DOWN_RGBA[(pnl <= 0).astype(np.intp)]
             
             # График капитала
             ax1.plot(dates, equity, 'b-', linewidth=2)
@@ -408,15 +540,12 @@ class ChartVisualizer:
             ax1.set_ylabel('Капитал')
             ax1.grid(True, alpha=0.3)
             
-            # График сделок
-            for trade in trades:
-                color = 'green' if trade['pnl'] > 0 else 'red'
-                marker = '^' if trade['type'] == 'buy_setup' else 'v'
-                ax1.scatter(trade['timestamp'], trade['equity'], color=color, marker=marker, s=100)
+            # График сделок: по одному вызову scatter на каждый тип маркера
+            for mask, marker in ((is_buy, '^'), (~is_buy, 'v')):
+                if mask.any():
+                    ax1.scatter(dates[mask], equity[mask], c=colors[mask], marker=marker, s=100)
             
             # График прибыли/убытка
-            pnl = [trade['pnl_pct'] for trade in trades]
-            colors = ['green' if p > 0 else 'red' for p in pnl]
             ax2.bar(dates, pnl, color=colors)
             ax2.set_ylabel('Прибыль/убыток (%)')
             ax2.set_xlabel('Время')
@@ -432,20 +561,22 @@ class ChartVisualizer:
             ax1.text(0.02, 0.95, stats_text, transform=ax1.transAxes, fontsize=10,
                     verticalalignment='top', bbox=dict(boxstyle='round', facecolor='white', alpha=0.5))
             
-            plt.tight_layout()
+            fig.tight_layout()
             
             # Сохраняем график если нужно
             if save_path:
-                plt.savefig(save_path)
-                logger.info(f"График результатов бэктестинга сохранен в {save_path}")
+                fig.savefig(save_path)
+                logger.info("График результатов бэктестинга сохранен в %s", save_path)
             
-            # Показываем график
-            plt.show()
+            # Показываем график только в интерактивном режиме и освобождаем фигуру
+            if show:
+                plt.show()
+            plt.close(fig)
             
             return True
             
         except Exception as e:
-            logger.error(f"Ошибка при построении графика результатов бэктестинга: {e}")
+            logger.error("Ошибка при построении графика результатов бэктестинга: %s", e)
             return False
     
     def create_heatmap(self, df, title="Тепловая карта"):
@@ -460,8 +591,16 @@ class ChartVisualizer:
             matplotlib.figure.Figure: Объект фигуры
         """
         try:
-            # Вычисляем корреляцию
-            corr = df.corr()
+            # Вычисляем корреляцию числовых столбцов: без пропусков - одним вызовом np.corrcoef
+            # по столбцам массива, с пропусками - попарно по заполненным значениям (как df.corr)
+            numeric = df.select_dtypes(include=[np.number, 'bool'])
+            values = numeric.to_numpy(dtype=np.float64)
+            if np.isnan(values).any():
+                corr = numeric.corr().to_numpy()
+            else:
+                # Для одного столбца np.corrcoef возвращает скаляр, матрица нужна размером 1x1
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    corr = np.atleast_2d(np.corrcoef(values, rowvar=False))
             
             # Создаем тепловую карту
             fig, ax = plt.subplots(figsize=(10, 8))
@@ -469,11 +608,11 @@ class ChartVisualizer:
             plt.colorbar(cax)
             
             # Добавляем метки
-            ticks = np.arange(0, len(df.columns), 1)
+            ticks = np.arange(0, len(numeric.columns), 1)
             ax.set_xticks(ticks)
             ax.set_yticks(ticks)
-            ax.set_xticklabels(df.columns, rotation=90)
-            ax.set_yticklabels(df.columns)
+            ax.set_xticklabels(numeric.columns, rotation=90)
+            ax.set_yticklabels(numeric.columns)
             
             plt.title(title)
             plt.tight_layout()
@@ -481,5 +620,47 @@ class ChartVisualizer:
             return fig
             
         except Exception as e:
-            logger.error(f"Ошибка при создании тепловой карты: {e}")
-            return None
\ No newline at end of file
+            logger.error("Ошибка при создании тепловой карты: %s", e)
+            return None
+
+
+def plot_chart(crypto_assistant, save_path=None, show=False):
+    """
+    Строит график по результатам последнего анализа CryptoAssistant
+    
+    Args:
+        crypto_assistant: Объект CryptoAssistant с выполненным анализом
+        save_path (str): Путь для сохранения графика (.html - Plotly, иначе Matplotlib)
+        show (bool): Показать график (в интерактивном режиме)
+        
+    Returns:
+        bool: True если график построен, иначе False
+    """
+    return plot_analysis(crypto_assistant.last_analysis, save_path, show)
+
+def plot_analysis(analysis, save_path=None, show=False):
+    """
+    Строит график по результатам анализа
+    
+    Args:
+        analysis (dict): Данные и объекты анализа в формате CryptoAssistant.last_analysis
+        save_path (str или Path): Путь для сохранения графика (.html - Plotly, иначе Matplotlib)
+        show (bool): Показать график (в интерактивном режиме)
+        
+    Returns:
+        bool: True если график построен, иначе False
+    """
+    if not analysis:
+        logger.error("Нет результатов анализа для построения графика")
+        return False
+    
+    result = analysis['result']
+    visualizer = ChartVisualizer()
+    
+    # OTE зоны берутся из результата анализа, а не ищутся заново
+    structures = dict(analysis['smc'].structures, ote_zones=result.ote_zones)
+    if save_path and not os.fspath(save_path).endswith('.html'):
+        return visualizer.plot_with_matplotlib(analysis['ta'].df, structures,
+                                               result.symbol, result.timeframe, save_path, show)
+    return visualizer.plot_with_plotly(analysis['ta'].df, structures,
+                                       result.symbol, result.timeframe, save_path, show)